@@ -0,0 +1,293 @@
+import asyncio
+import os
+import time
+import uuid
+from collections import deque
+
+from fastapi import WebSocket
+
+from . import db_async, pubsub
+from .db import save_chat_messages, list_chat_messages
+from .metrics import gauge
+
+# ---------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------
+
+# Messages buffered per connection before the slow-consumer policy kicks in
+CHAT_SEND_QUEUE = int(os.getenv("CHAT_SEND_QUEUE", "256"))
+# A single send taking longer than this marks the client as dead
+CHAT_SEND_TIMEOUT = float(os.getenv("CHAT_SEND_TIMEOUT", "5"))
+# What to do when a client's queue is full: "disconnect" it, or "drop_oldest"
+# messages (it misses some chat lines but stays connected)
+CHAT_SLOW_CONSUMER_POLICY = os.getenv("CHAT_SLOW_CONSUMER_POLICY", "disconnect")
+# Recent messages per room kept in memory and replayed to a socket on connect
+# (keep well below CHAT_SEND_QUEUE, the replay is queued like any message)
+CHAT_HISTORY_SIZE = int(os.getenv("CHAT_HISTORY_SIZE", "50"))
+# Messages are written to chat_messages in batches: after this many ms, or
+# sooner once this many are waiting
+CHAT_FLUSH_MS = float(os.getenv("CHAT_FLUSH_MS", "200"))
+CHAT_FLUSH_MAX = int(os.getenv("CHAT_FLUSH_MAX", "500"))
+
+# Staff-only room; every admin socket is in it
+ADMIN_ROOM = "admins"
+# Broker channel carrying chat traffic between worker processes
+CHAT_CHANNEL = "chat"
+
+
+def user_room(user_id: str) -> str:
+    """Support room shared by one user's sockets and the admins."""
+    return f"user:{user_id}"
+
+
+def is_room(name: str) -> bool:
+    return name == ADMIN_ROOM or (name.startswith("user:") and len(name) > len("user:"))
+
+
+# ---------------------------------------------------------
+# CONNECTIONS
+# ---------------------------------------------------------
+
+class Connection:
+    """
+    One WebSocket with its own bounded outbound queue, drained by a writer
+    task, so a slow client only ever delays itself.
+    """
+
+    def __init__(self, user_id: str, websocket: WebSocket, on_close, is_admin: bool = False):
+        self.user_id = user_id
+        self.websocket = websocket
+        self.is_admin = is_admin
+        self.rooms = set()
+        self.queue = asyncio.Queue(maxsize=CHAT_SEND_QUEUE)
+        self.dropped = 0
+        self.closed = False
+        self._on_close = on_close
+        self._writer = asyncio.get_running_loop().create_task(self._write_loop())
+
+    def offer(self, message: str) -> bool:
+        """Queue a message without waiting. Returns False if it was not queued."""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        if CHAT_SLOW_CONSUMER_POLICY == "drop_oldest":
+            self.queue.get_nowait()
+            self.queue.put_nowait(message)
+            self.dropped += 1
+            return True
+
+        print(f"[chat] {self.user_id[:8]} is not keeping up — disconnecting")
+        self.close()
+        return False
+
+    async def _write_loop(self):
+        try:
+            while True:
+                message = await self.queue.get()
+                await asyncio.wait_for(self.websocket.send_text(message), CHAT_SEND_TIMEOUT)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"[chat] Send to {self.user_id[:8]} failed: {e!r}")
+            self.close()
+
+    def close(self):
+        """Stop the writer, drop the socket from the manager and close it."""
+        if self.closed:
+            return
+        self.closed = True
+        self._writer.cancel()
+        self._on_close(self)
+        asyncio.get_running_loop().create_task(self._close_socket())
+
+    async def _close_socket(self):
+        try:
+            await asyncio.wait_for(self.websocket.close(), CHAT_SEND_TIMEOUT)
+        except Exception:
+            pass
+
+
+class Room:
+    """Sockets subscribed to a room plus a ring buffer of its latest messages."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.members = set()
+        self.history = deque(maxlen=CHAT_HISTORY_SIZE)
+        self.loaded = False
+
+
+# ---------------------------------------------------------
+# MANAGER
+# ---------------------------------------------------------
+
+class ConnectionManager:
+    """
+    Routes chat messages to rooms. A user may have several sockets (tabs);
+    each is in its user's support room, admin sockets are in ADMIN_ROOM and
+    also receive every support room. Fan-out per message is therefore the
+    room's sockets plus the online admins, not everyone connected.
+
+    Messages go through a pub/sub broker, so sockets held by other worker
+    processes receive them too; each worker delivers to its own sockets.
+    """
+
+    def __init__(self, broker=None):
+        self.broker = broker or pubsub.broker
+        self._subscription = None
+        # user_id -> that user's open connections
+        self.active_connections: dict[str, set[Connection]] = {}
+        # Only rooms with members (or a history load in progress) stay in memory
+        self.rooms: dict[str, Room] = {}
+        self._pending = []
+        self._flush_task = None
+
+    async def connect(self, user_id: str, websocket: WebSocket, is_admin: bool = False, rooms=()) -> Connection:
+        """
+        Accept the socket, subscribe it to its home room (plus `rooms`, for
+        admins) and queue each room's recent history to it.
+        """
+        await websocket.accept()
+        self._subscribe()
+        conn = Connection(user_id, websocket, self._forget, is_admin)
+        self.active_connections.setdefault(user_id, set()).add(conn)
+
+        home = ADMIN_ROOM if is_admin else user_room(user_id)
+        for name in (home, *(r for r in rooms if is_admin and is_room(r) and r != home)):
+            room = await self._join(conn, name)
+            for message in room.history:
+                conn.offer(message["body"])
+        return conn
+
+    def _subscribe(self):
+        # Deliveries run on the loop that owns the sockets; follow it if it changes
+        loop = asyncio.get_running_loop()
+        if self._subscription is not None and self._subscription[0] is loop:
+            return
+        if self._subscription is not None:
+            self.broker.unsubscribe(CHAT_CHANNEL, self._subscription)
+        self._subscription = self.broker.subscribe(CHAT_CHANNEL, self._on_message)
+
+    async def _join(self, conn: Connection, name: str) -> Room:
+        room = self.rooms.get(name)
+        if room is None:
+            room = self.rooms[name] = Room(name)
+        room.members.add(conn)
+        conn.rooms.add(name)
+        if not room.loaded:
+            room.loaded = True
+            await self._load(room)
+        return room
+
+    async def _load(self, room: Room):
+        """Fill a room's ring buffer from chat_messages (e.g. after a restart)."""
+        await self.flush()  # so messages sent while the room was evicted are found
+        try:
+            stored = await db_async.read(list_chat_messages, room.name, CHAT_HISTORY_SIZE)
+        except Exception as e:
+            print(f"[chat] Could not load history of {room.name}: {e}")
+            return
+        # Anything published while we were reading is already in the buffer
+        seen = {m["id"] for m in room.history}
+        newer = list(room.history)
+        room.history.clear()
+        room.history.extend(m for m in stored if m["id"] not in seen)
+        room.history.extend(newer)
+
+    def _forget(self, conn: Connection):
+        sockets = self.active_connections.get(conn.user_id)
+        if sockets is not None:
+            sockets.discard(conn)
+            if not sockets:
+                del self.active_connections[conn.user_id]
+        for name in conn.rooms:
+            room = self.rooms.get(name)
+            if room is not None:
+                room.members.discard(conn)
+                if not room.members:
+                    del self.rooms[name]
+        conn.rooms.clear()
+
+    def disconnect(self, conn: Connection):
+        conn.close()
+
+    def is_online(self, user_id: str) -> bool:
+        return user_id in self.active_connections
+
+    def send_personal_message(self, message: str, user_id: str):
+        """Queue a message to every socket of one user, on any worker (not recorded)."""
+        self.broker.publish(CHAT_CHANNEL, {"user": user_id, "message": message})
+
+    def publish(self, room_name: str, message: str, sender_id: str = None, record: bool = True):
+        """
+        Send `message` to the room's sockets and to the admins on every worker,
+        never waiting on a socket. Recorded messages enter the room's replay
+        buffer and are persisted (once, by this worker) in the next batch.
+        """
+        entry = None
+        if record:
+            entry = {
+                "id": uuid.uuid4().hex,
+                "room": room_name,
+                "sender_id": sender_id,
+                "body": message,
+                "sent_ms": int(time.time() * 1000),
+            }
+            self._persist(entry)
+        self.broker.publish(CHAT_CHANNEL, {"room": room_name, "message": message, "entry": entry})
+
+    def _on_message(self, payload: dict):
+        """Broker callback: fan a message out to this worker's sockets."""
+        message = payload["message"]
+        if "user" in payload:
+            for conn in list(self.active_connections.get(payload["user"], ())):
+                conn.offer(message)
+            return
+
+        room_name = payload["room"]
+        room = self.rooms.get(room_name)
+        if room is not None and payload.get("entry"):
+            room.history.append(payload["entry"])
+
+        targets = set(room.members) if room is not None else set()
+        if room_name != ADMIN_ROOM and ADMIN_ROOM in self.rooms:
+            targets |= self.rooms[ADMIN_ROOM].members
+        for conn in targets:
+            conn.offer(message)
+
+    # -------- durable history --------
+
+    def _persist(self, entry: dict):
+        self._pending.append((entry["id"], entry["room"], entry["sender_id"], entry["body"], entry["sent_ms"]))
+        if len(self._pending) >= CHAT_FLUSH_MAX:
+            asyncio.get_running_loop().create_task(self.flush())
+        elif self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(CHAT_FLUSH_MS / 1000)
+        finally:
+            self._flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        """Write every pending message in one batch."""
+        rows, self._pending = self._pending, []
+        if not rows:
+            return
+        try:
+            await db_async.write(save_chat_messages, rows)
+        except Exception as e:
+            print(f"[chat] Could not persist {len(rows)} messages: {e}")
+
+
+manager = ConnectionManager()
+
+gauge("instadock_chat_connections", "Open chat sockets on this worker.",
+      lambda: sum(len(sockets) for sockets in manager.active_connections.values()))
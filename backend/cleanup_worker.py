@@ -1,60 +1,130 @@
+import json
+import os
 import time
-import datetime
-import sqlite3
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
-from .db import DB_PATH, get_instance, delete_instance
-from .docker_manager import stop as stop_container
+from .db import list_scheduled_instances, list_events_after, event_seq_bounds
+from .docker_manager import reclaim, reclaim_deadline
+from .ttl_scheduler import scheduler as ttl_scheduler
+from . import events
+from .metrics import gauge
 
-CHECK_INTERVAL = 30   # seconds between cleanup cycles
+# The worker sleeps until the next deadline (TTL stop, or removal after the grace
+# period). Deadlines set by the other API workers arrive through the event log;
+# reloading the whole heap from the DB this often is only a safety net.
+RESYNC_INTERVAL = int(os.getenv("TTL_RESYNC_INTERVAL", "300"))
+# While elected, how often the loop checks it is still the leader
+LEADER_CHECK_INTERVAL = 2
+# How often the leader reads new instance events (spawns, starts, stops and
+# removals done by any worker) into its deadline heap
+TTL_EVENT_POLL_SECONDS = float(os.getenv("TTL_EVENT_POLL_SECONDS", "1"))
+EVENT_BATCH = 1000
+CLEANUP_CONCURRENCY = int(os.getenv("CLEANUP_CONCURRENCY", "8"))   # parallel teardowns
+
+_teardown_pool = ThreadPoolExecutor(max_workers=CLEANUP_CONCURRENCY, thread_name_prefix="cleanup")
+
+gauge("instadock_teardown_queue", "Reclamations waiting for a cleanup thread.",
+      lambda: _teardown_pool._work_queue.qsize())
 
 
 # ---------------------------------------------------------
 # CLEANUP EXPIRED INSTANCES
 # ---------------------------------------------------------
 
-def cleanup_expired_instances():
+def _expire(cid: str):
+    try:
+        action = reclaim(cid)
+        print(f"[cleanup] Deadline reached for {cid} → {action}")
+    except Exception as e:
+        # One bad container must not hold up the rest of the batch;
+        # the next resync schedules it again.
+        print(f"[cleanup] Could not reclaim {cid}: {e}")
+
+
+def cleanup_expired_instances(cids):
     """
-    Remove containers whose TTL has expired.
+    Move the given due instances one reclamation tier on, in parallel.
     """
-    now = datetime.datetime.utcnow()
+    list(_teardown_pool.map(_expire, cids))
 
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        rows = conn.execute("SELECT cid, expires_at FROM instances").fetchall()
 
-    for row in rows:
-        cid = row["cid"]
-        exp = row["expires_at"]
+def resync_deadlines():
+    """
+    Rebuild the deadline heap from the running and stopped instances in the DB.
+    """
+    ttl_scheduler.replace_all(
+        {"cid": row["cid"], "expires_at": reclaim_deadline(row)}
+        for row in list_scheduled_instances()
+    )
+    print(f"[cleanup] {len(ttl_scheduler)} TTL deadlines scheduled.")
 
-        try:
-            exp_dt = datetime.datetime.fromisoformat(exp)
-        except Exception:
-            print(f"[cleanup] Invalid timestamp for {cid} — deleting entry.")
-            stop_container(cid)
-            continue
 
-        if exp_dt <= now:
-            print(f"[cleanup] TTL expired → removing instance {cid}")
-            stop_container(cid)
+def follow_instance_events(after_seq: int):
+    """
+    Apply the instance events logged after `after_seq` to the deadline heap
+    and return the new cursor, or None if the log no longer reaches back that
+    far (the caller then resyncs from the DB).
+    """
+    oldest, newest = event_seq_bounds()
+    if after_seq < oldest - 1:
+        return None
+    while after_seq < newest:
+        rows = list_events_after(after_seq, None, EVENT_BATCH)
+        for row in rows:
+            after_seq = row["seq"]
+            if row["topic"] != "instance":
+                continue
+            data = json.loads(row["payload"])
+            if data["action"] == "removed":
+                ttl_scheduler.cancel(data["cid"])
+            else:
+                ttl_scheduler.schedule(data["cid"], reclaim_deadline(data))
+        if len(rows) < EVENT_BATCH:
+            break
+    return after_seq
 
 
 # ---------------------------------------------------------
 # BACKGROUND WORKER LOOP
 # ---------------------------------------------------------
 
-def start_cleanup_worker():
+def start_cleanup_worker(leading=None):
     """
     Background loop.  
     Safe to run as a thread.  
     Will never crash the main app.
+    Under leader election (see leader.py) it runs until `leading` is cleared.
     """
     print("[cleanup] Worker started.")
+    last_sync = None
+    cursor = None
+
+    try:
+        while leading is None or leading.is_set():
+            try:
+                if cursor is None or time.monotonic() - last_sync >= RESYNC_INTERVAL:
+                    # Events logged from here on are replayed on top of the snapshot
+                    snapshot_seq = event_seq_bounds()[1]
+                    resync_deadlines()
+                    events.prune()
+                    cursor, last_sync = snapshot_seq, time.monotonic()
+
+                cursor = follow_instance_events(cursor)
+                if cursor is None:
+                    continue  # fell behind the event log: resync
 
-    while True:
-        try:
-            cleanup_expired_instances()
-        except Exception as e:
-            print(f"[cleanup] Error: {e}")
+                # Sleeps until the next deadline; spawns in this process wake
+                # it early, other workers' are picked up by the next event poll
+                max_wait = min(RESYNC_INTERVAL - (time.monotonic() - last_sync), TTL_EVENT_POLL_SECONDS)
+                if leading is not None:
+                    max_wait = min(max_wait, LEADER_CHECK_INTERVAL)
+                due = ttl_scheduler.wait_due(max_wait=max_wait)
+                if due and (leading is None or leading.is_set()):
+                    cleanup_expired_instances(due)
+            except Exception as e:
+                print(f"[cleanup] Error: {e}")
+                time.sleep(1)
+    finally:
+        ttl_scheduler.deactivate()  # the next leader owns the deadlines now
 
-        time.sleep(CHECK_INTERVAL)
+    print("[cleanup] Worker stopped (no longer leader).")
@@ -0,0 +1,46 @@
+import hashlib
+from urllib.parse import urlencode
+
+from fastapi import Request, Response
+
+from .db import data_version
+
+
+# ---------------------------------------------------------
+# CONDITIONAL GET (ETag / If-None-Match)
+# ---------------------------------------------------------
+
+def etag_for(table: str, user_id=None, query: str = "") -> str:
+    """
+    Weak ETag of a list view: changes whenever a write touches its scope, and
+    differs between users' scopes and between views of one (page, status
+    filter, projection) via `query`.
+    """
+    view = hashlib.sha1(f"{user_id or ''}?{query}".encode()).hexdigest()[:12]
+    return f'W/"{table}-{data_version(table, user_id)}-{view}"'
+
+
+def normalized_query(request: Request) -> str:
+    """The query string with its parameters sorted, so ?a=1&b=2 and ?b=2&a=1 share a tag."""
+    return urlencode(sorted(request.query_params.multi_items()))
+
+
+def not_modified(request: Request, response: Response, table: str, user_id=None):
+    """
+    Compare the client's If-None-Match with the current version of the scope.
+    Returns a ready 304 response if it is still current (the caller should
+    return it without querying); otherwise sets ETag on `response` and
+    returns None.
+    """
+    etag = etag_for(table, user_id, normalized_query(request))
+    # The list depends on who asks: shared caches must key it by the token too
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Authorization"}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = {t.strip() for t in if_none_match.split(",")}
+        if etag in tags or "*" in tags:
+            return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,121 @@
+import asyncio
+import contextvars
+import functools
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from . import db
+from .metrics import gauge
+from .profiler import profile_call
+
+# ---------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------
+
+# Reads run on a small pool (each thread keeps its own pooled WAL connection,
+# so they proceed in parallel); writes go through one writer thread.
+DB_READ_THREADS = int(os.getenv("DB_READ_THREADS", "4"))
+# The writer groups writes that arrive within this window into one transaction
+DB_WRITE_BATCH_WINDOW_MS = float(os.getenv("DB_WRITE_BATCH_WINDOW_MS", "2"))
+DB_WRITE_BATCH_MAX = int(os.getenv("DB_WRITE_BATCH_MAX", "64"))
+
+_readers = ThreadPoolExecutor(max_workers=DB_READ_THREADS, thread_name_prefix="db-read")
+_writes = queue.SimpleQueue()
+_writer = None
+_writer_lock = threading.Lock()
+
+
+# ---------------------------------------------------------
+# WRITER THREAD
+# ---------------------------------------------------------
+
+def _run(job):
+    fn, args, kwargs, future = job
+    try:
+        future.set_result(fn(*args, **kwargs))
+    except Exception as e:
+        future.set_exception(e)
+
+
+def _run_batch(jobs):
+    """Commit a group of writes together; fall back to one by one if any fails."""
+    if len(jobs) == 1:
+        _run(jobs[0])
+        return
+
+    try:
+        with db.batch():
+            results = [fn(*args, **kwargs) for fn, args, kwargs, _ in jobs]
+    except Exception:
+        # The batch rolled back as a whole; replay each write on its own so a
+        # single bad write only fails its own caller.
+        for job in jobs:
+            _run(job)
+        return
+
+    for (_, _, _, future), result in zip(jobs, results):
+        future.set_result(result)
+
+
+def _writer_loop():
+    window = DB_WRITE_BATCH_WINDOW_MS / 1000
+    while True:
+        jobs = [_writes.get()]
+        flush_at = time.monotonic() + window
+        while len(jobs) < DB_WRITE_BATCH_MAX:
+            remaining = flush_at - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                jobs.append(_writes.get(timeout=remaining))
+            except queue.Empty:
+                break
+        try:
+            _run_batch(jobs)
+        except Exception as e:
+            print(f"[db_async] Writer error: {e}")
+
+
+def _ensure_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_writer_loop, name="db-write", daemon=True)
+                _writer.start()
+
+
+# ---------------------------------------------------------
+# PUBLIC API
+# ---------------------------------------------------------
+
+async def read(fn, *args, **kwargs):
+    """Await a read helper of backend.db (e.g. get_instance) off the event loop."""
+    loop = asyncio.get_running_loop()
+    # The caller's context travels along, so the query shows up in its trace
+    # (and in its profile, for a request sent with X-Profile)
+    call = functools.partial(contextvars.copy_context().run, profile_call, fn, *args, **kwargs)
+    return await loop.run_in_executor(_readers, call)
+
+
+async def write(fn, *args, **kwargs):
+    """
+    Await a write helper of backend.db (e.g. update_instance_status). Small
+    writes queued close together are committed as one transaction.
+    """
+    _ensure_writer()
+    future = Future()
+    _writes.put((functools.partial(contextvars.copy_context().run, profile_call, fn), args, kwargs, future))
+    return await asyncio.wrap_future(future)
+
+
+# ---------------------------------------------------------
+# METRICS
+# ---------------------------------------------------------
+
+gauge("instadock_db_async_queue", "Jobs waiting for a db_async thread, by pool.",
+      lambda: {("write",): _writes.qsize(), ("read",): _readers._work_queue.qsize()}, ("pool",))
+gauge("instadock_db_async_read_threads", "Size of the db_async read pool.", lambda: DB_READ_THREADS)
@@ -0,0 +1,273 @@
+import os
+import queue
+import sqlite3
+import threading
+from urllib.parse import urlparse
+
+# Optional: psycopg (v3) is only needed when INSTADOCK_DB_URL points at Postgres.
+try:
+    import psycopg
+except ImportError:  # SQLite-only deployments
+    psycopg = None
+
+# How long a writer waits for the lock before raising "database is locked"
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+# Prepared statements kept per connection (sqlite3's statement cache)
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", "256"))
+# Networked backends: connections kept open per process, and how long a caller
+# waits for one to become free before giving up
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+
+
+# ---------------------------------------------------------
+# SQLITE
+# ---------------------------------------------------------
+
+class SQLiteEngine:
+    """
+    One file-backed database. Each thread keeps a persistent WAL connection
+    (so sqlite3's prepared-statement cache stays warm); acquire/release just
+    hand out the calling thread's connection.
+    """
+
+    dialect = "sqlite"
+    # DDL fragments used by migrations.py
+    ddl = {"timestamp": "TIMESTAMP", "now": "CURRENT_TIMESTAMP", "serial": "INTEGER PRIMARY KEY AUTOINCREMENT"}
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._open = 0  # per-thread connections currently open, for stats()
+        self._open_lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+            cached_statements=DB_STATEMENT_CACHE,
+            isolation_level=None,  # transactions are begun explicitly by db.py
+        )
+        conn.row_factory = sqlite3.Row
+        # WAL lets readers proceed while a writer holds the lock; NORMAL sync is
+        # durable across application crashes and much cheaper than FULL in WAL mode.
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+        return conn
+
+    def acquire(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._local.conn = self._connect()
+            self._local.pid = os.getpid()
+            with self._open_lock:
+                self._open += 1
+        return conn
+
+    def release(self, conn):
+        pass  # stays open for the thread's next call
+
+    def close_thread(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+            with self._open_lock:
+                self._open -= 1
+
+    def stats(self):
+        """Connection counts for the /metrics gauges."""
+        return {"open": self._open}
+
+    def begin(self, conn, immediate=False, lock=()):
+        # IMMEDIATE takes the database write lock up front; SQLite has no
+        # finer-grained table locks, so `lock` is implied by it.
+        conn.execute("BEGIN IMMEDIATE" if immediate or lock else "BEGIN")
+
+    def lock(self, conn, tables):
+        pass  # already holding the database write lock
+
+    def lock_migrations(self, conn):
+        pass  # BEGIN IMMEDIATE serialises migrating processes
+
+    def columns(self, conn, table):
+        return {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+# ---------------------------------------------------------
+# POSTGRES
+# ---------------------------------------------------------
+
+class _Row(tuple):
+    """Row addressable by index and column name, like sqlite3.Row."""
+
+    __slots__ = ()
+    _index = {}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            key = self._index[key]
+        return tuple.__getitem__(self, key)
+
+    def keys(self):
+        return list(self._index)
+
+
+_row_classes = {}
+
+
+def _row_factory(cursor):
+    names = tuple(c.name for c in cursor.description or ())
+    row_class = _row_classes.get(names)
+    if row_class is None:
+        row_class = _row_classes[names] = type(
+            "Row", (_Row,), {"__slots__": (), "_index": {n: i for i, n in enumerate(names)}}
+        )
+    return row_class
+
+
+class _PGConnection:
+    """
+    Adapts a psycopg connection to the subset of the sqlite3 API db.py uses:
+    qmark placeholders, execute()/executemany() returning a cursor, rows
+    addressable by name.
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    @staticmethod
+    def _sql(sql):
+        # db.py writes qmark SQL without literal '?' or '%'
+        return sql.replace("%", "%%").replace("?", "%s")
+
+    def execute(self, sql, params=None):
+        cur = self.raw.cursor(row_factory=_row_factory)
+        if params is None:
+            cur.execute(sql)
+        else:
+            cur.execute(self._sql(sql), params)
+        return cur
+
+    def executemany(self, sql, seq):
+        cur = self.raw.cursor(row_factory=_row_factory)
+        cur.executemany(self._sql(sql), seq)
+        return cur
+
+    def close(self):
+        self.raw.close()
+
+
+class PostgresEngine:
+    """
+    Postgres (or a wire-compatible server) shared by several backend replicas.
+    Connections come from a bounded per-process pool and are checked out for
+    the duration of one db.py block.
+    """
+
+    dialect = "postgres"
+    # created_at stays a 'YYYY-MM-DD HH:MM:SS' UTC string, exactly like SQLite's
+    # CURRENT_TIMESTAMP, so API payloads and pagination cursors do not change.
+    ddl = {
+        "timestamp": "TEXT",
+        "now": "(to_char(now() AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS'))",
+        "serial": "BIGSERIAL PRIMARY KEY",
+    }
+
+    # pg_advisory_xact_lock key held while migrating
+    MIGRATION_LOCK_KEY = 0x1D0C
+
+    def __init__(self, url, pool_size=DB_POOL_SIZE, pool_timeout=DB_POOL_TIMEOUT):
+        if psycopg is None:
+            raise RuntimeError("INSTADOCK_DB_URL points at Postgres but psycopg is not installed "
+                               "(pip install -r backend/requirements-optional.txt)")
+        self.url = url
+        self.pool_size = pool_size
+        self.pool_timeout = pool_timeout
+        self._reset_pool()
+
+    def _reset_pool(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        # One token per connection that may exist; taking a token allows opening one
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+
+    def acquire(self):
+        if self._pid != os.getpid():
+            self._reset_pool()  # never share sockets with the parent process
+        if not self._slots.acquire(timeout=self.pool_timeout):
+            raise RuntimeError(f"No database connection free after {self.pool_timeout}s (pool size {self.pool_size})")
+        try:
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    return _PGConnection(psycopg.connect(self.url, autocommit=True))
+                if not conn.raw.closed:
+                    return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn):
+        try:
+            if not conn.raw.closed and conn.raw.info.transaction_status != psycopg.pq.TransactionStatus.IDLE:
+                conn.raw.execute("ROLLBACK")  # block left a transaction open
+            if not conn.raw.closed:
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        """Connection counts for the /metrics gauges."""
+        # Every slot not available is a connection checked out right now
+        in_use = self.pool_size - self._slots._value
+        return {"size": self.pool_size, "in_use": in_use, "idle": self._idle.qsize()}
+
+    def close_thread(self):
+        # Connections are not tied to threads here; close the idle ones
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def begin(self, conn, immediate=False, lock=()):
+        conn.execute("BEGIN")
+        self.lock(conn, lock)
+
+    def lock(self, conn, tables):
+        # Serialises read-check-write sections (e.g. quota reservations) across
+        # replicas while leaving plain reads of these tables unblocked.
+        for table in tables:
+            conn.execute(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE")
+
+    def lock_migrations(self, conn):
+        conn.execute(f"SELECT pg_advisory_xact_lock({self.MIGRATION_LOCK_KEY})")
+
+    def columns(self, conn, table):
+        rows = conn.execute("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = ?
+        """, (table,))
+        return {row["column_name"] for row in rows}
+
+
+# ---------------------------------------------------------
+# FACTORY
+# ---------------------------------------------------------
+
+def create_engine(url: str = None, sqlite_path=None):
+    """
+    Engine for a database URL: postgresql://... / postgres://..., or
+    sqlite:///path. Without a URL, the SQLite file at sqlite_path is used.
+    """
+    if not url:
+        return SQLiteEngine(sqlite_path)
+    scheme = urlparse(url).scheme
+    if scheme in ("postgres", "postgresql"):
+        return PostgresEngine(url)
+    if scheme == "sqlite":
+        return SQLiteEngine(url[len("sqlite:///"):])
+    raise RuntimeError(f"Unsupported database URL scheme: {scheme}")
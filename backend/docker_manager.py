@@ -6,9 +6,15 @@ import subprocess
 import psutil
 import uuid # Needed for stable container name/subdomain
 import time # IMPORT for delay
+import threading
+from contextlib import contextmanager
 
 # FR-4.0: Import DB update function
-from .db import save_instance, delete_instance, get_instance, update_instance_status
+from .db import save_instance, delete_instance, get_instance, update_instance_status, is_port_leased
+from .ttl_scheduler import scheduler as ttl_scheduler
+from .events import emit as emit_event
+from .metrics import histogram, gauge
+from . import tracing
 
 # ---------------------- CONFIG ----------------------
 
@@ -19,8 +25,90 @@ GHCR_USER = os.getenv("GHCR_USERNAME", "k0w4lzk1")
 GHCR_PULL_TOKEN = os.getenv("GHCR_PULL_TOKEN","") 
 GHCR_REGISTRY = f"ghcr.io/{GHCR_USER}"
 
-# Ensure we can connect to the Docker daemon (you need Docker running on your host)
-client = docker.from_env()
+# TTL reclamation: instances are stopped when their TTL expires and removed
+# (container + writable layer, DB row / port lease, buffers) after this grace period.
+REMOVE_GRACE_SECONDS = int(os.getenv("REMOVE_GRACE_SECONDS", "3600"))
+
+# Host ports handed out to instances; a port stays leased while its DB row exists.
+PORT_RANGE = (20000, 40000)
+
+# Pause before pulling, giving CI time to push a freshly built image
+# (0 for local stand-ins such as bench/e2e_bench.py)
+SPAWN_IMAGE_WAIT_SECONDS = float(os.getenv("SPAWN_IMAGE_WAIT_SECONDS", "15"))
+
+# Connecting to the Docker daemon (you need Docker running on your host) is
+# retried this many times, waiting DOCKER_CONNECT_BACKOFF seconds and then
+# twice as long each time, before the operation fails
+DOCKER_CONNECT_ATTEMPTS = int(os.getenv("DOCKER_CONNECT_ATTEMPTS", "3"))
+DOCKER_CONNECT_BACKOFF = float(os.getenv("DOCKER_CONNECT_BACKOFF", "0.5"))
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    The Docker client, connected on first use rather than at import, so the
+    API starts (and serves everything that does not touch containers) while
+    the daemon is briefly unavailable. Raises RuntimeError if it stays down.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _connect()
+    return _client
+
+
+def _connect():
+    delay = DOCKER_CONNECT_BACKOFF
+    for attempt in range(1, DOCKER_CONNECT_ATTEMPTS + 1):
+        try:
+            return docker.from_env()
+        except docker.errors.DockerException as e:
+            print(f"[docker_manager] Docker not reachable (attempt {attempt}/{DOCKER_CONNECT_ATTEMPTS}): {e}")
+            if attempt == DOCKER_CONNECT_ATTEMPTS:
+                raise RuntimeError(f"Docker daemon unreachable: {e}")
+            time.sleep(delay)
+            delay *= 2
+
+
+def connect_in_background():
+    """Connect now, off the caller's thread, so the first spawn does not wait for it."""
+    def connect():
+        try:
+            get_client()
+        except RuntimeError as e:
+            print(f"[docker_manager] {e}; will retry on first use")
+    threading.Thread(target=connect, daemon=True, name="docker-connect").start()
+
+
+SPAWN_PHASE_SECONDS = histogram(
+    "instadock_spawn_phase_seconds",
+    "Duration of each spawn step: ci_wait, docker_pull, allocate_port, containers_run, save_instance.",
+    ("phase",),
+)
+
+
+@contextmanager
+def _phase(name: str):
+    """One spawn step: timed in SPAWN_PHASE_SECONDS and a span of the request's trace."""
+    with tracing.span(name), SPAWN_PHASE_SECONDS.time(name):
+        yield
+
+
+def _count_paused():
+    # One Docker API call per scrape; a daemon hiccup (or no connection yet)
+    # just leaves the gauge out instead of stalling /metrics on reconnects
+    if _client is None:
+        return None
+    try:
+        return len(_client.containers.list(filters={"status": "paused", "name": "instadock-"}))
+    except Exception:
+        return None
+
+
+gauge("instadock_containers_paused", "Paused instadock containers on this Docker host.", _count_paused)
 
 # ---------------------- HELPERS ----------------------
 
@@ -65,6 +153,92 @@ def docker_pull(image: str):
         raise RuntimeError(f"Error during Docker pull process: {e}")
 
 
+# Callbacks run with the cid once an instance is gone for good, so modules
+# holding per-instance buffers (logs, metrics, ...) can free them.
+_release_hooks = []
+
+
+def on_instance_released(fn):
+    """Register fn(cid) to be called when an instance is finally reclaimed."""
+    _release_hooks.append(fn)
+    return fn
+
+
+def _publish_instance(instance: dict, action: str, reason: str = "request"):
+    """Push an instance state change to its owner's and the admins' event feeds."""
+    if not instance:
+        return
+    emit_event(
+        "instance",
+        instance["user_id"],
+        cid=instance["cid"],
+        status="removed" if action == "removed" else instance["status"],
+        action=action,
+        reason=reason,
+        expires_at=instance["expires_at"],
+        subdomain=instance["subdomain"],
+        submission_id=instance["submission_id"],
+    )
+
+
+def _forget_instance(cid: str, reason: str = "request"):
+    """
+    Drop the DB row (releasing its port lease), the pending TTL deadline and
+    any per-instance buffers. Safe to call for an instance that is already gone.
+    """
+    instance = get_instance(cid)
+    delete_instance(cid)
+    ttl_scheduler.cancel(cid)
+    for hook in _release_hooks:
+        try:
+            hook(cid)
+        except Exception as e:
+            print(f"[docker_manager] Release hook failed for {cid}: {e}")
+    _publish_instance(instance, "removed", reason)
+
+
+def forget_vanished(cid: str):
+    """
+    A caller found the container gone from Docker: release the DB row, port
+    lease, TTL deadline and buffers, and tell the feeds, as stop/start do.
+    """
+    print(f"[docker_manager] {cid} vanished from Docker")
+    _forget_instance(cid, "vanished")
+
+
+def reclaim_deadline(instance: dict):
+    """
+    When the instance needs attention next: its TTL while running,
+    TTL + grace period (removal) once it is stopped.
+    """
+    try:
+        expires = datetime.datetime.fromisoformat(instance["expires_at"])
+    except (TypeError, ValueError):
+        return datetime.datetime.min  # unreadable TTL: reclaim right away
+    if instance["status"] == "running":
+        return expires
+    return expires + datetime.timedelta(seconds=REMOVE_GRACE_SECONDS)
+
+
+def _schedule_next(cid: str):
+    """(Re-)arm the next reclamation deadline of an instance from its DB state and return it."""
+    instance = get_instance(cid)
+    if instance:
+        ttl_scheduler.schedule(cid, reclaim_deadline(instance))
+    return instance
+
+
+def allocate_port():
+    """
+    Pick a random host port that no existing instance holds a lease on.
+    """
+    for _ in range(50):
+        port = random.randint(*PORT_RANGE)
+        if not is_port_leased(port):
+            return port
+    raise RuntimeError("No free host port available for a new instance")
+
+
 def generate_subdomain(cid: str):
     """
     Generate subdomain like: <cid>.localhost
@@ -74,23 +248,29 @@ def generate_subdomain(cid: str):
 
 # ---------------------- SPAWN CONTAINER ----------------------
 
-def spawn(image: str, user_id: str, submission_id: str = None, ttl_seconds: int = 600):
+def spawn(image: str, user_id: str, submission_id: str = None, ttl_seconds: int = 600,
+          reservation_id: str = None):
     """
     Spawns a Docker container using a direct host port map for local testing.
+    A quota reservation (see db.reserve_instance_slot) is consumed when the
+    instance row is saved.
     """
     
     # FIX: Add a short delay to allow the CI/CD pipeline (GitHub Actions) 
     # to finish building and pushing the image to GHCR.
-    print("[docker_manager] Waiting 15 seconds for CI/CD image push to complete...")
-    time.sleep(15) 
+    print(f"[docker_manager] Waiting {SPAWN_IMAGE_WAIT_SECONDS:g} seconds for CI/CD image push to complete...")
+    with _phase("ci_wait"):
+        time.sleep(SPAWN_IMAGE_WAIT_SECONDS) 
     print("[docker_manager] Delay finished. Attempting image pull.")
 
     # 1. Pull image
-    docker_pull(image)
+    with _phase("docker_pull"):
+        docker_pull(image)
 
     # 2. Allocate fallback port (Traefik ignored)
-    # The application port is 8080, which we map to a random host port.
-    host_port = random.randint(20000, 40000)
+    # The application port is 8080, which we map to a random, unleased host port.
+    with _phase("allocate_port"):
+        host_port = allocate_port()
 
     # 3. Generate a stable container name/subdomain from the start.
     container_uuid = str(uuid.uuid4())
@@ -106,17 +286,18 @@ def spawn(image: str, user_id: str, submission_id: str = None, ttl_seconds: int
 
     # 5. Run container
     # CRITICAL FIX: Map container port 8080 (the actual listening port) to the random host port.
-    container = client.containers.run(
-        image,
-        detach=True,
-        ports={"8080/tcp": host_port}, # Mapped 8080 to host port
-        labels=labels,
-        name=container_name, 
-        cap_drop=["ALL"],
-        mem_limit="512m",
-        nano_cpus=1_000_000_000,  # 1 CPU
-        network="bridge", # Default network since instadock-proxy won't exist
-    )
+    with _phase("containers_run"):
+        container = get_client().containers.run(
+            image,
+            detach=True,
+            ports={"8080/tcp": host_port}, # Mapped 8080 to host port
+            labels=labels,
+            name=container_name, 
+            cap_drop=["ALL"],
+            mem_limit="512m",
+            nano_cpus=1_000_000_000,  # 1 CPU
+            network="bridge", # Default network since instadock-proxy won't exist
+        )
 
     # 6. Get real CID (short ID)
     cid = container.id[:12]
@@ -131,15 +312,19 @@ def spawn(image: str, user_id: str, submission_id: str = None, ttl_seconds: int
     url_to_display = f"http://{subdomain_to_save}" 
 
     # 9. Save instance in DB 
-    save_instance(
-        cid=cid,
-        user_id=user_id,
-        submission_id=submission_id,
-        image=image,
-        subdomain=subdomain_to_save, 
-        port=host_port,
-        expires_at=expires,
-    )
+    with _phase("save_instance"):
+        save_instance(
+            cid=cid,
+            user_id=user_id,
+            submission_id=submission_id,
+            image=image,
+            subdomain=subdomain_to_save, 
+            port=host_port,
+            expires_at=expires,
+            reservation_id=reservation_id,
+        )
+    ttl_scheduler.schedule(cid, expires)
+    _publish_instance(get_instance(cid), "spawned")
 
     print(f"[docker_manager] Spawned → {cid}")
     print(f"[docker_manager] URL → {url_to_display}")
@@ -150,33 +335,39 @@ def spawn(image: str, user_id: str, submission_id: str = None, ttl_seconds: int
 
 # ---------------------- STOP / CLEANUP / START / RESTART ----------------------
 
-def remove(cid: str):
+def remove(cid: str, reason: str = "request"):
     """
     Stop and permanently remove a container and its DB entry.
     Used by the cleanup worker.
     """
     try:
-        container = client.containers.get(cid)
-        container.remove(force=True)
+        container = get_client().containers.get(cid)
+        # v=True also drops anonymous volumes along with the writable layer
+        container.remove(force=True, v=True)
         print(f"[docker_manager] Permanently removed {cid}")
-    except Exception:
-        print(f"[docker_manager] Could not remove {cid} (maybe already gone)")
+    except docker.errors.NotFound:
+        print(f"[docker_manager] {cid} already gone from Docker")
+    except Exception as e:
+        # Keep the DB row so the removal is retried instead of orphaning the container
+        print(f"[docker_manager] Could not remove {cid}: {e}")
+        raise RuntimeError(f"Error removing container: {e}")
 
-    delete_instance(cid)
+    _forget_instance(cid, reason)
 
-def stop(cid: str):
+def stop(cid: str, reason: str = "request"):
     """
     Stop a container instance and update its DB status.
     """
     try:
-        container = client.containers.get(cid)
+        container = get_client().containers.get(cid)
         container.stop()
         print(f"[docker_manager] Stopped {cid}")
         update_instance_status(cid, 'stopped')
+        _publish_instance(_schedule_next(cid), "stopped", reason)
         return True
     except docker.errors.NotFound:
         # If the container is already removed from Docker, update DB and proceed.
-        delete_instance(cid)
+        _forget_instance(cid, "vanished")
         raise RuntimeError(f"Container {cid} not found on host. Removed DB entry.")
     except Exception as e:
         print(f"[docker_manager] Error stopping {cid}: {e}")
@@ -187,14 +378,15 @@ def start(cid: str):
     Start a container instance that was previously stopped.
     """
     try:
-        container = client.containers.get(cid)
+        container = get_client().containers.get(cid)
         container.start()
         print(f"[docker_manager] Started {cid}")
         update_instance_status(cid, 'running')
+        _publish_instance(_schedule_next(cid), "started")
         return True
     except docker.errors.NotFound:
         # If the container is gone, delete the DB record.
-        delete_instance(cid)
+        _forget_instance(cid, "vanished")
         raise RuntimeError(f"Container {cid} not found on host. Removed DB entry.")
     except Exception as e:
         print(f"[docker_manager] Error starting {cid}: {e}")
@@ -205,19 +397,57 @@ def restart(cid: str):
     Restart a container instance.
     """
     try:
-        container = client.containers.get(cid)
+        container = get_client().containers.get(cid)
         container.restart()
         print(f"[docker_manager] Restarted {cid}")
         update_instance_status(cid, 'running')
+        _publish_instance(_schedule_next(cid), "restarted")
         return True
     except docker.errors.NotFound:
-        delete_instance(cid)
+        _forget_instance(cid, "vanished")
         raise RuntimeError(f"Container {cid} not found on host. Removed DB entry.")
     except Exception as e:
         print(f"[docker_manager] Error restarting {cid}: {e}")
         raise RuntimeError(f"Error restarting container: {e}")
 
 
+# ---------------------- TTL RECLAMATION ----------------------
+
+def reclaim(cid: str):
+    """
+    Advance an instance one tier through TTL reclamation and re-arm its next
+    deadline. Idempotent, so it is safe to re-run after a backend restart:
+
+    - running and past its TTL           -> stopped
+    - past TTL + REMOVE_GRACE_SECONDS    -> removed, resources released
+    - otherwise (TTL moved, restarted)   -> just rescheduled
+
+    Returns the action taken.
+    """
+    instance = get_instance(cid)
+    if not instance:
+        _forget_instance(cid)
+        return "gone"
+
+    now = datetime.datetime.utcnow()
+    if reclaim_deadline(dict(instance, status="stopped")) <= now:
+        remove(cid, reason="ttl")
+        return "removed"
+
+    if instance["status"] == "running" and reclaim_deadline(instance) <= now:
+        try:
+            stop(cid, reason="ttl")
+        except RuntimeError as e:
+            # stop() already dropped the row if the container vanished
+            print(f"[docker_manager] TTL stop of {cid} failed: {e}")
+            _schedule_next(cid)
+            return "failed"
+        return "stopped"
+
+    ttl_scheduler.schedule(cid, reclaim_deadline(instance))
+    return "pending"
+
+
 # ---------------------- LIST / STATS ----------------------
 
 def list_containers():
@@ -225,8 +455,8 @@ def list_containers():
     List all running and stopped containers with stats.
     """
     out = []
-    # Use client.containers.list(all=True) to also get stopped containers for accurate status check
-    for c in client.containers.list(all=True):
+    # Use containers.list(all=True) to also get stopped containers for accurate status check
+    for c in get_client().containers.list(all=True):
         try:
             stats = c.stats(stream=False)
             out.append({
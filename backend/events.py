@@ -0,0 +1,210 @@
+import asyncio
+import json
+import os
+import time
+
+from . import db_async, pubsub
+from .db import append_event, list_events_after, event_seq_bounds, prune_events
+from .metrics import gauge
+
+# ---------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------
+
+# Events kept for resuming feeds; a client away for longer gets a "resync"
+EVENTS_RETENTION_SECONDS = float(os.getenv("EVENTS_RETENTION_SECONDS", "3600"))
+# Most events replayed on resume before telling the client to refetch instead
+EVENT_FEED_BACKLOG_MAX = int(os.getenv("EVENT_FEED_BACKLOG_MAX", "500"))
+# Events buffered per feed; a client that falls further behind is cut off and
+# resumes from its Last-Event-ID
+EVENT_FEED_QUEUE = int(os.getenv("EVENT_FEED_QUEUE", "1000"))
+# Idle feeds get a comment line this often (keeps proxies from closing them)
+# and re-check the log in case a wake-up was missed
+EVENT_FEED_KEEPALIVE = float(os.getenv("EVENT_FEED_KEEPALIVE", "15"))
+
+# Broker channel that tells every worker "the event log grew"
+EVENTS_CHANNEL = "events"
+
+
+# ---------------------------------------------------------
+# EMIT
+# ---------------------------------------------------------
+
+def emit(topic: str, user_id: str, **data):
+    """
+    Record a state change (topic "instance" or "submission") for `user_id`
+    and wake the feeds on every worker. Safe from any thread; failures are
+    logged, never raised into the operation that changed the state.
+    """
+    try:
+        seq = append_event(topic, user_id, json.dumps(data))
+        pubsub.broker.publish(EVENTS_CHANNEL, {"seq": seq})
+    except Exception as e:
+        print(f"[events] Could not record {topic} event: {e}")
+
+
+def prune():
+    """Drop events older than EVENTS_RETENTION_SECONDS (run by the cleanup worker)."""
+    prune_events(int((time.time() - EVENTS_RETENTION_SECONDS) * 1000))
+
+
+def _decode(row: dict) -> dict:
+    return {"seq": row["seq"], "topic": row["topic"], "user_id": row["user_id"], "data": json.loads(row["payload"])}
+
+
+# ---------------------------------------------------------
+# FEEDS
+# ---------------------------------------------------------
+
+class Subscription:
+    """One client's feed: its filter, resume cursor and bounded outbound queue."""
+
+    def __init__(self, user_id: str, is_admin: bool, cursor: int):
+        self.user_id = user_id
+        self.is_admin = is_admin
+        self.start = cursor       # where the client resumes if it leaves before any event
+        self.cursor = cursor      # seq of the last event queued to the client
+        self.queue = asyncio.Queue(maxsize=EVENT_FEED_QUEUE)
+        self.overflowed = False
+        self.pending = []         # live events held back while the backlog is read
+
+    def offer(self, event: dict):
+        if not (self.is_admin or event["user_id"] == self.user_id):
+            return
+        if self.pending is not None:
+            self.pending.append(event)
+            return
+        if event["seq"] <= self.cursor or self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+            self.cursor = event["seq"]
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class EventHub:
+    """
+    Per-worker fan-out of the event log. On each wake-up it reads new events
+    once, in seq order, and hands them to the matching subscriptions, so the
+    DB cost does not grow with the number of open feeds.
+    """
+
+    def __init__(self, broker=None):
+        self.broker = broker or pubsub.broker
+        self.subscriptions = set()
+        self.last_seq = None
+        self._listening = None
+        self._fetching = False
+        self._again = False
+
+    def _listen(self):
+        loop = asyncio.get_running_loop()
+        if self._listening is not None and self._listening[0] is loop:
+            return
+        if self._listening is not None:
+            self.broker.unsubscribe(EVENTS_CHANNEL, self._listening)
+        self._listening = self.broker.subscribe(EVENTS_CHANNEL, lambda payload: self.wake())
+
+    async def subscribe(self, user_id: str, is_admin: bool, since: int = None) -> Subscription:
+        """
+        Open a feed. With `since`, events after that seq are replayed first;
+        if they are no longer (or too many to be) in the log, the feed starts
+        with a "resync" event telling the client to refetch its lists.
+        """
+        self._listen()
+        if self.last_seq is None:
+            self.last_seq = (await db_async.read(event_seq_bounds))[1]
+
+        sub = Subscription(user_id, is_admin, self.last_seq)
+        self.subscriptions.add(sub)
+        if since is None:
+            sub.pending = None
+            return sub
+
+        try:
+            oldest, newest = await db_async.read(event_seq_bounds)
+            backlog, resync = [], since > newest or since < oldest - 1
+            if not resync and since < newest:
+                backlog = await db_async.read(
+                    list_events_after, since, None if is_admin else user_id, EVENT_FEED_BACKLOG_MAX + 1
+                )
+                resync = len(backlog) > EVENT_FEED_BACKLOG_MAX
+        except Exception:
+            self.unsubscribe(sub)
+            raise
+
+        held, sub.pending = sub.pending, None
+        sub.start = since
+        if resync:
+            sub.cursor = max(newest, self.last_seq)
+            sub.queue.put_nowait({"seq": sub.cursor, "topic": "resync", "user_id": None, "data": {}})
+        else:
+            sub.cursor = since
+            for row in backlog:
+                sub.offer(_decode(row))
+        for event in held:
+            sub.offer(event)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        self.subscriptions.discard(sub)
+        if not self.subscriptions:
+            self.last_seq = None  # nobody listening: start from the head next time
+
+    def wake(self):
+        """Read and dispatch new events (coalesces overlapping wake-ups)."""
+        if not self.subscriptions:
+            return
+        if self._fetching:
+            self._again = True
+            return
+        self._fetching = True
+        asyncio.get_running_loop().create_task(self._fetch())
+
+    async def _fetch(self):
+        try:
+            while self.subscriptions and self.last_seq is not None:
+                self._again = False
+                rows = await db_async.read(list_events_after, self.last_seq, None, 1000)
+                for row in rows:
+                    event = _decode(row)
+                    self.last_seq = event["seq"]
+                    for sub in list(self.subscriptions):
+                        sub.offer(event)
+                if len(rows) < 1000 and not self._again:
+                    break
+        except Exception as e:
+            print(f"[events] Feed update failed: {e}")
+        finally:
+            self._fetching = False
+
+
+hub = EventHub()
+
+gauge("instadock_event_feeds", "Open /events streams on this worker.", lambda: len(hub.subscriptions))
+
+
+def format_sse(event: dict) -> str:
+    return f"id: {event['seq']}\nevent: {event['topic']}\ndata: {json.dumps(event)}\n\n"
+
+
+async def stream(sub: Subscription, request):
+    """Server-Sent Events body for a subscription; ends when the client leaves or falls behind."""
+    try:
+        # Tell the client where it is, so even a quiet feed can resume exactly
+        yield f"id: {sub.start}\nevent: ready\ndata: {json.dumps({'seq': sub.start})}\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(sub.queue.get(), EVENT_FEED_KEEPALIVE)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                hub.wake()
+                yield ": keepalive\n\n"
+                continue
+            yield format_sse(event)
+            if sub.overflowed and sub.queue.empty():
+                return  # the client reconnects with Last-Event-ID and catches up from the log
+    finally:
+        hub.unsubscribe(sub)
@@ -0,0 +1,153 @@
+import os
+import subprocess
+import time
+from pathlib import Path
+
+from .metrics import histogram
+from . import tracing
+
+# Optional: dulwich lets commits be written without forking a git process.
+try:
+    from dulwich import porcelain as dulwich_porcelain
+except ImportError:
+    dulwich_porcelain = None
+
+# -------------------------------------------------------------------
+# CONFIG
+# -------------------------------------------------------------------
+
+# FIX: Define default Git identity for automated commits
+GIT_USER_NAME = os.getenv("GIT_USER_NAME", "InstaDock Automated Bot")
+GIT_USER_EMAIL = os.getenv("GIT_USER_EMAIL", "instadock@example.com")
+
+GIT_COMMAND_TIMEOUT = int(os.getenv("GIT_COMMAND_TIMEOUT", "300"))
+
+# Handle simple operations (branch creation, HEAD lookup, commit) in-process.
+# Commits additionally need dulwich; without it they fall back to `git commit`.
+GIT_INPROCESS = os.getenv("GIT_INPROCESS", "1") == "1"
+
+# Author/committer identity travels in the environment, which is built once
+# and shared by every git process. No per-repo `git config` calls are needed.
+GIT_ENV = {
+    **os.environ,
+    "GIT_AUTHOR_NAME": GIT_USER_NAME,
+    "GIT_AUTHOR_EMAIL": GIT_USER_EMAIL,
+    "GIT_COMMITTER_NAME": GIT_USER_NAME,
+    "GIT_COMMITTER_EMAIL": GIT_USER_EMAIL,
+    "GIT_TERMINAL_PROMPT": "0",
+}
+
+GIT_COMMAND_SECONDS = histogram(
+    "instadock_git_command_seconds",
+    "Latency of git operations by subcommand and backend (subprocess/inprocess).",
+    ("command", "backend"),
+)
+
+
+# -------------------------------------------------------------------
+# SUBPROCESS BACKEND
+# -------------------------------------------------------------------
+
+def run_git(*args, cwd=None, timeout=GIT_COMMAND_TIMEOUT):
+    """
+    Run a git command and throw errors cleanly.
+    """
+    print(f"[GIT] {' '.join(args)}")
+
+    started = time.perf_counter()
+    try:
+        with tracing.span(f"git {args[0]}"):
+            result = subprocess.run(
+                ["git", *args],
+                cwd=cwd,
+                env=GIT_ENV,
+                text=True,
+                capture_output=True,
+                timeout=timeout,
+            )
+    except subprocess.TimeoutExpired:
+        raise RuntimeError(f"Git error: 'git {args[0]}' timed out after {timeout}s")
+    finally:
+        GIT_COMMAND_SECONDS.observe(time.perf_counter() - started, args[0], "subprocess")
+
+    if result.returncode != 0:
+        raise RuntimeError(f"Git error: {result.stderr}")
+
+    return result.stdout.strip()
+
+
+# -------------------------------------------------------------------
+# IN-PROCESS BACKEND
+# -------------------------------------------------------------------
+
+def _resolve_ref(git_dir: Path, ref: str):
+    """
+    Read a ref from its loose file or from packed-refs (where clone puts them).
+    """
+    loose = git_dir / ref
+    if loose.is_file():
+        return loose.read_text().strip()
+
+    packed = git_dir / "packed-refs"
+    if packed.is_file():
+        for line in packed.read_text().splitlines():
+            if not line or line[0] in "#^":
+                continue
+            sha, name = line.split(" ", 1)
+            if name == ref:
+                return sha
+    return None
+
+
+def head_sha(repo: Path) -> str:
+    """
+    Commit id of HEAD (`git rev-parse HEAD`).
+    """
+    if GIT_INPROCESS:
+        git_dir = Path(repo) / ".git"
+        with GIT_COMMAND_SECONDS.time("rev-parse", "inprocess"):
+            head = (git_dir / "HEAD").read_text().strip()
+            sha = _resolve_ref(git_dir, head[5:]) if head.startswith("ref: ") else head
+        if sha:
+            return sha
+    return run_git("rev-parse", "HEAD", cwd=repo)
+
+
+def create_branch(repo: Path, branch: str):
+    """
+    `git checkout -b <branch>`: create the branch at HEAD and switch to it.
+    Index and worktree are unchanged, so in-process this is two file writes.
+    """
+    if not GIT_INPROCESS:
+        run_git("checkout", "-b", branch, cwd=repo)
+        return
+
+    sha = head_sha(repo)
+    git_dir = Path(repo) / ".git"
+    with GIT_COMMAND_SECONDS.time("checkout", "inprocess"):
+        ref_path = git_dir / "refs" / "heads" / branch
+        if ref_path.exists() or _resolve_ref(git_dir, f"refs/heads/{branch}"):
+            raise RuntimeError(f"Git error: a branch named '{branch}' already exists")
+        ref_path.parent.mkdir(parents=True, exist_ok=True)
+        ref_path.write_text(f"{sha}\n")
+        (git_dir / "HEAD").write_text(f"ref: refs/heads/{branch}\n")
+
+
+def commit(repo: Path, message: str):
+    """
+    `git commit -m <message>` of the current index; returns the new commit id.
+    """
+    if GIT_INPROCESS and dulwich_porcelain is not None:
+        identity = f"{GIT_USER_NAME} <{GIT_USER_EMAIL}>".encode("utf-8")
+        with tracing.span("git commit"), GIT_COMMAND_SECONDS.time("commit", "inprocess"):
+            sha = dulwich_porcelain.commit(
+                str(repo),
+                message=message.encode("utf-8"),
+                author=identity,
+                committer=identity,
+            )
+        print(f"[GIT] commit -m {message} (in-process)")
+        return sha.decode("ascii")
+
+    run_git("commit", "-m", message, cwd=repo)
+    return head_sha(repo)
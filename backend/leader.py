@@ -0,0 +1,90 @@
+import atexit
+import os
+import socket
+import threading
+import time
+import uuid
+
+from .db import try_acquire_lease, release_lease
+
+# ---------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------
+
+# A leader that stops renewing (crash, hang, lost DB) is replaced after at most
+# LEADER_LEASE_SECONDS + LEADER_RENEW_SECONDS; a clean shutdown hands over
+# within LEADER_RENEW_SECONDS.
+LEADER_LEASE_SECONDS = float(os.getenv("LEADER_LEASE_SECONDS", "10"))
+LEADER_RENEW_SECONDS = float(os.getenv("LEADER_RENEW_SECONDS", "2"))
+
+_token = uuid.uuid4().hex[:6]
+_held = set()   # lease names this process currently holds
+
+
+def holder_id() -> str:
+    """Identity of this worker process in the leases table."""
+    return f"{socket.gethostname()}:{os.getpid()}:{_token}"
+
+
+# ---------------------------------------------------------
+# ELECTION
+# ---------------------------------------------------------
+
+def _elect(name: str, target):
+    """
+    Campaign for lease `name` forever. While held, `target(leading)` runs in its
+    own thread; `leading` (a threading.Event) is cleared as soon as the lease
+    cannot be renewed, and the service must then return promptly.
+    """
+    leading, service = None, None
+
+    while True:
+        try:
+            held = try_acquire_lease(name, holder_id(), LEADER_LEASE_SECONDS)
+        except Exception as e:
+            # Cannot prove we still hold it: step down rather than risk two leaders
+            print(f"[leader] Lease '{name}' check failed: {e}")
+            held = False
+
+        if held and leading is None and service is not None and service.is_alive():
+            # The previous term is still winding down; a second service thread
+            # would run beside it (and its teardown would undo the new term's
+            # setup). Keep renewing the lease and start once it has returned.
+            service.join(LEADER_RENEW_SECONDS)
+            if service.is_alive():
+                print(f"[leader] '{name}' re-won, waiting for the previous term to stop")
+                time.sleep(LEADER_RENEW_SECONDS)
+                continue
+
+        if held and leading is None:
+            leading = threading.Event()
+            leading.set()
+            service = threading.Thread(target=target, args=(leading,), daemon=True, name=f"{name}-leader")
+            service.start()
+            _held.add(name)
+            print(f"[leader] {holder_id()} now runs '{name}'")
+        elif not held and leading is not None:
+            leading.clear()
+            leading = None
+            _held.discard(name)
+            print(f"[leader] {holder_id()} lost '{name}'")
+
+        time.sleep(LEADER_RENEW_SECONDS)
+
+
+def start_elected_service(name: str, target):
+    """
+    Run `target(leading)` in exactly one worker process across all replicas
+    that share the database (cleanup loop, samplers, event consumers, ...).
+    """
+    threading.Thread(target=_elect, args=(name, target), daemon=True, name=f"{name}-elector").start()
+
+
+@atexit.register
+def _release_all():
+    """Hand leases over immediately on a clean shutdown."""
+    for name in list(_held):
+        try:
+            release_lease(name, holder_id())
+        except Exception:
+            pass
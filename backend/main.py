@@ -1,8 +1,12 @@
-from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, WebSocket, WebSocketDisconnect, Query, Request, Response, Header
+from typing import Optional
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from contextlib import asynccontextmanager
 import docker.errors
-import sqlite3 
-from backend.db import DB_PATH 
+import hmac
+import json
+import os
 from backend.models import (
     SubmitRepoReq,
     SubmitZipResp,
@@ -17,6 +21,8 @@ from backend.repo_manager import (
     approve_submission,
     reject_submission,
     delete_submission, 
+    update_submission_from_repo,
+    update_submission_from_zip,
 )
 
 # Container lifecycle
@@ -26,60 +32,84 @@ from backend.docker_manager import (
     start as start_container, 
     restart as restart_container,
     remove as remove_container, 
+    forget_vanished,
     list_containers,
     system_stats,
-    client as docker_client, 
+    get_client as get_docker_client,
+    connect_in_background as connect_docker_in_background,
 )
 
+# Git runner (per-command latency histograms)
+from backend.git_runner import GIT_COMMAND_SECONDS
+
+# Prometheus exposition of every histogram/gauge, plus per-route HTTP timings
+from backend.metrics import MetricsMiddleware, exposition
+
+# On-demand profiling: stack sampling of all threads, and cProfile of single
+# requests (run_in_threadpool here is starlette's, made profile-aware)
+from backend import profiler
+from backend.profiler import ProfileMiddleware, ProfiledRoute, run_in_threadpool
+
+# Async DB access for the async handlers (read pool + batching writer thread)
+from backend import db_async
+
+# Conditional GET for the polled list endpoints
+from backend.conditional import not_modified
+
+# Push feed of instance/submission state changes
+from backend import events
+
+# Spans of the spawn and submission pipelines (kept for /admin/traces)
+from backend import tracing
+
 # Auth system
 from backend.auth import require_user, require_admin
 
-# Users router
+# Users router (argon2 runs on the bounded process pool of passwords.py)
+from backend import passwords
 from backend.users import router as user_router
 from backend.users import ensure_default_admin
 
 # DB helpers
 from backend.db import (
     get_submission,
-    list_pending_submissions,
-    list_instances_for_user,
     get_instance,
-    list_all_instances,
-    update_instance_status,
+    list_submission_revisions,
+    list_instances_page,
+    list_submissions_page,
+    reserve_instance_slot,
+    release_instance_slot,
+    find_user_ids_by_prefix,
 )
 
-# --- FIX: Connection Manager for Chat ---
-class ConnectionManager:
-    """Manages active WebSocket connections (e.g., for Admin Chat)."""
-    def __init__(self):
-        # Store connections by user_id to facilitate direct messaging (admin to user)
-        self.active_connections: dict[str, WebSocket] = {}
-
-    async def connect(self, user_id: str, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections[user_id] = websocket
+# Chat connections (per-connection send queues and rooms, see chat.py)
+from backend.chat import manager, user_room, ADMIN_ROOM
 
-    def disconnect(self, user_id: str):
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
+# Background services run in one elected worker across all API workers/replicas
+from backend.leader import start_elected_service
+from backend.cleanup_worker import start_cleanup_worker
 
-    async def send_personal_message(self, message: str, user_id: str):
-        if user_id in self.active_connections:
-            await self.active_connections[user_id].send_text(message)
 
-    async def broadcast(self, message: str):
-        for connection in self.active_connections.values():
-            await connection.send_text(message)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Worker startup and shutdown. Kept out of module import so importing the
+    app (tools, tests, a new replica) does not start threads or wait on the
+    Docker daemon; Docker connects in the background and again on first use.
+    """
+    start_elected_service("cleanup", start_cleanup_worker)
+    await run_in_threadpool(ensure_default_admin)
+    connect_docker_in_background()
+    yield
+    # Chat lines are written in batches; don't lose the last one
+    await manager.flush()
+    passwords.shutdown()
 
-manager = ConnectionManager()
-# ----------------------------------------
 
 # FIX 4: Add dependencies to all API tools
-app = FastAPI(title="InstaDock API (Patched)")
-
-import threading
-from backend.cleanup_worker import start_cleanup_worker
-threading.Thread(target=start_cleanup_worker, daemon=True).start()
+app = FastAPI(title="InstaDock API (Patched)", lifespan=lifespan)
+# Sync endpoints run on worker threads; this route class lets X-Profile follow them there
+app.router.route_class = ProfiledRoute
 
 # CORS
 app.add_middleware(
@@ -88,13 +118,51 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
+# cProfile of a single request on "X-Profile: 1" from an admin
+app.add_middleware(ProfileMiddleware)
+
+# Per-route latency histograms (outermost, so CORS handling is timed too)
+app.add_middleware(MetricsMiddleware)
+
 # Mount user login/register/password reset (unprotected endpoints handled in users.py)
 app.include_router(user_router, prefix="/user")
 
-# Ensure admin exists
-ensure_default_admin()
+# ---------------------------------------------------------
+# 🟩 LIST PAGINATION
+# ---------------------------------------------------------
+
+# List endpoints return one newest-first page as a JSON array; the cursor for
+# the next page (if any) is sent in the X-Next-Cursor header. Each page carries
+# an ETag of its table/user scope, and a matching If-None-Match gets a 304
+# without running the query.
+PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = 1000
+
+
+def page_params(
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return"),
+    status: Optional[str] = None,
+):
+    return {"limit": limit, "cursor": cursor, "fields": fields, "status": status}
+
+
+def paged(request: Request, response: Response, scope: tuple, list_page, **kwargs):
+    cached = not_modified(request, response, *scope)
+    if cached:
+        return cached
+    try:
+        rows, next_cursor = list_page(**kwargs)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
 
 # ---------------------------------------------------------
 # 🟩 SUBMISSION ENDPOINTS (FIX 4: PROTECTED)
@@ -103,23 +171,70 @@ ensure_default_admin()
 @app.post("/submit/repo", dependencies=[Depends(require_user)])
 async def submit_repo(req: SubmitRepoReq, user=Depends(require_user)):
     """User submits a Git repo to be built."""
-    try:
-        sub_id, branch = create_branch_from_repo(
-            user["user_id"], str(req.repo_url), req.ref
-        )
-        return SubmitZipResp(submission_id=sub_id, branch=branch)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    with tracing.trace("submit_repo", user_id=user["user_id"], repo_url=str(req.repo_url)):
+        try:
+            sub_id, branch, status = await run_in_threadpool(
+                create_branch_from_repo, user["user_id"], str(req.repo_url), req.ref
+            )
+            return SubmitZipResp(submission_id=sub_id, branch=branch, status=status)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/submit/zip", dependencies=[Depends(require_user)])
 async def submit_zip(file: UploadFile = File(...), user=Depends(require_user)):
     """User uploads a ZIP folder submission."""
-    try:
-        sub_id, branch = create_branch_from_zip(user["user_id"], file)
-        return SubmitZipResp(submission_id=sub_id, branch=branch)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    with tracing.trace("submit_zip", user_id=user["user_id"]):
+        try:
+            sub_id, branch, status = await run_in_threadpool(create_branch_from_zip, user["user_id"], file)
+            return SubmitZipResp(submission_id=sub_id, branch=branch, status=status)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+
+async def check_submission_ownership(sub_id: str, user_data: dict):
+    """Helper to check existence and ownership/admin role of a submission."""
+    submission = await db_async.read(get_submission, sub_id)
+    if not submission:
+        raise HTTPException(404, "Submission not found")
+
+    if submission["user_id"] != user_data["user_id"] and user_data["role"] != "admin":
+        raise HTTPException(403, "You cannot modify another user's submission")
+
+    return submission
+
+
+@app.post("/submit/{sub_id}/repo", dependencies=[Depends(require_user)])
+async def resubmit_repo(sub_id: str, req: SubmitRepoReq, user=Depends(require_user)):
+    """User pushes a new revision of an existing submission from a Git repo."""
+    with tracing.trace("resubmit_repo", user_id=user["user_id"], submission_id=sub_id, repo_url=str(req.repo_url)):
+        await check_submission_ownership(sub_id, user)
+        try:
+            sub_id, branch, status = await run_in_threadpool(
+                update_submission_from_repo, sub_id, str(req.repo_url), req.ref
+            )
+            return SubmitZipResp(submission_id=sub_id, branch=branch, status=status)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/submit/{sub_id}/zip", dependencies=[Depends(require_user)])
+async def resubmit_zip(sub_id: str, file: UploadFile = File(...), user=Depends(require_user)):
+    """User uploads a new revision of an existing submission as a ZIP."""
+    with tracing.trace("resubmit_zip", user_id=user["user_id"], submission_id=sub_id):
+        await check_submission_ownership(sub_id, user)
+        try:
+            sub_id, branch, status = await run_in_threadpool(update_submission_from_zip, sub_id, file)
+            return SubmitZipResp(submission_id=sub_id, branch=branch, status=status)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/submission/{sub_id}/revisions", dependencies=[Depends(require_user)])
+async def submission_revisions(sub_id: str, user=Depends(require_user)):
+    """Revision history (one entry per pushed commit) of a submission."""
+    await check_submission_ownership(sub_id, user)
+    return await db_async.read(list_submission_revisions, sub_id)
 
 
 # ---------------------------------------------------------
@@ -129,37 +244,41 @@ async def submit_zip(file: UploadFile = File(...), user=Depends(require_user)):
 @app.post("/admin/approve/{sub_id}", dependencies=[Depends(require_admin)])
 async def approve(sub_id: str):
     """Admin marks submission approved."""
-    try:
-        approve_submission(sub_id)
-        return {"status": "approved"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    with tracing.trace("approve", submission_id=sub_id):
+        try:
+            await run_in_threadpool(approve_submission, sub_id)
+            return {"status": "approved"}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/admin/reject/{sub_id}", dependencies=[Depends(require_admin)])
 async def reject(sub_id: str):
-    try:
-        reject_submission(sub_id)
-        return {"status": "rejected"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    with tracing.trace("reject", submission_id=sub_id):
+        try:
+            await run_in_threadpool(reject_submission, sub_id)
+            return {"status": "rejected"}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
         
 @app.delete("/admin/submission/{sub_id}", dependencies=[Depends(require_admin)])
 async def admin_delete_submission(sub_id: str):
     """Admin permanently deletes a submission record and associated git branch."""
-    try:
-        delete_submission(sub_id) 
-        return {"status": "permanently deleted", "sub_id": sub_id}
-    except RuntimeError as e:
-        raise HTTPException(status_code=404, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    with tracing.trace("delete_submission", submission_id=sub_id):
+        try:
+            await run_in_threadpool(delete_submission, sub_id)
+            return {"status": "permanently deleted", "sub_id": sub_id}
+        except RuntimeError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/admin/submissions", dependencies=[Depends(require_admin)])
-def get_pending():
-    """List pending submissions."""
-    return list_pending_submissions()
+def get_pending(request: Request, response: Response, page=Depends(page_params)):
+    """List submissions by status (pending unless ?status= is given)."""
+    page["status"] = page["status"] or "pending"
+    return paged(request, response, ("submissions",), list_submissions_page, **page)
 
 
 # ---------------------------------------------------------
@@ -172,22 +291,34 @@ MAX_INSTANCES_PER_USER = 5
 async def spawn_container(req: SpawnReq, user=Depends(require_user)):
     """Spawn an instance."""
     user_id = user["user_id"]
-    
-    # NFR-1.2: Check instance quota (only count running instances towards quota)
-    running_instances = [inst for inst in list_instances_for_user(user_id) if inst.get('status') == 'running']
-    
-    if len(running_instances) >= MAX_INSTANCES_PER_USER:
-        raise HTTPException(
-            status_code=429,
-            detail=f"Quota exceeded. You are limited to {MAX_INSTANCES_PER_USER} active instances. Please stop an existing instance."
-        )
 
+    with tracing.trace("spawn", user_id=user_id, image=req.image, submission_id=req.submission_id) as span:
+        # NFR-1.2: Check instance quota (running instances + spawns in flight) and
+        # hold a slot atomically, so parallel spawns cannot all slip past the check
+        # while the first one is still pulling its image.
+        reservation_id = await db_async.write(reserve_instance_slot, user_id, MAX_INSTANCES_PER_USER)
+        if reservation_id is None:
+            raise HTTPException(
+                status_code=429,
+                detail=f"Quota exceeded. You are limited to {MAX_INSTANCES_PER_USER} active instances. Please stop an existing instance."
+            )
+
+        try:
+            resp = await _spawn_reserved(req, user_id, reservation_id)
+            span.set(cid=resp.cid)
+            return resp
+        finally:
+            # No-op after a successful spawn (the instance row took the slot over)
+            await db_async.write(release_instance_slot, reservation_id)
+
+
+async def _spawn_reserved(req: SpawnReq, user_id: str, reservation_id: str):
     submission_id = None
     image_to_use = req.image
 
     # If submission ID provided → use GHCR image stored in DB
     if req.submission_id:
-        submission = get_submission(req.submission_id)
+        submission = await db_async.read(get_submission, req.submission_id)
         if not submission:
             raise HTTPException(status_code=404, detail="Submission not found")
 
@@ -209,12 +340,17 @@ async def spawn_container(req: SpawnReq, user=Depends(require_user)):
         raise HTTPException(400, "No image or submission_id provided")
 
     try:
-        cid, url, expires_at = spawn(
-            image=image_to_use,
-            user_id=user["user_id"],
-            submission_id=submission_id,
-            ttl_seconds=req.ttl_seconds
-        )
+        # The worker thread inherits the request's context, so the phases
+        # recorded by docker_manager nest under this span
+        with tracing.span("docker_manager.spawn", image=image_to_use):
+            cid, url, expires_at = await run_in_threadpool(
+                spawn,
+                image=image_to_use,
+                user_id=user_id,
+                submission_id=submission_id,
+                ttl_seconds=req.ttl_seconds,
+                reservation_id=reservation_id,
+            )
         return SpawnResp(cid=cid, url=url, expires_at=expires_at)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -224,9 +360,9 @@ async def spawn_container(req: SpawnReq, user=Depends(require_user)):
 # 🟩 INSTANCE MANAGEMENT (FIX 4: PROTECTED)
 # ---------------------------------------------------------
 
-def check_instance_ownership(cid: str, user_data: dict):
+async def check_instance_ownership(cid: str, user_data: dict):
     """Helper to check existence and ownership/admin role."""
-    instance = get_instance(cid)
+    instance = await db_async.read(get_instance, cid)
     if not instance:
         raise HTTPException(404, "Instance not found")
     
@@ -240,8 +376,8 @@ def check_instance_ownership(cid: str, user_data: dict):
 @app.post("/stop/{cid}", dependencies=[Depends(require_user)])
 async def stop_instance(cid: str, user=Depends(require_user)):
     try:
-        check_instance_ownership(cid, user)
-        stop_container(cid)
+        await check_instance_ownership(cid, user)
+        await run_in_threadpool(stop_container, cid)
         return {"status": "stopped", "cid": cid}
     except RuntimeError as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -252,11 +388,11 @@ async def stop_instance(cid: str, user=Depends(require_user)):
 @app.post("/start/{cid}", dependencies=[Depends(require_user)])
 async def start_instance(cid: str, user=Depends(require_user)):
     try:
-        instance = check_instance_ownership(cid, user)
+        instance = await check_instance_ownership(cid, user)
         if instance["status"] == 'running':
              return {"status": "already running", "cid": cid}
              
-        start_container(cid)
+        await run_in_threadpool(start_container, cid)
         return {"status": "started", "cid": cid}
     except RuntimeError as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -267,8 +403,8 @@ async def start_instance(cid: str, user=Depends(require_user)):
 @app.post("/restart/{cid}", dependencies=[Depends(require_user)])
 async def restart_instance(cid: str, user=Depends(require_user)):
     try:
-        check_instance_ownership(cid, user)
-        restart_container(cid)
+        await check_instance_ownership(cid, user)
+        await run_in_threadpool(restart_container, cid)
         return {"status": "restarted", "cid": cid}
     except RuntimeError as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -278,8 +414,8 @@ async def restart_instance(cid: str, user=Depends(require_user)):
 @app.delete("/delete/{cid}", dependencies=[Depends(require_user)])
 async def delete_instance(cid: str, user=Depends(require_user)):
     try:
-        check_instance_ownership(cid, user)
-        remove_container(cid)
+        await check_instance_ownership(cid, user)
+        await run_in_threadpool(remove_container, cid)
         return {"status": "deleted", "cid": cid}
     except RuntimeError as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -288,15 +424,16 @@ async def delete_instance(cid: str, user=Depends(require_user)):
 
 
 @app.get("/instance/me", dependencies=[Depends(require_user)])
-async def list_user_instances(user=Depends(require_user)):
+def list_user_instances(request: Request, response: Response, page=Depends(page_params), user=Depends(require_user)):
     """FIX 4: Protected endpoint."""
-    return list_instances_for_user(user["user_id"])
+    return paged(request, response, ("instances", user["user_id"]),
+                 list_instances_page, user_id=user["user_id"], **page)
 
 
 @app.get("/instance/{cid}", dependencies=[Depends(require_user)])
 async def instance_details(cid: str, user=Depends(require_user)):
     """FIX 4: Protected endpoint."""
-    return check_instance_ownership(cid, user)
+    return await check_instance_ownership(cid, user)
 
 
 # ---------------------------------------------------------
@@ -304,17 +441,18 @@ async def instance_details(cid: str, user=Depends(require_user)):
 # ---------------------------------------------------------
 
 @app.get("/logs/{cid}", dependencies=[Depends(require_user)])
-def get_container_logs(cid: str, user=Depends(require_user)):
+async def get_container_logs(cid: str, user=Depends(require_user)):
     """
     FIX: HTTP GET endpoint to fetch the last 500 lines of logs for polling.
     """
     # Use the same ownership check logic
-    instance = check_instance_ownership(cid, user)
+    instance = await check_instance_ownership(cid, user)
 
     try:
-        container = docker_client.containers.get(cid)
+        docker_client = await run_in_threadpool(get_docker_client)
+        container = await run_in_threadpool(docker_client.containers.get, cid)
         # Fetch up to the last 500 lines of logs
-        raw_logs = container.logs(tail=500, timestamps=True).decode('utf-8')
+        raw_logs = (await run_in_threadpool(container.logs, tail=500, timestamps=True)).decode('utf-8')
         
         return {
             "status": "success",
@@ -322,8 +460,8 @@ def get_container_logs(cid: str, user=Depends(require_user)):
             "logs": raw_logs.strip().split('\n')
         }
     except docker.errors.NotFound:
-        # If the container is gone from Docker, update DB and report
-        update_instance_status(cid, 'removed')
+        # If the container is gone from Docker, reclaim the instance and report
+        await run_in_threadpool(forget_vanished, cid)
         raise HTTPException(
             status_code=404,
             detail=f"Container {cid} not found on Docker host. Removed DB entry."
@@ -332,26 +470,64 @@ def get_container_logs(cid: str, user=Depends(require_user)):
         raise HTTPException(status_code=500, detail=f"Error fetching logs: {e}")
 
 
+# ---------------------------------------------------------
+# 🟩 EVENT FEED (SERVER-SENT EVENTS)
+# ---------------------------------------------------------
+
+@app.get("/events")
+async def event_feed(request: Request, since: Optional[int] = Query(None, ge=0), user=Depends(require_user)):
+    """
+    Pushes instance and submission state changes as they happen: the caller's
+    own, or everyone's for admins. Each event's id is its sequence number;
+    reconnecting with Last-Event-ID (EventSource does this by itself) or
+    ?since=<seq> resumes right after it.
+    """
+    last_event_id = request.headers.get("last-event-id")
+    if since is None and last_event_id:
+        try:
+            since = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+
+    sub = await events.hub.subscribe(user["user_id"], user["role"] == "admin", since)
+    return StreamingResponse(
+        events.stream(sub, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # ---------------------------------------------------------
 # 🟩 ADMIN CHAT/PINGS (NEW FEATURE)
 # ---------------------------------------------------------
 
 @app.websocket("/ws/admin/chat")
-async def websocket_admin_chat(websocket: WebSocket, user_data: dict = Depends(require_user)):
+async def websocket_admin_chat(
+    websocket: WebSocket,
+    user_data: dict = Depends(require_user),
+    room: Optional[str] = Query(None),
+):
     """
     FIX: Bidirectional chat and ping channel for admin/support communication.
+
+    Users talk in their own support room (all of their tabs plus the admins).
+    Admins receive every support room; they answer a user with
+    "@<user id or its first 8 chars> text" (or {"to": "<user_id>", "text": "..."})
+    and plain text goes to the admin-only room. `?room=user:<id>` lets an
+    admin replay a user's recent history.
     """
     user_id = user_data["user_id"]
     is_admin = user_data["role"] == "admin"
-    
-    # 1. Connect and register
-    await manager.connect(user_id, websocket)
+    home = ADMIN_ROOM if is_admin else user_room(user_id)
+
+    # 1. Connect, join rooms and replay their recent history
+    conn = await manager.connect(user_id, websocket, is_admin=is_admin, rooms=[room] if room else [])
     
     # If standard user connects, send welcome/support message.
     if not is_admin:
-        await manager.send_personal_message(f"Welcome, {user_id[:8]}! Your support session is active.", user_id)
+        conn.offer(f"Welcome, {user_id[:8]}! Your support session is active.")
     else:
-        await manager.send_personal_message(f"Admin session active. Total users online: {len(manager.active_connections)}.", user_id)
+        conn.offer(f"Admin session active. Total users online: {len(manager.active_connections)}.")
 
 
     try:
@@ -361,26 +537,36 @@ async def websocket_admin_chat(websocket: WebSocket, user_data: dict = Depends(r
             
             # Simple ping/pong mechanism to keep connection alive
             if data.lower() == "ping":
-                await manager.send_personal_message("pong", user_id)
+                conn.offer("pong")
                 continue
             
-            # 3. Message handling (simplified chat)
+            # 3. Route: users -> their support room; admins -> a user's room or the staff room
+            target, text = home, data
+            if is_admin and data.startswith("{"):
+                try:
+                    msg = json.loads(data)
+                    target, text = user_room(str(msg["to"])), str(msg["text"])
+                except (ValueError, KeyError, TypeError):
+                    conn.offer('Invalid message: expected {"to": "<user_id>", "text": "..."}')
+                    continue
+            elif is_admin and data.startswith("@"):
+                prefix, _, text = data[1:].partition(" ")
+                matches = await db_async.read(find_user_ids_by_prefix, prefix)
+                if len(matches) != 1 or not text.strip():
+                    conn.offer(f"No unique user matches @{prefix} (reply with '@<user id> message')")
+                    continue
+                target = user_room(matches[0])
+
             message_prefix = "[SUPPORT]" if is_admin else f"[USER {user_id[:8]}]"
-            full_message = f"{message_prefix}: {data}"
-            
-            # Admins get to broadcast or message other users (logic omitted for simplicity)
-            # Standard users send messages to be seen by admins.
-            
-            # For this MVP, we'll assume all messages are broadcast to all connected clients
-            # (Admins/Users) to simulate a support room, and they filter the UI side.
-            await manager.broadcast(full_message)
+            manager.publish(target, f"{message_prefix}: {text}", sender_id=user_id)
 
     except WebSocketDisconnect:
-        manager.disconnect(user_id)
-        await manager.broadcast(f"User {user_id[:8]} left the chat.")
+        manager.disconnect(conn)
+        if not manager.is_online(user_id):  # last tab closed
+            manager.publish(home, f"User {user_id[:8]} left the chat.", record=False)
     except Exception as e:
         print(f"Chat error for {user_id}: {e}")
-        manager.disconnect(user_id)
+        manager.disconnect(conn)
 
 
 # ---------------------------------------------------------
@@ -388,27 +574,115 @@ async def websocket_admin_chat(websocket: WebSocket, user_data: dict = Depends(r
 # ---------------------------------------------------------
 
 @app.get("/admin/submissions/approved", dependencies=[Depends(require_admin)])
-def admin_list_all_approved_submissions():
+def admin_list_all_approved_submissions(request: Request, response: Response, page=Depends(page_params)):
     """Admin views all approved submissions across all users."""
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        rows = conn.execute("""
-            SELECT id, user_id, branch, status, image_tag, created_at, source FROM submissions 
-            WHERE status='approved' AND image_tag IS NOT NULL
-            ORDER BY created_at DESC
-        """).fetchall()
-        return [dict(r) for r in rows]
+    page["status"] = "approved"
+    return paged(request, response, ("submissions",), list_submissions_page, built_only=True, **page)
 
 @app.get("/admin/instances/all", dependencies=[Depends(require_admin)])
-def admin_list_all_instances():
+def admin_list_all_instances(request: Request, response: Response, page=Depends(page_params)):
     """Admin views all spawned instances (running, stopped, expired)."""
-    return list_all_instances()
+    return paged(request, response, ("instances",), list_instances_page, **page)
 
 @app.get("/admin/stats", dependencies=[Depends(require_admin)])
 def admin_stats():
     """Admin-level stats for system health check."""
     return system_stats()
 
+@app.get("/admin/stats/git", dependencies=[Depends(require_admin)])
+def admin_git_stats():
+    """Latency histograms of git operations, per subcommand and backend."""
+    return GIT_COMMAND_SECONDS.snapshot()
+
+@app.get("/admin/traces", dependencies=[Depends(require_admin)])
+def admin_traces(limit: int = Query(50, ge=1, le=1000), name: Optional[str] = None):
+    """Latest traced spawns/submissions (newest first), optionally of one kind (?name=spawn)."""
+    return tracing.recent_traces(limit, name)
+
+@app.get("/admin/traces/{trace_id}", dependencies=[Depends(require_admin)])
+def admin_trace(trace_id: str):
+    """Every span of one trace, with offsets from its start."""
+    trace = tracing.get_trace(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found (it may have been evicted)")
+    return trace
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin)])
+def admin_profile(
+    seconds: float = Query(10, gt=0, le=profiler.PROFILE_MAX_SECONDS),
+    interval_ms: float = Query(10, ge=1, le=1000),
+    include_idle: bool = False,
+    format: str = Query("collapsed", pattern="^(collapsed|json)$"),
+):
+    """
+    Sample the stacks of every thread of this worker for `seconds`. Returns
+    collapsed stacks (feed to flamegraph.pl or speedscope), or ?format=json.
+    Threads parked waiting for work are skipped unless include_idle is set.
+    """
+    try:
+        result = profiler.sample_stacks(seconds, interval_ms, include_idle)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if format == "json":
+        return {
+            "samples": result["samples"],
+            "interval_ms": interval_ms,
+            "stacks": [{"stack": s, "count": c} for s, c in result["stacks"].most_common()],
+        }
+    return Response(
+        profiler.collapsed(result["stacks"]),
+        media_type="text/plain; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="instadock-{os.getpid()}.folded"'},
+    )
+
+@app.get("/admin/profile/requests", dependencies=[Depends(require_admin)])
+def admin_request_profiles():
+    """Requests profiled with the X-Profile header (newest first)."""
+    return profiler.recent_request_profiles()
+
+@app.get("/admin/profile/requests/{profile_id}", dependencies=[Depends(require_admin)])
+def admin_request_profile(
+    profile_id: str,
+    sort: str = Query("cumulative", pattern="^(cumulative|tottime|ncalls)$"),
+    limit: int = Query(60, ge=1, le=1000),
+    format: str = Query("text", pattern="^(text|pstats)$"),
+):
+    """pstats report of one profiled request; ?format=pstats downloads it for snakeviz."""
+    request = profiler.get_request_profile(profile_id)
+    if request is None:
+        raise HTTPException(status_code=404, detail="Profile not found (it may have been evicted)")
+    if format == "pstats":
+        return Response(
+            profiler.dump_stats(request),
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": f'attachment; filename="request-{profile_id}.pstats"'},
+        )
+    return Response(profiler.render_stats(request, sort, limit), media_type="text/plain; charset=utf-8")
+
+
+# ---------------------------------------------------------
+# 🟩 PROMETHEUS METRICS
+# ---------------------------------------------------------
+
+# Scrapers send "Authorization: Bearer <METRICS_TOKEN>"; when it is unset,
+# /metrics takes an admin token like the other admin endpoints.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+
+async def require_metrics_access(authorization: Optional[str] = Header(None, alias="Authorization")):
+    if METRICS_TOKEN and authorization and hmac.compare_digest(authorization, f"Bearer {METRICS_TOKEN}"):
+        return
+    await require_admin(await require_user(authorization, None))
+
+
+@app.get("/metrics", dependencies=[Depends(require_metrics_access)])
+def metrics():
+    """
+    Histograms and gauges of this worker process in the Prometheus text
+    format (with several uvicorn workers, each scrape sees one of them).
+    """
+    return Response(exposition(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 
 # ---------------------------------------------------------
 # 🟩 ROOT (FIX 4: PROTECTED)
@@ -0,0 +1,288 @@
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# ---------------------- CONFIG ----------------------
+
+# Upper bounds (seconds) shared by all latency histograms; covers sub-ms DB
+# queries up to multi-minute git pushes and image pulls.
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0,
+)
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+# ---------------------- HISTOGRAM ----------------------
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram, optionally split by label values.
+
+    observe() is a bisect plus three increments under a per-histogram lock,
+    so it is cheap enough to call on every git command or DB query.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                # [per-bucket counts (+Inf last), sum, count]
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labelvalues):
+        """Observe the wall-clock duration of the wrapped block."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labelvalues)
+
+    def snapshot(self):
+        """
+        Cumulative view of every label combination:
+        [{"labels": {...}, "count": n, "sum": s, "buckets": {"0.1": n, ..., "+Inf": n}}]
+        """
+        with self._lock:
+            series = [(labels, list(counts), total, count)
+                      for labels, (counts, total, count) in self._series.items()]
+
+        out = []
+        for labels, counts, total, count in series:
+            cumulative = 0
+            buckets = {}
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                buckets["+Inf" if bound == float("inf") else repr(bound)] = cumulative
+            out.append({
+                "labels": dict(zip(self.labelnames, labels)),
+                "count": count,
+                "sum": round(total, 6),
+                "buckets": buckets,
+            })
+        return out
+
+    def samples(self):
+        for series in self.snapshot():
+            labels = series["labels"]
+            for bound, count in series["buckets"].items():
+                yield "_bucket", dict(labels, le=bound), count
+            yield "_sum", labels, series["sum"]
+            yield "_count", labels, series["count"]
+
+
+def timed(metric: Histogram, *labelvalues):
+    """Decorator observing the duration of every call of the wrapped function."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                metric.observe(time.perf_counter() - started, *labelvalues)
+        return wrapper
+    return decorate
+
+
+# ---------------------- COUNTER / GAUGE ----------------------
+
+class Counter:
+    """Monotonic count, optionally split by label values."""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Unlabeled counters are exported from zero, so rate() sees the first increment
+        self._values = {} if self.labelnames else {(): 0}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield "_total", dict(zip(self.labelnames, labels)), value
+
+
+class Gauge:
+    """
+    Current value read at scrape time: collect() returns a number, or a
+    {labelvalues tuple: number} dict when the gauge has labels. Nothing runs
+    on the hot path; the owning module just exposes its state.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, collect, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def samples(self):
+        values = self.collect()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in values.items():
+            if value is not None:
+                yield "", dict(zip(self.labelnames, labels)), value
+
+
+def _register(name, factory):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = factory()
+        return metric
+
+
+def histogram(name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    """
+    Get or create the process-wide histogram registered under name.
+    """
+    return _register(name, lambda: Histogram(name, documentation, labelnames, buckets))
+
+
+def counter(name: str, documentation: str, labelnames=()) -> Counter:
+    return _register(name, lambda: Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, collect, labelnames=()) -> Gauge:
+    return _register(name, lambda: Gauge(name, documentation, collect, labelnames))
+
+
+# ---------------------- EXPOSITION ----------------------
+
+def _label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def exposition() -> str:
+    """All registered metrics in the Prometheus text format (version 0.0.4)."""
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda m: m.name)
+
+    lines = []
+    for metric in metrics:
+        try:
+            samples = list(metric.samples())
+        except Exception as e:
+            # A broken collector must not take the whole scrape down
+            print(f"[metrics] Could not collect {metric.name}: {e}")
+            continue
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for suffix, labels, value in samples:
+            if labels:
+                rendered = ",".join(f'{k}="{_label_value(v)}"' for k, v in labels.items())
+                lines.append(f"{metric.name}{suffix}{{{rendered}}} {_number(value)}")
+            else:
+                lines.append(f"{metric.name}{suffix} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------------------- HTTP ----------------------
+
+HTTP_REQUEST_SECONDS = histogram(
+    "instadock_http_request_seconds",
+    "Time until the response headers are sent, by route template and method.",
+    ("method", "route"),
+)
+HTTP_RESPONSES = counter(
+    "instadock_http_responses",
+    "HTTP responses by route template, method and status code.",
+    ("method", "route", "status"),
+)
+
+
+def route_template(scope) -> str:
+    """
+    Full template of the route that handled `scope` (/user/reset_password/{reset_token}),
+    including the prefixes of mounts and included routers.
+    """
+    route = scope.get("route")
+    if route is None:
+        return "<unmatched>"
+    template = getattr(route, "path_format", None) or route.path
+    root_path = scope.get("root_path", "")
+    path = scope["path"]
+    if path.startswith(root_path):
+        path = path[len(root_path):]
+
+    # A route declared on an included router knows only its own part (/login)
+    # and matches the end of the path; what comes before is the router prefix
+    regex = getattr(route, "path_regex", None)
+    if regex is not None and not regex.match(path):
+        for i, char in enumerate(path):
+            if char == "/" and i and regex.match(path[i:]):
+                return root_path + path[:i] + template
+    return root_path + template
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request up to its response start, so
+    streamed bodies (the SSE feed, log downloads) do not skew the histogram.
+    Routes are labelled by their template (/instance/{cid}), never the raw path.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        observed = False
+
+        def observe(status):
+            template = route_template(scope)
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, scope["method"], template)
+            HTTP_RESPONSES.inc(scope["method"], template, str(status))
+
+        async def send_wrapper(message):
+            nonlocal observed
+            if message["type"] == "http.response.start" and not observed:
+                observed = True
+                observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            if not observed:
+                observe(500)
+            raise
@@ -0,0 +1,214 @@
+"""
+Versioned schema migrations.
+
+Every entry in MIGRATIONS runs exactly once per database, in order, and is
+recorded in schema_migrations. Append new migrations to the end; never edit
+or reorder ones that have shipped. Steps are SQL strings (with {timestamp} /
+{now} / {serial} filled in per dialect) or callables(engine, conn).
+
+Databases created before the runner existed already contain some of these
+objects, so every step is idempotent (IF NOT EXISTS / add_column).
+"""
+
+
+def add_column(table, column, decl):
+    """Step adding a column unless it already exists."""
+    def step(engine, conn):
+        if column not in engine.columns(conn, table):
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+    return step
+
+
+MIGRATIONS = [
+    (1, "base tables", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id TEXT PRIMARY KEY,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'user'
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS submissions (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            branch TEXT NOT NULL,
+            status TEXT NOT NULL,
+            source TEXT,
+            created_at {timestamp} DEFAULT {now},
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        """,
+        # FR-4.0: status tracks running/stopped state
+        """
+        CREATE TABLE IF NOT EXISTS instances (
+            cid TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            submission_id TEXT,
+            image TEXT NOT NULL,
+            subdomain TEXT NOT NULL,
+            port INTEGER,
+            expires_at TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            created_at {timestamp} DEFAULT {now},
+            FOREIGN KEY (submission_id) REFERENCES submissions(id)
+        )
+        """,
+    ]),
+    (2, "password reset token", [
+        add_column("users", "reset_token", "TEXT"),
+        add_column("users", "reset_expires_at", "TEXT"),
+    ]),
+    # Set on approval, to simulate the CI build result
+    (3, "submission image tag", [
+        add_column("submissions", "image_tag", "TEXT"),
+    ]),
+    # Canonical tree hash (deduplicates re-uploads) and per-phase timings (JSON, ms)
+    (4, "submission content hash and timings", [
+        add_column("submissions", "content_hash", "TEXT"),
+        add_column("submissions", "timings", "TEXT"),
+        "CREATE INDEX IF NOT EXISTS idx_submissions_user_hash ON submissions(user_id, content_hash)",
+    ]),
+    # One row per pushed commit of a submission branch
+    (5, "submission revisions", [
+        """
+        CREATE TABLE IF NOT EXISTS submission_revisions (
+            submission_id TEXT NOT NULL,
+            revision INTEGER NOT NULL,
+            commit_sha TEXT,
+            content_hash TEXT,
+            source TEXT,
+            changed_files INTEGER,
+            created_at {timestamp} DEFAULT {now},
+            PRIMARY KEY (submission_id, revision),
+            FOREIGN KEY (submission_id) REFERENCES submissions(id)
+        )
+        """,
+    ]),
+    # Secondary indexes for the hot list/cleanup queries (no full table scans)
+    (6, "hot query indexes", [
+        "DROP INDEX IF EXISTS idx_instances_user_created",
+        "CREATE INDEX IF NOT EXISTS idx_instances_user_created ON instances(user_id, created_at, cid)",
+        "CREATE INDEX IF NOT EXISTS idx_instances_expires ON instances(expires_at)",
+        "CREATE INDEX IF NOT EXISTS idx_instances_status ON instances(status)",
+        "CREATE INDEX IF NOT EXISTS idx_instances_port ON instances(port)",
+        "CREATE INDEX IF NOT EXISTS idx_instances_user_status ON instances(user_id, status)",
+        "CREATE INDEX IF NOT EXISTS idx_submissions_status_image_created ON submissions(status, image_tag, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_submissions_user_status ON submissions(user_id, status, created_at)",
+    ]),
+    # Keyset pagination walks (created_at, id) newest-first, optionally per status
+    (7, "keyset pagination indexes", [
+        "CREATE INDEX IF NOT EXISTS idx_instances_created ON instances(created_at, cid)",
+        "CREATE INDEX IF NOT EXISTS idx_instances_status_created ON instances(status, created_at, cid)",
+        "CREATE INDEX IF NOT EXISTS idx_submissions_created ON submissions(created_at, id)",
+        "CREATE INDEX IF NOT EXISTS idx_submissions_status_created ON submissions(status, created_at, id)",
+    ]),
+    # Quota slots held by spawns that are still pulling/starting their container
+    (8, "instance reservations", [
+        """
+        CREATE TABLE IF NOT EXISTS instance_reservations (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            created_at {timestamp} DEFAULT {now}
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_reservations_user ON instance_reservations(user_id)",
+    ]),
+    # Leader election for background services (one holder per lease name)
+    (9, "leases", [
+        """
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            expires_ms BIGINT NOT NULL
+        )
+        """,
+    ]),
+    # Durable chat history; the last few messages per room are also kept in memory
+    (10, "chat messages", [
+        """
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            id TEXT PRIMARY KEY,
+            room TEXT NOT NULL,
+            sender_id TEXT,
+            body TEXT NOT NULL,
+            sent_ms BIGINT NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_chat_messages_room_sent ON chat_messages(room, sent_ms, id)",
+    ]),
+    # Short-lived relay log for cross-worker pub/sub (see pubsub.py)
+    (11, "pubsub messages", [
+        """
+        CREATE TABLE IF NOT EXISTS pubsub_messages (
+            seq {serial},
+            channel TEXT NOT NULL,
+            origin TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_ms BIGINT NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_pubsub_messages_created ON pubsub_messages(created_ms)",
+    ]),
+    # Instance/submission state changes for the push feed; seq is the resume cursor
+    (12, "event log", [
+        """
+        CREATE TABLE IF NOT EXISTS events (
+            seq {serial},
+            topic TEXT NOT NULL,
+            user_id TEXT,
+            payload TEXT NOT NULL,
+            created_ms BIGINT NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_events_user_seq ON events(user_id, seq)",
+        "CREATE INDEX IF NOT EXISTS idx_events_created ON events(created_ms)",
+    ]),
+    # Write counters behind the list ETags, shared by every API worker (see db.py)
+    (13, "data versions", [
+        """
+        CREATE TABLE IF NOT EXISTS data_versions (
+            scope TEXT PRIMARY KEY,
+            version BIGINT NOT NULL
+        )
+        """,
+    ]),
+]
+
+
+def migrate(engine, conn):
+    """
+    Apply all pending migrations in one transaction on `conn` and return the
+    versions applied. Concurrent replicas wait on the migration lock and then
+    find nothing left to do.
+    """
+    engine.begin(conn, immediate=True)
+    try:
+        engine.lock_migrations(conn)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at {timestamp} DEFAULT {now}
+            )
+        """.format(**engine.ddl))
+        applied = {row["version"] for row in conn.execute("SELECT version FROM schema_migrations")}
+
+        done = []
+        for version, name, steps in MIGRATIONS:
+            if version in applied:
+                continue
+            for step in steps:
+                if callable(step):
+                    step(engine, conn)
+                else:
+                    conn.execute(step.format(**engine.ddl))
+            conn.execute("INSERT INTO schema_migrations (version, name) VALUES (?, ?)", (version, name))
+            print(f"[db] Applied migration {version}: {name}")
+            done.append(version)
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+    return done
@@ -0,0 +1,152 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from passlib.context import CryptContext
+
+from .metrics import histogram, counter, gauge
+
+# ---------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------
+
+# argon2id cost of new hashes (defaults are passlib's). Stored hashes carry
+# their own parameters, so changing these never breaks a login; older hashes
+# are upgraded the next time their owner logs in.
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "65536"))  # KiB per hash
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "4"))
+# Processes hashing and verifying passwords for this API worker. They take
+# argon2 off the shared threadpool, so a login storm cannot starve spawn and
+# list requests. Each concurrent hash needs ARGON2_MEMORY_COST of RAM.
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Password jobs accepted at once (running + waiting for a process); beyond
+# this, login/register/reset answer 503 immediately instead of queueing
+PASSWORD_QUEUE_MAX = int(os.getenv("PASSWORD_QUEUE_MAX", str(PASSWORD_WORKERS * 8)))
+
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__rounds=ARGON2_TIME_COST,
+    argon2__memory_cost=ARGON2_MEMORY_COST,
+    argon2__parallelism=ARGON2_PARALLELISM,
+)
+
+PASSWORD_SECONDS = histogram(
+    "instadock_password_seconds",
+    "Password jobs from submission to result (queueing included), by operation.",
+    ("op",),
+)
+PASSWORD_REJECTED = counter(
+    "instadock_password_rejected",
+    "Password jobs refused with 503 because PASSWORD_QUEUE_MAX were in flight.",
+)
+
+
+class PasswordPoolBusy(RuntimeError):
+    """PASSWORD_QUEUE_MAX password jobs are already in flight."""
+
+
+# ---------------------------------------------------------
+# HASHING (runs in the pool processes, or inline)
+# ---------------------------------------------------------
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_and_update(password: str, hashed: str):
+    """(matches, new_hash); new_hash is set when the stored hash uses outdated parameters."""
+    return pwd_context.verify_and_update(password, hashed)
+
+
+# ---------------------------------------------------------
+# POOL
+# ---------------------------------------------------------
+
+_pool = None
+_pool_pid = None
+_lock = threading.Lock()
+_in_flight = 0
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    with _lock:
+        if _pool is None or _pool_pid != os.getpid():
+            if multiprocessing.current_process().daemon:
+                # Daemonic processes may not have children; a dedicated thread
+                # pool still keeps argon2 off the request threadpool
+                print("[passwords] Daemonic process: hashing on threads instead of processes")
+                _pool = ThreadPoolExecutor(PASSWORD_WORKERS, thread_name_prefix="password")
+            else:
+                # spawn: the workers import only this module, not the API, and
+                # never inherit the API's threads or DB connections
+                _pool = ProcessPoolExecutor(PASSWORD_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool
+    with _lock:
+        if _pool is pool:
+            _pool = None  # a worker died (e.g. OOM); the next job starts a fresh pool
+
+
+def _job_done(future):
+    global _in_flight
+    with _lock:
+        _in_flight -= 1
+
+
+async def _run(op: str, fn, *args):
+    global _in_flight
+    with _lock:
+        if _in_flight >= PASSWORD_QUEUE_MAX:
+            PASSWORD_REJECTED.inc()
+            raise PasswordPoolBusy(f"{_in_flight} password jobs in flight")
+        _in_flight += 1
+
+    started = time.perf_counter()
+    try:
+        pool = _get_pool()
+        future = pool.submit(fn, *args)
+    except BaseException:
+        _job_done(None)
+        raise
+    # Counted until the process is actually free, even if the request is gone
+    future.add_done_callback(_job_done)
+    try:
+        return await asyncio.wrap_future(future)
+    except BrokenProcessPool as e:
+        _discard_pool(pool)
+        raise RuntimeError(f"Password worker crashed: {e}")
+    finally:
+        PASSWORD_SECONDS.observe(time.perf_counter() - started, op)
+
+
+async def hash_async(password: str) -> str:
+    """hash_password on the pool. Raises PasswordPoolBusy when saturated."""
+    return await _run("hash", hash_password, password)
+
+
+async def verify_async(password: str, hashed: str):
+    """verify_and_update on the pool. Raises PasswordPoolBusy when saturated."""
+    return await _run("verify", verify_and_update, password, hashed)
+
+
+def shutdown():
+    """Stop the pool processes (API worker shutdown)."""
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+gauge("instadock_password_jobs", "Password jobs running or waiting for a pool process.", lambda: _in_flight)
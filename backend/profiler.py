@@ -0,0 +1,264 @@
+import contextvars
+import cProfile
+import functools
+import inspect
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool as _starlette_run_in_threadpool
+
+from .auth import decode_token
+
+# ---------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------
+
+# Longest sampling session /admin/profile accepts
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+# Per-request cProfile results kept for /admin/profile/requests
+PROFILE_REQUESTS_KEPT = int(os.getenv("PROFILE_REQUESTS_KEPT", "20"))
+
+# Request header asking for a cProfile of that one request (admin tokens only)
+PROFILE_HEADER = b"x-profile"
+
+# Leaf frames of threads that are parked waiting for work; left out of
+# samples unless include_idle is set, so the output shows where CPU goes
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),           # concurrent.futures pool thread blocked on its queue
+    ("db_async.py", "_writer_loop"),    # waiting on the write queue
+    ("pubsub.py", "_take_outbox"),      # waiting on the relay outbox
+}
+
+
+# ---------------------------------------------------------
+# SAMPLING PROFILER (ALL THREADS)
+# ---------------------------------------------------------
+
+_sampling = threading.Lock()
+_labels = {}  # code object -> "func (file:line)", so repeated frames are cheap
+
+
+def _label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        label = _labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return label
+
+
+def _is_idle(frame) -> bool:
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES
+
+
+def sample_stacks(seconds: float, interval_ms: float = 10, include_idle: bool = False) -> dict:
+    """
+    Sample the Python stack of every thread (event loop, thread pools, the
+    cleanup worker...) every interval_ms for `seconds`. Returns
+    {"samples": n, "stacks": Counter("thread;outer;...;leaf" -> count)}.
+    Only one session runs at a time.
+    """
+    if not _sampling.acquire(blocking=False):
+        raise RuntimeError("A profiling session is already running")
+    try:
+        me = threading.get_ident()
+        stacks = Counter()
+        samples = 0
+        interval = interval_ms / 1000
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me or (not include_idle and _is_idle(frame)):
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_label(frame.f_code))
+                    frame = frame.f_back
+                labels.append(names.get(ident, f"thread-{ident}"))
+                stacks[";".join(reversed(labels))] += 1
+            samples += 1
+            time.sleep(interval)
+        return {"samples": samples, "stacks": stacks}
+    finally:
+        _sampling.release()
+
+
+def collapsed(stacks: Counter) -> str:
+    """Brendan Gregg's folded format (flamegraph.pl, speedscope, inferno)."""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+# ---------------------------------------------------------
+# PER-REQUEST cPROFILE
+# ---------------------------------------------------------
+
+class RequestProfile:
+    """cProfile data of one request, gathered from every thread it ran on."""
+
+    def __init__(self, method: str, path: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.started = time.time()
+        self.duration_ms = None
+        self.profiles = []
+        self._lock = threading.Lock()
+
+    def add(self, profile: cProfile.Profile):
+        with self._lock:
+            self.profiles.append(profile)
+
+    def stats(self) -> pstats.Stats:
+        stream = io.StringIO()
+        with self._lock:
+            profiles = list(self.profiles)
+        stats = pstats.Stats(profiles[0], stream=stream)
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return stats
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "started": self.started,
+            "duration_ms": self.duration_ms,
+            "threads": len(self.profiles),
+        }
+
+
+_request_profile = contextvars.ContextVar("instadock_request_profile", default=None)
+_profiling_thread = threading.local()
+_request_profiling = threading.Lock()  # cProfile is per thread: one profiled request at a time
+_request_profiles = deque(maxlen=PROFILE_REQUESTS_KEPT)
+
+
+def profile_call(fn, *args, **kwargs):
+    """
+    Call fn; if the current request is being profiled, under a cProfile whose
+    stats are merged into the request's profile. Used for work the request
+    hands to other threads.
+    """
+    request = _request_profile.get()
+    if request is None or getattr(_profiling_thread, "active", False):
+        return fn(*args, **kwargs)
+    profile = cProfile.Profile()
+    _profiling_thread.active = True
+    try:
+        return profile.runcall(fn, *args, **kwargs)
+    finally:
+        _profiling_thread.active = False
+        request.add(profile)
+
+
+async def run_in_threadpool(fn, *args, **kwargs):
+    """starlette's run_in_threadpool, with fn included in a per-request profile."""
+    return await _starlette_run_in_threadpool(profile_call, fn, *args, **kwargs)
+
+
+class ProfiledRoute(APIRoute):
+    """APIRoute whose sync endpoints are included in a per-request profile (they run on a worker thread)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        endpoint = self.dependant.call
+        if not inspect.iscoroutinefunction(endpoint):
+            @functools.wraps(endpoint)
+            def profiled_endpoint(*call_args, **call_kwargs):
+                return profile_call(endpoint, *call_args, **call_kwargs)
+            self.dependant.call = profiled_endpoint
+
+
+def _is_admin(scope) -> bool:
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            parts = value.decode("latin-1").split()
+            if len(parts) != 2 or parts[0].lower() != "bearer":
+                return False
+            try:
+                return decode_token(parts[1])["role"] == "admin"
+            except Exception:
+                return False
+    return False
+
+
+class ProfileMiddleware:
+    """
+    ASGI middleware: a request sent by an admin with "X-Profile: 1" runs under
+    cProfile (its event-loop part here, its thread-pool parts through
+    profile_call) and its response carries X-Profile-Id, the key of the
+    result under /admin/profile/requests. The event-loop part also records
+    whatever other requests ran on the loop meanwhile, so profile on a quiet
+    worker where possible.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not any(name == PROFILE_HEADER for name, _ in scope["headers"]):
+            return await self.app(scope, receive, send)
+        if not _is_admin(scope):
+            return await self.app(scope, receive, send)
+        if not _request_profiling.acquire(blocking=False):
+            return await self.app(scope, receive, self._with_headers(send, [(b"x-profile-error", b"busy")]))
+
+        request = RequestProfile(scope["method"], scope["path"])
+        token = _request_profile.set(request)
+        loop_profile = cProfile.Profile()
+        started = time.perf_counter()
+        loop_profile.enable()
+        try:
+            await self.app(scope, receive, self._with_headers(send, [(b"x-profile-id", request.id.encode())]))
+        finally:
+            loop_profile.disable()
+            request.duration_ms = round((time.perf_counter() - started) * 1000, 1)
+            request.add(loop_profile)
+            _request_profile.reset(token)
+            _request_profiles.append(request)
+            _request_profiling.release()
+
+    @staticmethod
+    def _with_headers(send, headers):
+        async def wrapped(message):
+            if message["type"] == "http.response.start":
+                message = dict(message, headers=list(message.get("headers", [])) + headers)
+            await send(message)
+        return wrapped
+
+
+def recent_request_profiles():
+    return [r.summary() for r in reversed(list(_request_profiles))]
+
+
+def get_request_profile(profile_id: str):
+    for request in list(_request_profiles):
+        if request.id == profile_id:
+            return request
+    return None
+
+
+def render_stats(request: RequestProfile, sort: str = "cumulative", limit: int = 60) -> str:
+    """pstats report of a request profile."""
+    stats = request.stats()
+    stats.stream.write(f"{request.method} {request.path} — {request.duration_ms} ms, {len(request.profiles)} thread(s)\n")
+    stats.sort_stats(sort).print_stats(limit)
+    return stats.stream.getvalue()
+
+
+def dump_stats(request: RequestProfile) -> bytes:
+    """The profile in pstats' binary format (snakeviz, pstats.Stats(path))."""
+    stats = request.stats()
+    return marshal.dumps(stats.stats)
@@ -0,0 +1,151 @@
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+
+from .db import append_pubsub_messages, read_pubsub_messages, last_pubsub_seq, prune_pubsub_messages
+
+# ---------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------
+
+# "db": relay through the shared database so every worker process (and every
+# replica on a shared Postgres) sees each message; "local": this process only.
+PUBSUB_BACKEND = os.getenv("PUBSUB_BACKEND", "db")
+# How often a worker looks for messages published by the others (upper bound
+# on the added cross-worker latency)
+PUBSUB_POLL_MS = float(os.getenv("PUBSUB_POLL_MS", "50"))
+# Relay rows older than this are deleted; a worker stalled for longer misses them
+PUBSUB_RETENTION_SECONDS = float(os.getenv("PUBSUB_RETENTION_SECONDS", "60"))
+PUBSUB_PRUNE_INTERVAL = 10
+
+
+# ---------------------------------------------------------
+# BROKERS
+# ---------------------------------------------------------
+
+class LocalBroker:
+    """
+    In-process broker. Subscribers are called on the event loop they
+    subscribed from; publishing from that loop delivers synchronously.
+    """
+
+    def __init__(self):
+        self._subscribers = {}  # channel -> [(loop, callback)]
+
+    def subscribe(self, channel: str, callback):
+        """Call `callback(payload)` on the running event loop for every message on `channel`."""
+        handle = (asyncio.get_running_loop(), callback)
+        self._subscribers.setdefault(channel, []).append(handle)
+        return handle
+
+    def unsubscribe(self, channel: str, handle):
+        try:
+            self._subscribers.get(channel, []).remove(handle)
+        except ValueError:
+            pass
+
+    def publish(self, channel: str, payload: dict):
+        """Deliver a JSON-serialisable payload to every subscriber of `channel`."""
+        self._deliver(channel, payload)
+
+    def _deliver(self, channel, payload):
+        try:
+            current = asyncio.get_running_loop()
+        except RuntimeError:
+            current = None
+        for loop, callback in list(self._subscribers.get(channel, ())):
+            if loop is current:
+                callback(payload)
+            elif not loop.is_closed():
+                loop.call_soon_threadsafe(callback, payload)
+
+
+class DatabaseBroker(LocalBroker):
+    """
+    Local delivery plus a relay through the pubsub_messages table, which every
+    worker sharing the database tails. One thread per process writes outgoing
+    messages in batches and polls for the other workers' messages.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.origin = uuid.uuid4().hex
+        self._outbox = queue.SimpleQueue()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def subscribe(self, channel: str, callback):
+        self._ensure_relay()
+        return super().subscribe(channel, callback)
+
+    def publish(self, channel: str, payload: dict):
+        super().publish(channel, payload)  # this worker's subscribers right away
+        self._ensure_relay()
+        self._outbox.put((channel, self.origin, json.dumps(payload), int(time.time() * 1000)))
+
+    def _ensure_relay(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                # Started lazily, so a forked worker gets its own relay thread
+                self._pid = os.getpid()
+                self._outbox = queue.SimpleQueue()
+                self._thread = threading.Thread(target=self._relay, daemon=True, name="pubsub-relay")
+                self._thread.start()
+
+    def _take_outbox(self, timeout):
+        try:
+            rows = [self._outbox.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                rows.append(self._outbox.get_nowait())
+            except queue.Empty:
+                return rows
+
+    def _relay(self):
+        last_seq = None
+        next_prune = 0.0
+        while True:
+            try:
+                if last_seq is None:
+                    last_seq = last_pubsub_seq()  # only messages published from now on
+
+                # Waits for outgoing messages, at most one poll interval
+                rows = self._take_outbox(PUBSUB_POLL_MS / 1000)
+                if rows:
+                    append_pubsub_messages(rows)
+
+                while True:
+                    messages = read_pubsub_messages(last_seq)
+                    for m in messages:
+                        last_seq = m["seq"]
+                        if m["origin"] != self.origin:
+                            self._deliver(m["channel"], json.loads(m["payload"]))
+                    if len(messages) < 1000:
+                        break
+
+                if time.monotonic() >= next_prune:
+                    next_prune = time.monotonic() + PUBSUB_PRUNE_INTERVAL
+                    prune_pubsub_messages(int((time.time() - PUBSUB_RETENTION_SECONDS) * 1000))
+            except Exception as e:
+                print(f"[pubsub] Relay error: {e}")
+                time.sleep(1)
+
+
+def create_broker(backend: str = PUBSUB_BACKEND):
+    if backend == "db":
+        return DatabaseBroker()
+    if backend == "local":
+        return LocalBroker()
+    raise RuntimeError(f"Unknown PUBSUB_BACKEND: {backend}")
+
+
+broker = create_broker()
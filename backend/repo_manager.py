@@ -1,17 +1,28 @@
 import uuid
 import shutil
-import subprocess
 import os
 import zipfile
 from pathlib import Path
 import json
 import time 
+import hashlib
+import filecmp
+import threading
+from collections import Counter
+from contextlib import contextmanager
 
 from .db import (
     record_submission,
     update_submission_status,
+    update_submission_content,
+    record_submission_revision,
     get_submission,
+    find_approved_submission_by_hash,
 )
+from .git_runner import run_git as _git, create_branch, commit, head_sha
+from .events import emit as emit_event
+from . import tracing
+from .staging import stage_file, stage_tree
 
 # -------------------------------------------------------------------
 # CONFIG
@@ -23,42 +34,42 @@ WORKDIR.mkdir(parents=True, exist_ok=True)
 # Main monorepo where /submissions/ gets updated
 MAIN_REPO_URL = os.getenv("MAIN_REPO_URL", "https://github.com/k0w4lzk1/instaDock.git")
 
-# FIX: Define default Git identity for automated commits
-GIT_USER_NAME = os.getenv("GIT_USER_NAME", "InstaDock Automated Bot")
-GIT_USER_EMAIL = os.getenv("GIT_USER_EMAIL", "instadock@example.com")
+# Bounds for fetching user repos: wall-clock limit per fetch/checkout and
+# maximum size of the checked-out tree (also applied to extracted ZIPs).
+GIT_CLONE_TIMEOUT = int(os.getenv("GIT_CLONE_TIMEOUT", "120"))
+MAX_SUBMISSION_BYTES = int(os.getenv("MAX_SUBMISSION_MB", "500")) * 1024 * 1024
+
+# Fetched user repos are kept per (URL, ref) so re-submissions only fetch deltas
+USER_REPO_CACHE = WORKDIR / "repo_cache"
+USER_REPO_CACHE_MAX = int(os.getenv("USER_REPO_CACHE_MAX", "32"))
+USER_REPO_CACHE.mkdir(parents=True, exist_ok=True)
+
+
+# -------------------------------------------------------------------
+# EVENTS
+# -------------------------------------------------------------------
+
+def _publish_submission(sub_id: str, user_id: str, status: str, action: str):
+    """Push a submission state change to its owner's and the admins' event feeds."""
+    emit_event("submission", user_id, id=sub_id, status=status, action=action)
 
 
 # -------------------------------------------------------------------
 # SHELL HELPERS
 # -------------------------------------------------------------------
 
-def _git(*args, cwd=None):
+@contextmanager
+def _phase(timings: dict, name: str):
     """
-    Run a git command and throw errors cleanly.
+    Record the wall-clock duration (ms) of one submission phase into timings
+    (and as a span of the request's trace).
     """
-    print(f"[GIT] {' '.join(args)}")
-    
-    # CRITICAL FIX: Ensure author identity is set before any operation that writes history
+    started = time.perf_counter()
     try:
-        # Check if user.name is set locally in the repository (cwd)
-        subprocess.run(["git", "config", "user.name"], cwd=cwd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
-    except subprocess.CalledProcessError:
-        # If user.name is not set, set both name and email for the repository
-        print(f"[GIT] Setting identity to {GIT_USER_NAME} <{GIT_USER_EMAIL}>")
-        subprocess.run(["git", "config", "user.name", GIT_USER_NAME], cwd=cwd, check=True)
-        subprocess.run(["git", "config", "user.email", GIT_USER_EMAIL], cwd=cwd, check=True)
-
-    result = subprocess.run(
-        ["git", *args],
-        cwd=cwd,
-        text=True,
-        capture_output=True
-    )
-
-    if result.returncode != 0:
-        raise RuntimeError(f"Git error: {result.stderr}")
-
-    return result.stdout.strip()
+        with tracing.span(name):
+            yield
+    finally:
+        timings[name] = round((time.perf_counter() - started) * 1000, 1)
 
 
 # -------------------------------------------------------------------
@@ -76,6 +87,25 @@ def validate_zip_safe(path: Path):
             raise RuntimeError("ZIP contains unsafe path traversal")
 
 
+def _check_tree_size(path: Path, skip_dirs=(".git",)):
+    """
+    Refuse submissions whose checked-out contents exceed MAX_SUBMISSION_BYTES.
+    """
+    total = 0
+    for root, dirs, files in os.walk(path):
+        dirs[:] = [d for d in dirs if d not in skip_dirs]
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                continue
+            if total > MAX_SUBMISSION_BYTES:
+                raise RuntimeError(
+                    f"Submission exceeds the {MAX_SUBMISSION_BYTES // (1024 * 1024)} MB size limit"
+                )
+    return total
+
+
 # -------------------------------------------------------------------
 # MANIFEST
 # -------------------------------------------------------------------
@@ -95,61 +125,333 @@ def ensure_manifest(path: Path):
             json.dump(data, f, indent=2)
 
 
+# -------------------------------------------------------------------
+# CONTENT HASH (DEDUPLICATION)
+# -------------------------------------------------------------------
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _skip_git_dir(item: Path) -> bool:
+    """Top-level filter for cloned repos: everything except .git is submitted."""
+    return item.name == ".git"
+
+
+def _skip_hidden(item: Path) -> bool:
+    """Top-level filter for ZIP uploads: hidden files like .DS_Store are dropped."""
+    return item.name.startswith('.')
+
+
+def _submission_items(source_dir: Path, skip):
+    """
+    Top-level entries of source_dir that end up in the submission folder.
+    """
+    return sorted(
+        (item for item in source_dir.iterdir() if not skip(item)),
+        key=lambda item: item.name,
+    )
+
+
+def _submission_files(source_dir: Path, skip):
+    """
+    Every file of the submission as it is staged: symlinks, to files or to
+    directories, are entries of their own and never followed (see stage_tree),
+    so nothing outside source_dir is hashed or pushed.
+    """
+    files = []
+    for item in _submission_items(source_dir, skip):
+        if item.is_dir() and not item.is_symlink():
+            for root, dirs, names in os.walk(item):
+                for name in list(dirs):
+                    if os.path.islink(os.path.join(root, name)):
+                        dirs.remove(name)
+                        names.append(name)
+                files.extend(Path(root) / name for name in names)
+        else:
+            files.append(item)
+    return files
+
+
+def compute_tree_hash(source_dir: Path, skip) -> str:
+    """
+    Canonical SHA-256 of the submission contents.
+
+    Only relative paths, file bytes and the executable bit are hashed, in
+    sorted path order, so the result does not depend on mtimes, extraction
+    order or the temp directory the files were unpacked into.
+    """
+    digest = hashlib.sha256()
+    files = _submission_files(source_dir, skip)
+
+    for path in sorted(files, key=lambda p: p.relative_to(source_dir).as_posix()):
+        file_digest = hashlib.sha256()
+        if path.is_symlink():
+            # Staged as a link: its target path is the content
+            file_digest.update(os.readlink(path).encode("utf-8"))
+            mode = "l"
+        else:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                    file_digest.update(chunk)
+            mode = "x" if os.access(path, os.X_OK) else "-"
+
+        digest.update(path.relative_to(source_dir).as_posix().encode("utf-8"))
+        digest.update(b"\0" + mode.encode() + b"\0")
+        digest.update(file_digest.digest())
+
+    return digest.hexdigest()
+
+
+def _find_duplicate(user_id: str, content_hash: str):
+    """
+    Return an approved submission of the same user with identical contents,
+    whose branch and image_tag can be reused as-is.
+    """
+    duplicate = find_approved_submission_by_hash(user_id, content_hash)
+    if duplicate:
+        print(f"[DEDUP] Contents match approved submission {duplicate['id']} — reusing {duplicate['branch']}")
+    return duplicate
+
+
+def _copy_submission(source_dir: Path, target: Path, skip):
+    """
+    Stage the submitted files from source_dir into the monorepo target folder,
+    using reflinks/hardlinks where the filesystem allows instead of full copies.
+    """
+    used = Counter()
+    for item in _submission_items(source_dir, skip):
+        dest = target / item.name
+        if item.is_dir() and not item.is_symlink():
+            used += stage_tree(item, dest)
+        else:
+            used[stage_file(item, dest)] += 1
+    print(f"[STAGE] {dict(used)}")
+
+
+def _sync_submission(source_dir: Path, target: Path, skip):
+    """
+    Make target mirror the submitted files in source_dir, touching only what
+    changed: identical files are left alone and files missing from the new
+    upload are deleted. Git then only sees (and pushes) the changed blobs.
+    """
+    wanted = {path.relative_to(source_dir): path for path in _submission_files(source_dir, skip)}
+
+    # Drop what is no longer part of the submission first, deepest paths first
+    # so emptied directories can be removed as well. Stale symlinks go before
+    # anything is written below them.
+    for path in sorted(target.rglob("*"), key=lambda p: len(p.parts), reverse=True):
+        rel = path.relative_to(target)
+        if (path.is_symlink() or path.is_file()) and rel not in wanted:
+            path.unlink()
+        elif path.is_dir() and not path.is_symlink() and not any(path.iterdir()):
+            path.rmdir()
+
+    for rel, src in wanted.items():
+        dest = target / rel
+        if src.is_symlink():
+            if dest.is_symlink() and os.readlink(dest) == os.readlink(src):
+                continue
+        elif (
+            dest.is_file()
+            and not dest.is_symlink()
+            and os.access(dest, os.X_OK) == os.access(src, os.X_OK)
+            and filecmp.cmp(src, dest, shallow=False)
+        ):
+            continue
+        if dest.is_dir() and not dest.is_symlink():
+            shutil.rmtree(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        stage_file(src, dest)
+
+    # Re-create the default manifest if the new upload does not ship its own.
+    ensure_manifest(target)
+
+
+def _record_revision(mono_clone: Path, sub_id: str, content_hash: str, source: str, changed_files: int):
+    """
+    Store the commit that was just pushed as the next revision of the submission.
+    """
+    commit_sha = head_sha(mono_clone)
+    return record_submission_revision(sub_id, commit_sha, content_hash, source, changed_files)
+
+
+# -------------------------------------------------------------------
+# SOURCE PREPARATION
+# -------------------------------------------------------------------
+
+_cache_locks = {}
+_cache_locks_guard = threading.Lock()
+
+
+def _cache_lock(key: str) -> threading.Lock:
+    with _cache_locks_guard:
+        return _cache_locks.setdefault(key, threading.Lock())
+
+
+def _evict_user_repo_cache():
+    """
+    Keep at most USER_REPO_CACHE_MAX cached repos, dropping the least recently
+    used ones. Entries currently in use by another submission are skipped.
+    """
+    entries = sorted(
+        (p for p in USER_REPO_CACHE.iterdir() if p.is_dir()),
+        key=lambda p: p.stat().st_mtime,
+    )
+    for entry in entries[:max(0, len(entries) - USER_REPO_CACHE_MAX)]:
+        lock = _cache_lock(entry.name)
+        if lock.acquire(blocking=False):
+            try:
+                shutil.rmtree(entry, ignore_errors=True)
+            finally:
+                lock.release()
+
+
+def _validate_ref(ref: str):
+    """
+    Reject a user-supplied ref git could read as an option (--upload-pack=...)
+    or that is not a valid ref name. Commit SHAs pass as one-level names.
+    """
+    if ref.startswith("-"):
+        raise RuntimeError(f"Invalid ref: {ref!r}")
+    try:
+        _git("check-ref-format", "--allow-onelevel", ref)
+    except RuntimeError:
+        raise RuntimeError(f"Invalid ref: {ref!r}")
+
+
+@contextmanager
+def _user_repo_checkout(repo_url: str, ref: str = None, timings: dict = None):
+    """
+    Yield a checkout of repo_url at ref (default branch if None).
+
+    The checkout lives in a per-(URL, ref) cache, so repeated submissions of
+    the same repo only fetch what changed. Fetches are shallow blobless
+    partial clones bounded by GIT_CLONE_TIMEOUT, and the checked-out tree
+    must fit in MAX_SUBMISSION_BYTES. The entry stays locked while in use.
+    The fetch + checkout time is recorded as the "clone" phase in timings.
+    """
+    if ref:
+        _validate_ref(ref)
+    key = hashlib.sha256(f"{repo_url}#{ref or ''}".encode("utf-8")).hexdigest()[:24]
+    path = USER_REPO_CACHE / key
+
+    timings = {} if timings is None else timings
+
+    with _cache_lock(key):
+        with _phase(timings, "clone"):
+            try:
+                if not (path / ".git").exists():
+                    shutil.rmtree(path, ignore_errors=True)
+                    path.mkdir(parents=True)
+                    _git("init", "-q", cwd=path)
+                    _git("remote", "add", "origin", repo_url, cwd=path)
+                    # Partial clone: only the blobs of the checked-out commit are fetched
+                    _git("config", "remote.origin.promisor", "true", cwd=path)
+                    _git("config", "remote.origin.partialclonefilter", "blob:none", cwd=path)
+                    _evict_user_repo_cache()
+
+                _git("fetch", "--depth", "1", "--end-of-options", "origin", ref or "HEAD", cwd=path, timeout=GIT_CLONE_TIMEOUT)
+                _git("checkout", "-q", "--force", "FETCH_HEAD", cwd=path, timeout=GIT_CLONE_TIMEOUT)
+                _git("clean", "-q", "-fdx", cwd=path)
+                _check_tree_size(path)
+            except Exception:
+                # Never keep a half-fetched or oversized entry around
+                shutil.rmtree(path, ignore_errors=True)
+                raise
+
+        os.utime(path)
+        yield path
+
+
+def _extract_zip(file, extract_dir: Path) -> Path:
+    """
+    Extract an uploaded ZIP into extract_dir and return the directory holding
+    the actual submission contents.
+    """
+    extract_dir.mkdir(parents=True, exist_ok=True)
+
+    with zipfile.ZipFile(file.file, "r") as z:
+        # Check the declared sizes first so a ZIP bomb never hits the disk
+        if sum(info.file_size for info in z.infolist()) > MAX_SUBMISSION_BYTES:
+            raise RuntimeError(
+                f"Submission exceeds the {MAX_SUBMISSION_BYTES // (1024 * 1024)} MB size limit"
+            )
+        z.extractall(extract_dir)
+
+    validate_zip_safe(extract_dir)
+
+    # --- FIX: Determine the actual source directory (Handles zipping the parent folder) ---
+    extracted_items = list(p for p in extract_dir.iterdir() if not p.name.startswith('.'))
+    source_dir = extract_dir
+
+    if len(extracted_items) == 1 and extracted_items[0].is_dir():
+        print(f"[ZIP] Found single root directory: {extracted_items[0].name}. Using its contents.")
+        source_dir = extracted_items[0]
+    # --- END FIX ---
+
+    return source_dir
+
+
 # -------------------------------------------------------------------
 # CREATE FROM REPO
 # -------------------------------------------------------------------
 
 def create_branch_from_repo(user_id: str, repo_url: str, ref: str = None):
     """
-    Clone user repo, copy its contents into:
+    Fetch user repo, copy its contents into:
     submissions/<full_user_uuid>/<full_submission_uuid>/
     inside the main monorepo.
+
+    If the user already has an approved submission with identical contents,
+    that submission is returned instead of creating a new branch and image.
+    Returns (submission_id, branch, status).
     """
     sub_id = str(uuid.uuid4())
     branch = f"submission/{user_id[:8]}/{sub_id[:8]}"
 
     # Temp paths
-    user_clone = WORKDIR / f"user_{sub_id}"
     mono_clone = WORKDIR / f"mono_{sub_id}"
+    timings = {}
 
     try:
-        # Clone user repo
-        _git("clone", "--depth", "1", repo_url, str(user_clone))
-        if ref:
-            _git("checkout", ref, cwd=user_clone)
+        # Fetch user repo (cached per URL/ref, locked until the copy is done)
+        with _user_repo_checkout(repo_url, ref, timings) as user_clone:
+            content_hash = compute_tree_hash(user_clone, _skip_git_dir)
+            duplicate = _find_duplicate(user_id, content_hash)
+            if duplicate:
+                return duplicate["id"], duplicate["branch"], duplicate["status"]
 
-        # Clone monorepo
-        _git("clone", "--depth", "1", MAIN_REPO_URL, str(mono_clone))
-        _git("checkout", "-b", branch, cwd=mono_clone)
+            # Clone monorepo
+            with _phase(timings, "mono_clone"):
+                _git("clone", "--depth", "1", MAIN_REPO_URL, str(mono_clone))
+                create_branch(mono_clone, branch)
 
-        # Build target path
-        target = mono_clone / "submissions" / user_id / sub_id
-        target.mkdir(parents=True, exist_ok=True)
+            # Build target path
+            target = mono_clone / "submissions" / user_id / sub_id
+            target.mkdir(parents=True, exist_ok=True)
 
-        ensure_manifest(target)
+            ensure_manifest(target)
 
-        # Copy user repo contents
-        for item in user_clone.iterdir():
-            if item.name == ".git":
-                continue
-            dest = target / item.name
-            if item.is_dir():
-                shutil.copytree(item, dest, dirs_exist_ok=True)
-            else:
-                shutil.copy2(item, dest)
+            # Copy user repo contents
+            with _phase(timings, "copy"):
+                _copy_submission(user_clone, target, _skip_git_dir)
 
         # Commit and push
-        _git("add", ".", cwd=mono_clone)
-        _git("commit", "-m", f"Add submission repo ({repo_url})", cwd=mono_clone)
-        _git("push", "origin", branch, cwd=mono_clone)
+        with _phase(timings, "commit"):
+            _git("add", ".", cwd=mono_clone)
+            commit(mono_clone, f"Add submission repo ({repo_url})")
+        with _phase(timings, "push"):
+            _git("push", "origin", branch, cwd=mono_clone)
 
         # Record in DB
-        record_submission(sub_id, user_id, branch, "pending", repo_url)
+        record_submission(sub_id, user_id, branch, "pending", repo_url, content_hash, timings)
+        _record_revision(mono_clone, sub_id, content_hash, repo_url, None)
+        _publish_submission(sub_id, user_id, "pending", "created")
+        print(f"[SUBMIT] {sub_id} phase timings (ms): {timings}")
 
-        return sub_id, branch
+        return sub_id, branch, "pending"
 
     finally:
-        shutil.rmtree(user_clone, ignore_errors=True)
         shutil.rmtree(mono_clone, ignore_errors=True)
 
 
@@ -162,35 +464,31 @@ def create_branch_from_zip(user_id: str, file):
     Extract uploaded ZIP and insert into:
     submissions/<user_id>/<submission_id>
     inside monorepo.
+
+    Byte-identical re-uploads of an approved submission are deduplicated
+    the same way as in create_branch_from_repo. Returns (submission_id, branch, status).
     """
     sub_id = str(uuid.uuid4())
     branch = f"submission/{user_id[:8]}/{sub_id[:8]}"
 
     zip_extract_dir = WORKDIR / f"zip_{sub_id}"
     mono_clone = WORKDIR / f"mono_{sub_id}"
+    timings = {}
 
     try:
-        zip_extract_dir.mkdir(parents=True, exist_ok=True)
-
         # Extract ZIP
-        with zipfile.ZipFile(file.file, "r") as z:
-            z.extractall(zip_extract_dir)
-
-        validate_zip_safe(zip_extract_dir)
-        
-        # --- FIX: Determine the actual source directory (Handles zipping the parent folder) ---
-        extracted_items = list(p for p in zip_extract_dir.iterdir() if not p.name.startswith('.'))
-        source_dir = zip_extract_dir
-        
-        if len(extracted_items) == 1 and extracted_items[0].is_dir():
-            print(f"[ZIP] Found single root directory: {extracted_items[0].name}. Using its contents.")
-            source_dir = extracted_items[0]
-        # --- END FIX ---
+        with _phase(timings, "extract"):
+            source_dir = _extract_zip(file, zip_extract_dir)
 
+        content_hash = compute_tree_hash(source_dir, _skip_hidden)
+        duplicate = _find_duplicate(user_id, content_hash)
+        if duplicate:
+            return duplicate["id"], duplicate["branch"], duplicate["status"]
 
         # Clone monorepo
-        _git("clone", "--depth", "1", MAIN_REPO_URL, str(mono_clone))
-        _git("checkout", "-b", branch, cwd=mono_clone)
+        with _phase(timings, "mono_clone"):
+            _git("clone", "--depth", "1", MAIN_REPO_URL, str(mono_clone))
+            create_branch(mono_clone, branch)
 
         target = mono_clone / "submissions" / user_id / sub_id
         target.mkdir(parents=True, exist_ok=True)
@@ -199,26 +497,127 @@ def create_branch_from_zip(user_id: str, file):
         # so user's own instadock.json isn't overwritten if it exists.
         ensure_manifest(target)
 
-        # Copy actual source files (from source_dir) into the target directory
-        for item in source_dir.iterdir():
-            # Skip hidden files like .DS_Store
-            if item.name.startswith('.'):
-                continue
-            
-            dest = target / item.name
-            if item.is_dir():
-                shutil.copytree(item, dest, dirs_exist_ok=True)
-            else:
-                shutil.copy2(item, dest)
+        # Copy actual source files (from source_dir) into the target directory,
+        # skipping hidden files like .DS_Store
+        with _phase(timings, "copy"):
+            _copy_submission(source_dir, target, _skip_hidden)
 
         # Commit and push
-        _git("add", ".", cwd=mono_clone)
-        _git("commit", "-m", f"Add ZIP submission ({user_id})", cwd=mono_clone)
+        with _phase(timings, "commit"):
+            _git("add", ".", cwd=mono_clone)
+            commit(mono_clone, f"Add ZIP submission ({user_id})")
+        with _phase(timings, "push"):
+            _git("push", "origin", branch, cwd=mono_clone)
+
+        record_submission(sub_id, user_id, branch, "pending", "zip_upload", content_hash, timings)
+        _record_revision(mono_clone, sub_id, content_hash, "zip_upload", None)
+        _publish_submission(sub_id, user_id, "pending", "created")
+        print(f"[SUBMIT] {sub_id} phase timings (ms): {timings}")
+
+        return sub_id, branch, "pending"
+
+    finally:
+        shutil.rmtree(zip_extract_dir, ignore_errors=True)
+        shutil.rmtree(mono_clone, ignore_errors=True)
+
+
+# -------------------------------------------------------------------
+# UPDATE EXISTING SUBMISSION (DELTA RE-SUBMISSION)
+# -------------------------------------------------------------------
+
+def _update_submission(sub: dict, source_dir: Path, skip, source: str, mono_clone: Path, timings: dict):
+    """
+    Diff source_dir against the submission subtree on its existing branch and
+    push the difference as a new commit on that same branch.
+
+    Changed contents need a fresh review, so the submission goes back to
+    'pending' and the APPROVED marker is dropped from the branch.
+    Returns (submission_id, branch, status).
+    """
+    sub_id = sub["id"]
+    branch = sub["branch"]
+
+    content_hash = compute_tree_hash(source_dir, skip)
+    if content_hash == sub.get("content_hash"):
+        print(f"[UPDATE] Submission {sub_id} unchanged — nothing to push.")
+        return sub_id, branch, sub["status"]
+
+    # Only the submission branch is needed, and only its tip
+    with _phase(timings, "mono_clone"):
+        _git("clone", "--depth", "1", "--single-branch", "--branch", branch, MAIN_REPO_URL, str(mono_clone))
+
+    target = mono_clone / "submissions" / sub["user_id"] / sub_id
+    target.mkdir(parents=True, exist_ok=True)
+    with _phase(timings, "copy"):
+        _sync_submission(source_dir, target, skip)
+
+    if (mono_clone / "APPROVED").exists():
+        _git("rm", "-q", "APPROVED", cwd=mono_clone)
+
+    with _phase(timings, "commit"):
+        _git("add", "-A", cwd=mono_clone)
+        changes = _git("status", "--porcelain", cwd=mono_clone)
+        if changes:
+            commit(mono_clone, f"Update submission {sub_id} ({source})")
+
+    if not changes:
+        # Hash differs only because the DB predates content hashing.
+        update_submission_content(sub_id, content_hash, source, status=sub["status"])
+        return sub_id, branch, sub["status"]
+
+    changed_files = len(changes.splitlines())
+    with _phase(timings, "push"):
         _git("push", "origin", branch, cwd=mono_clone)
 
-        record_submission(sub_id, user_id, branch, "pending", "zip_upload")
+    update_submission_content(sub_id, content_hash, source, status="pending", timings=timings)
+    revision = _record_revision(mono_clone, sub_id, content_hash, source, changed_files)
+    _publish_submission(sub_id, sub["user_id"], "pending", "updated")
+    print(f"[UPDATE] Submission {sub_id} → revision {revision} ({changed_files} changed paths), timings (ms): {timings}")
 
-        return sub_id, branch
+    return sub_id, branch, "pending"
+
+
+def _updatable_submission(sub_id: str) -> dict:
+    sub = get_submission(sub_id)
+    if not sub:
+        raise RuntimeError("Submission not found")
+    if sub["status"] not in ("pending", "approved"):
+        raise RuntimeError(f"Submission is {sub['status']} and can no longer be updated")
+    return sub
+
+
+def update_submission_from_repo(sub_id: str, repo_url: str, ref: str = None):
+    """
+    Re-submit an existing submission from a Git repo as a new revision on its branch.
+    """
+    sub = _updatable_submission(sub_id)
+
+    mono_clone = WORKDIR / f"mono_{sub_id}_{uuid.uuid4().hex[:8]}"
+    timings = {}
+
+    try:
+        with _user_repo_checkout(repo_url, ref, timings) as user_clone:
+            return _update_submission(sub, user_clone, _skip_git_dir, repo_url, mono_clone, timings)
+
+    finally:
+        shutil.rmtree(mono_clone, ignore_errors=True)
+
+
+def update_submission_from_zip(sub_id: str, file):
+    """
+    Re-submit an existing submission from a ZIP upload as a new revision on its branch.
+    """
+    sub = _updatable_submission(sub_id)
+
+    run_id = uuid.uuid4().hex[:8]
+    zip_extract_dir = WORKDIR / f"zip_{sub_id}_{run_id}"
+    mono_clone = WORKDIR / f"mono_{sub_id}_{run_id}"
+    timings = {}
+
+    try:
+        with _phase(timings, "extract"):
+            source_dir = _extract_zip(file, zip_extract_dir)
+        return _update_submission(sub, source_dir, _skip_hidden, "zip_upload", mono_clone, timings)
 
     finally:
         shutil.rmtree(zip_extract_dir, ignore_errors=True)
@@ -244,18 +643,18 @@ def approve_submission(sub_id: str):
     approve_clone = WORKDIR / f"approve_{sub_id}"
 
     try:
-        _git("clone", MAIN_REPO_URL, str(approve_clone))
-        _git("fetch", "origin", branch, cwd=approve_clone)
-        _git("checkout", branch, cwd=approve_clone)
+        # Only the tip of the submission branch is needed to add the marker
+        _git("clone", "--depth", "1", "--single-branch", "--branch", branch, MAIN_REPO_URL, str(approve_clone))
 
         # Add APPROVED marker
         (approve_clone / "APPROVED").write_text("approved=true\n")
 
         _git("add", "APPROVED", cwd=approve_clone)
-        _git("commit", "-m", f"Approve submission {sub_id}", cwd=approve_clone)
+        commit(approve_clone, f"Approve submission {sub_id}")
         _git("push", "origin", branch, cwd=approve_clone)
 
         update_submission_status(sub_id, "approved")
+        _publish_submission(sub_id, sub["user_id"], "approved", "approved")
 
     finally:
         shutil.rmtree(approve_clone, ignore_errors=True)
@@ -265,39 +664,43 @@ def approve_submission(sub_id: str):
 # REJECT SUBMISSION (FIXED ERROR HANDLING)
 # -------------------------------------------------------------------
 
+def _remote_ops_repo() -> Path:
+    """
+    Empty bare repo used as the working directory for commands that only talk
+    to the remote (git push needs *some* repository). Created once.
+    """
+    path = WORKDIR / "remote_ops.git"
+    if not (path / "HEAD").exists():
+        _git("init", "--bare", "-q", str(path))
+    return path
+
+
 def reject_submission(sub_id: str):
     sub = get_submission(sub_id)
     if not sub:
         raise RuntimeError("Submission not found")
 
     branch = sub["branch"]
-    reject_clone = WORKDIR / f"reject_{sub_id}"
 
+    # Branch lookup and deletion talk to the remote directly; no clone is needed.
+    remote_ops = _remote_ops_repo()
     try:
-        _git("clone", MAIN_REPO_URL, str(reject_clone))
-        _git("fetch", "origin", "--all", cwd=reject_clone)
-
-        # Delete branch if it exists
-        exists = subprocess.run(
-            ["git", "ls-remote", "--heads", "origin", branch],
-            cwd=reject_clone,
-            capture_output=True,
-            text=True
-        )
-
-        if exists.stdout.strip():
-            # CRITICAL FIX: Wrap push delete in try/except to avoid crashing the worker
-            # if the branch was already deleted manually or by another worker.
-            try:
-                _git("push", "origin", "--delete", branch, cwd=reject_clone)
-            except RuntimeError as e:
-                # If push fails, log it but continue to update DB status
-                print(f"[GIT] Warning: Failed to delete remote branch {branch}: {e}")
-                
-        update_submission_status(sub_id, "rejected")
-
-    finally:
-        shutil.rmtree(reject_clone, ignore_errors=True)
+        exists = _git("ls-remote", "--heads", MAIN_REPO_URL, branch)
+    except RuntimeError as e:
+        print(f"[GIT] Warning: Could not query remote branch {branch}: {e}")
+        exists = ""
+
+    if exists:
+        # CRITICAL FIX: Wrap push delete in try/except to avoid crashing the worker
+        # if the branch was already deleted manually or by another worker.
+        try:
+            _git("push", MAIN_REPO_URL, "--delete", branch, cwd=remote_ops)
+        except RuntimeError as e:
+            # If push fails, log it but continue to update DB status
+            print(f"[GIT] Warning: Failed to delete remote branch {branch}: {e}")
+
+    update_submission_status(sub_id, "rejected")
+    _publish_submission(sub_id, sub["user_id"], "rejected", "rejected")
 
 # -------------------------------------------------------------------
 # PERMANENTLY DELETE SUBMISSION (New - Calls reject logic + removes DB entry)
@@ -319,5 +722,6 @@ def delete_submission(sub_id: str):
     from .db import delete_submission as db_delete_submission
     # Ensure db.py has delete_submission function
     db_delete_submission(sub_id)
+    _publish_submission(sub_id, sub["user_id"], "deleted", "deleted")
 
     return True
\ No newline at end of file
@@ -0,0 +1,151 @@
+import errno
+import os
+import shutil
+from collections import Counter
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX hosts: reflinks are simply never attempted
+    fcntl = None
+
+# -------------------------------------------------------------------
+# CONFIG
+# -------------------------------------------------------------------
+
+# Strategies tried in order for every file. Reflinks share extents copy-on-write,
+# hardlinks share the inode, copy_range lets the kernel copy without a trip
+# through userspace, chunked is the portable read/write fallback.
+STRATEGIES = ("reflink", "hardlink", "copy_range", "chunked")
+
+# Hardlinks alias the source inode. That is safe for submission staging because
+# sources (ZIP extracts, cached checkouts) are only ever replaced, never written
+# in place, but it can be switched off.
+ALLOW_HARDLINKS = os.getenv("STAGING_ALLOW_HARDLINKS", "1") == "1"
+
+CHUNK_SIZE = 8 * 1024 * 1024
+
+FICLONE = 0x40049409  # _IOW(0x94, 9, int) from linux/fs.h
+
+# errnos meaning "this strategy does not work between these filesystems"
+_UNSUPPORTED_ERRNOS = {
+    errno.EOPNOTSUPP, errno.ENOTSUP, errno.EXDEV, errno.EINVAL,
+    errno.ENOTTY, errno.ENOSYS, errno.EPERM, errno.EMLINK,
+}
+
+# (strategy, src_dev, dst_dev) combinations that already failed once
+_unsupported = set()
+
+
+# -------------------------------------------------------------------
+# STRATEGIES
+# -------------------------------------------------------------------
+
+def _reflink(src, dest):
+    if fcntl is None:
+        raise OSError(errno.ENOTSUP, "reflink not available")
+    with open(src, "rb") as fsrc, open(dest, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+
+def _hardlink(src, dest):
+    if not ALLOW_HARDLINKS:
+        raise OSError(errno.EPERM, "hardlinks disabled")
+    os.link(src, dest)
+
+
+def _copy_range(src, dest):
+    if not hasattr(os, "copy_file_range"):
+        raise OSError(errno.ENOSYS, "copy_file_range not available")
+    with open(src, "rb") as fsrc, open(dest, "wb") as fdst:
+        remaining = os.fstat(fsrc.fileno()).st_size
+        while remaining > 0:
+            copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), min(CHUNK_SIZE, remaining))
+            if copied == 0:
+                break
+            remaining -= copied
+
+
+def _chunked(src, dest):
+    with open(src, "rb") as fsrc, open(dest, "wb") as fdst:
+        shutil.copyfileobj(fsrc, fdst, CHUNK_SIZE)
+
+
+_STRATEGY_FUNCS = {
+    "reflink": _reflink,
+    "hardlink": _hardlink,
+    "copy_range": _copy_range,
+    "chunked": _chunked,
+}
+
+
+# -------------------------------------------------------------------
+# PUBLIC API
+# -------------------------------------------------------------------
+
+def stage_file(src, dest, strategies=STRATEGIES) -> str:
+    """
+    Place a copy of src at dest using the cheapest strategy the filesystem
+    supports and return the name of the strategy that was used.
+
+    An existing dest is unlinked first, so a previously hardlinked file is
+    replaced rather than written through.
+    """
+    src, dest = str(src), str(dest)
+    if os.path.lexists(dest):
+        os.unlink(dest)
+
+    if os.path.islink(src):
+        os.symlink(os.readlink(src), dest)
+        return "symlink"
+
+    src_dev = os.stat(src).st_dev
+    dst_dev = os.stat(os.path.dirname(dest) or ".").st_dev
+
+    for strategy in strategies:
+        key = (strategy, src_dev, dst_dev)
+        if key in _unsupported:
+            continue
+        try:
+            _STRATEGY_FUNCS[strategy](src, dest)
+        except OSError as e:
+            if os.path.lexists(dest):
+                os.unlink(dest)
+            if strategy == strategies[-1]:
+                raise
+            if e.errno in _UNSUPPORTED_ERRNOS:
+                _unsupported.add(key)
+            continue
+
+        if strategy != "hardlink":
+            shutil.copystat(src, dest)
+        return strategy
+
+    raise OSError(errno.ENOTSUP, f"No staging strategy could copy {src}")
+
+
+def stage_tree(src, dest, strategies=STRATEGIES) -> Counter:
+    """
+    Recursively stage the directory src into dest (merging into an existing
+    dest like copytree(dirs_exist_ok=True)). Symlinks are recreated as links.
+    Returns how many files each strategy handled.
+    """
+    src, dest = Path(src), Path(dest)
+    used = Counter()
+
+    for root, dirs, files in os.walk(src):
+        rel = Path(root).relative_to(src)
+        out_dir = dest / rel
+        out_dir.mkdir(parents=True, exist_ok=True)
+
+        for name in list(dirs):
+            if (Path(root) / name).is_symlink():
+                dirs.remove(name)
+                files.append(name)
+
+        for name in files:
+            used[stage_file(Path(root) / name, out_dir / name, strategies)] += 1
+
+        shutil.copystat(root, out_dir)
+
+    return used
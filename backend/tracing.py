@@ -0,0 +1,273 @@
+import contextvars
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+import urllib.request
+from collections import deque
+from contextlib import contextmanager
+
+# ---------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------
+
+# Completed traces kept in memory for /admin/traces (oldest are dropped)
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "200"))
+# Spans recorded per trace; a runaway loop cannot grow one trace without bound
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "500"))
+# OTLP/HTTP collector (e.g. http://localhost:4318); traces are also POSTed
+# there as JSON when set. Uses the standard OpenTelemetry variable names.
+OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "").rstrip("/")
+OTLP_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "instadock")
+# Traces waiting for the exporter; more are dropped rather than slowing requests
+OTLP_EXPORT_QUEUE = 1000
+OTLP_EXPORT_BATCH = 100
+OTLP_EXPORT_TIMEOUT = 5
+
+_current = contextvars.ContextVar("instadock_span", default=None)
+_completed = deque(maxlen=TRACE_BUFFER_SIZE)
+
+
+# ---------------------------------------------------------
+# SPANS
+# ---------------------------------------------------------
+
+class Trace:
+    """Spans of one operation (one spawn, one submission...), root first."""
+
+    def __init__(self):
+        self.trace_id = secrets.token_hex(16)
+        self.spans = []
+        self.dropped = 0
+
+
+class Span:
+    def __init__(self, trace: Trace, name: str, parent, attributes: dict):
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set(self, **attributes):
+        """Attach attributes known only once the work is under way (e.g. a container id)."""
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3) if self.end_ns else None,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+@contextmanager
+def _open(trace: Trace, name: str, parent, attributes: dict):
+    span = Span(trace, name, parent, attributes)
+    if len(trace.spans) < TRACE_MAX_SPANS:
+        trace.spans.append(span)
+    else:
+        trace.dropped += 1
+    token = _current.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        span.end_ns = time.time_ns()
+        _current.reset(token)
+        if parent is None:
+            _finish(trace)
+
+
+@contextmanager
+def trace(name: str, **attributes):
+    """
+    Root span of a traced operation (a child span if one is already open).
+    The trace is stored, and exported, when the root span ends.
+    """
+    parent = _current.get()
+    with _open(parent.trace if parent else Trace(), name, parent, attributes) as span:
+        yield span
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Child span of the active trace; does nothing (yields None) outside a
+    trace, so hot helpers can be instrumented unconditionally.
+    """
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    with _open(parent.trace, name, parent, attributes) as child:
+        yield child
+
+
+def active() -> bool:
+    return _current.get() is not None
+
+
+def current_trace_id():
+    span = _current.get()
+    return span.trace.trace_id if span is not None else None
+
+
+# ---------------------------------------------------------
+# BUFFER
+# ---------------------------------------------------------
+
+def _finish(trace: Trace):
+    _completed.append(trace)
+    if OTLP_ENDPOINT:
+        exporter.offer(trace)
+
+
+def _summary(trace: Trace) -> dict:
+    root = trace.spans[0]
+    return {
+        "trace_id": trace.trace_id,
+        "name": root.name,
+        "start_ns": root.start_ns,
+        "duration_ms": root.to_dict()["duration_ms"],
+        "error": root.error,
+        "spans": len(trace.spans),
+        "dropped_spans": trace.dropped,
+        "attributes": root.attributes,
+    }
+
+
+def recent_traces(limit: int = 50, name: str = None):
+    """Summaries of the latest completed traces, newest first."""
+    out = []
+    for trace in reversed(list(_completed)):
+        if name is None or trace.spans[0].name == name:
+            out.append(_summary(trace))
+            if len(out) >= limit:
+                break
+    return out
+
+
+def get_trace(trace_id: str):
+    """A completed trace with all its spans (offsets relative to the root), or None."""
+    for trace in list(_completed):
+        if trace.trace_id == trace_id:
+            root_start = trace.spans[0].start_ns
+            spans = []
+            for span in list(trace.spans):
+                entry = span.to_dict()
+                entry["offset_ms"] = round((span.start_ns - root_start) / 1e6, 3)
+                spans.append(entry)
+            return dict(_summary(trace), spans=spans)
+    return None
+
+
+# ---------------------------------------------------------
+# OTLP EXPORT
+# ---------------------------------------------------------
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(span: Span) -> dict:
+    out = {
+        "traceId": span.trace.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": 1,  # INTERNAL
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns or span.start_ns),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in span.attributes.items() if v is not None],
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+    }
+    if span.parent_id:
+        out["parentSpanId"] = span.parent_id
+    return out
+
+
+def otlp_payload(traces) -> dict:
+    """OTLP/HTTP JSON body (ExportTraceServiceRequest) for completed traces."""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": OTLP_SERVICE_NAME}}]},
+            "scopeSpans": [{
+                "scope": {"name": "instadock"},
+                "spans": [_otlp_span(s) for t in traces for s in list(t.spans)],
+            }],
+        }],
+    }
+
+
+class OTLPExporter:
+    """
+    Ships completed traces to OTLP_ENDPOINT/v1/traces from a background
+    thread, in batches. Export failures are logged and the batch is dropped.
+    """
+
+    def __init__(self, endpoint: str):
+        self.url = f"{endpoint}/v1/traces"
+        self._queue = queue.Queue(maxsize=OTLP_EXPORT_QUEUE)
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self.dropped = 0
+
+    def offer(self, trace: Trace):
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, daemon=True, name="otlp-export")
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < OTLP_EXPORT_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.export(batch)
+            except Exception as e:
+                print(f"[tracing] OTLP export of {len(batch)} traces failed: {e}")
+
+    def export(self, traces):
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(otlp_payload(traces)).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=OTLP_EXPORT_TIMEOUT) as response:
+            response.read()
+
+
+exporter = OTLPExporter(OTLP_ENDPOINT) if OTLP_ENDPOINT else None
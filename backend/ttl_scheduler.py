@@ -0,0 +1,128 @@
+import datetime
+import heapq
+import threading
+import time
+
+
+# ---------------------------------------------------------
+# DEADLINE HEAP
+# ---------------------------------------------------------
+
+class DeadlineScheduler:
+    """
+    Min-heap of instance TTL deadlines.
+
+    schedule()/cancel() are O(log n)/O(1); cancelled or superseded heap
+    entries are dropped lazily when they reach the top. wait_due() blocks
+    exactly until the earliest deadline (or until an earlier one is added).
+    All timestamps are naive UTC, like instances.expires_at.
+
+    Only the process running the elected cleanup worker keeps deadlines: the
+    heap is inactive (schedule/cancel are no-ops) until replace_all() loads
+    it, and deactivate() empties it when leadership is lost. The leader learns
+    about instances handled by other workers from the event log.
+    """
+
+    def __init__(self):
+        self._heap = []          # (expires_at, cid), may contain stale entries
+        self._deadlines = {}     # cid -> current expires_at (source of truth)
+        self._active = False
+        self._cond = threading.Condition()
+
+    @staticmethod
+    def _parse(expires_at):
+        if isinstance(expires_at, str):
+            return datetime.datetime.fromisoformat(expires_at)
+        return expires_at
+
+    def schedule(self, cid: str, expires_at):
+        """Add or move the deadline of cid."""
+        expires_at = self._parse(expires_at)
+        with self._cond:
+            if not self._active:
+                return
+            self._deadlines[cid] = expires_at
+            heapq.heappush(self._heap, (expires_at, cid))
+            if len(self._heap) > 2 * len(self._deadlines) + 64:
+                self._compact()
+            if self._heap[0] == (expires_at, cid):
+                self._cond.notify_all()
+
+    def cancel(self, cid: str):
+        """Forget the deadline of cid (no-op if it has none)."""
+        with self._cond:
+            self._deadlines.pop(cid, None)
+
+    def replace_all(self, rows):
+        """Reset (and activate) the heap from rows of {"cid", "expires_at"} (e.g. a DB resync)."""
+        deadlines = {}
+        for row in rows:
+            try:
+                deadlines[row["cid"]] = self._parse(row["expires_at"])
+            except (TypeError, ValueError):
+                print(f"[ttl] Invalid expires_at for {row['cid']} — not scheduled.")
+        with self._cond:
+            self._deadlines = deadlines
+            self._active = True
+            self._compact()
+            self._cond.notify_all()
+
+    def deactivate(self):
+        """Drop every deadline and ignore schedule() until the next replace_all()."""
+        with self._cond:
+            self._active = False
+            self._deadlines = {}
+            self._heap = []
+            self._cond.notify_all()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._deadlines)
+
+    def next_deadline(self):
+        with self._cond:
+            self._prune()
+            return self._heap[0][0] if self._heap else None
+
+    def wait_due(self, max_wait: float = None):
+        """
+        Block until at least one deadline has passed, then pop and return the
+        cids of all due instances. Returns [] if max_wait seconds pass first.
+        """
+        give_up = time.monotonic() + max_wait if max_wait is not None else None
+        with self._cond:
+            while True:
+                now = datetime.datetime.utcnow()
+                due = []
+                self._prune()
+                while self._heap and self._heap[0][0] <= now:
+                    _, cid = heapq.heappop(self._heap)
+                    del self._deadlines[cid]
+                    due.append(cid)
+                    self._prune()
+                if due:
+                    return due
+
+                timeout = (self._heap[0][0] - now).total_seconds() if self._heap else None
+                if give_up is not None:
+                    remaining = give_up - time.monotonic()
+                    if remaining <= 0:
+                        return []
+                    timeout = remaining if timeout is None else min(timeout, remaining)
+                self._cond.wait(timeout)
+
+    # --- internals (caller holds the lock) ---
+
+    def _prune(self):
+        heap = self._heap
+        while heap and self._deadlines.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+
+    def _compact(self):
+        self._heap = [(exp, cid) for cid, exp in self._deadlines.items()]
+        heapq.heapify(self._heap)
+
+
+# Process-wide scheduler: loaded and drained by the cleanup worker while this
+# process is the leader, fed by docker_manager and the event log meanwhile.
+scheduler = DeadlineScheduler()
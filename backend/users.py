@@ -1,18 +1,31 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
 from pydantic import BaseModel, validator
-from passlib.context import CryptContext
-import sqlite3
 import uuid
 import os
 import datetime
 
 # Import necessary dependencies and new DB functions
-from .db import DB_PATH, list_approved_submissions, get_user_by_username, create_user, save_password_reset_token, verify_and_clear_reset_token
+from .db import (
+    list_approved_submissions,
+    get_user_by_username,
+    get_admin_user,
+    create_admin_if_missing,
+    create_user,
+    update_user_password,
+    save_password_reset_token,
+    find_reset_token_user,
+    reset_password_with_token,
+)
 from .auth import create_token, require_user
+from .conditional import not_modified
+from .profiler import ProfiledRoute
+from . import db_async
+from .passwords import hash_password, hash_async, verify_async, PasswordPoolBusy
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+# Seconds a client is told to wait when the password pool is saturated
+PASSWORD_RETRY_AFTER = os.getenv("PASSWORD_RETRY_AFTER", "2")
 
 
 # ---------------------- AUTH MODELS (from models.py, simplified for users.py) ----------------------
@@ -44,22 +57,38 @@ class LoginReq(BaseModel):
 
 # ---------------------- AUTH UTILS ----------------------
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+# argon2 runs on the bounded process pool of passwords.py; these handlers are
+# async so no threadpool thread is held while a hash is computed.
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def hash_or_503(password: str) -> str:
+    try:
+        return await hash_async(password)
+    except PasswordPoolBusy:
+        raise _busy()
+
+async def verify_or_503(password: str, hashed: str):
+    try:
+        return await verify_async(password, hashed)
+    except PasswordPoolBusy:
+        raise _busy()
+
+def _busy():
+    return HTTPException(
+        status_code=503,
+        detail="Too many sign-ins in progress, please retry shortly.",
+        headers={"Retry-After": PASSWORD_RETRY_AFTER},
+    )
 
 
 # ---------------------- REGISTER ----------------------
 
 @router.post("/register")
-def register(req: RegisterReq):
-    if get_user_by_username(req.username):
+async def register(req: RegisterReq):
+    if await db_async.read(get_user_by_username, req.username):
         raise HTTPException(status_code=400, detail="Username already registered")
         
-    hashed = hash_password(req.password)
-    user_id = create_user(req.username, hashed)
+    hashed = await hash_or_503(req.password)
+    user_id = await db_async.write(create_user, req.username, hashed)
 
     # FIX: Creating a token upon registration for immediate login
     token = create_token(user_id, "user")
@@ -73,11 +102,17 @@ def register(req: RegisterReq):
 # ---------------------- LOGIN ----------------------
 
 @router.post("/login")
-def login(req: LoginReq):
-    db_user = get_user_by_username(req.username)
+async def login(req: LoginReq):
+    db_user = await db_async.read(get_user_by_username, req.username)
+    if not db_user:
+        raise HTTPException(401, "Invalid username or password")
 
-    if not db_user or not verify_password(req.password, db_user["password_hash"]):
+    valid, new_hash = await verify_or_503(req.password, db_user["password_hash"])
+    if not valid:
         raise HTTPException(401, "Invalid username or password")
+    if new_hash:
+        # Stored with older argon2 parameters; upgrade while we have the password
+        await db_async.write(update_user_password, db_user["id"], new_hash)
 
     token = create_token(db_user["id"], db_user["role"])
     return {
@@ -94,8 +129,11 @@ def read_user_me(user_data=Depends(require_user)):
     return user_data
 
 @router.get("/approved_submissions", dependencies=[Depends(require_user)])
-async def get_user_approved_submissions(user=Depends(require_user)):
+def get_user_approved_submissions(request: Request, response: Response, user=Depends(require_user)):
     """FIX 4: Lists approved submissions that can be spawned into an instance."""
+    cached = not_modified(request, response, "submissions", user["user_id"])
+    if cached:
+        return cached
     return list_approved_submissions(user["user_id"])
 
 
@@ -138,23 +176,22 @@ def forgot_password(req: RequestPasswordResetModel):
     }
 
 @router.post("/reset_password/{reset_token}")
-def reset_password(reset_token: str, req: ResetPasswordModel):
+async def reset_password(reset_token: str, req: ResetPasswordModel):
     """
     FIX 5: Verifies the token and updates the password.
     """
     
-    user_id = verify_and_clear_reset_token(reset_token)
-    
-    if not user_id:
+    # Cheap read-only check first, so a bad token never costs an argon2 hash
+    if not await db_async.read(find_reset_token_user, reset_token):
         # User not found, token expired, or token already used
         raise HTTPException(status_code=400, detail="Invalid or expired reset token.")
 
-    # 1. Update password
-    new_password_hash = hash_password(req.new_password)
-    
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute("UPDATE users SET password_hash=? WHERE id=?", (new_password_hash, user_id))
-        conn.commit()
+    # A saturated pool answers 503 here, before the token is used up
+    new_password_hash = await hash_or_503(req.new_password)
+
+    # Token cleared and password set together: neither can land without the other
+    if not await db_async.write(reset_password_with_token, reset_token, new_password_hash):
+        raise HTTPException(status_code=400, detail="Invalid or expired reset token.")
 
     return {"message": "Password successfully reset. You may now log in."}
 
@@ -165,22 +202,17 @@ def ensure_default_admin():
     """
     Creates a default admin if none exists.
     """
-    with sqlite3.connect(DB_PATH) as conn:
-        cur = conn.cursor()
-
-        cur.execute("SELECT id FROM users WHERE role='admin'")
-        admin = cur.fetchone()
-
-        if admin:
-            print("[InstaDock] Admin already exists.")
-            return
+    if get_admin_user():
+        print("[InstaDock] Admin already exists.")
+        return
 
-        user_id = str(uuid.uuid4())
-        username = "admin"
-        password = "admin123" 
-        role = "admin" 
-        hashed = hash_password(password)
+    username = "admin"
+    password = "admin123" 
+    hashed = hash_password(password)
 
-        create_user(username, hashed, role)
+    # Several workers may get here at once; only one of them creates the admin
+    if create_admin_if_missing(username, hashed) is None:
+        print("[InstaDock] Admin already exists.")
+        return
 
-        print("[InstaDock] Default admin created -> username='admin' password='admin123'")
\ No newline at end of file
+    print("[InstaDock] Default admin created -> username='admin' password='admin123'")
\ No newline at end of file
@@ -0,0 +1,207 @@
+"""
+Chat broadcast fan-out with one stalled client: sequential sends vs. backend.chat.
+
+    python -m bench.chat_fanout_bench --clients 1000 --messages 20
+
+Every client is an in-memory WebSocket stand-in whose send_text takes
+--send-ms; one of them never completes a send (a client that stopped reading
+with a full TCP window). "before" is the old ConnectionManager.broadcast,
+which awaits each socket in turn, so every message waits for the stalled
+socket (bounded here by --stall-timeout, otherwise forever). "after" uses
+backend.chat.ConnectionManager: broadcast only enqueues, each connection's
+writer drains its own queue, and the stalled client is dropped once its
+queue fills or a send times out (all clients are in one room here).
+
+"rooms" connects the same number of users, each in their own support room,
+plus --admins admins, and times publish() into one user's room: it costs the
+room's sockets plus the admins, independent of how many users are online.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+
+class FakeSocket:
+    def __init__(self, send_ms, stalled=False):
+        self.send_ms = send_ms
+        self.stalled = stalled
+        self.received = []   # (message, perf_counter at delivery)
+        self.closed = False
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        if self.stalled:
+            await asyncio.Event().wait()
+        if self.send_ms:
+            await asyncio.sleep(self.send_ms / 1000)
+        self.received.append((message, time.perf_counter()))
+
+    async def close(self):
+        self.closed = True
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * q))] * 1000, 2) if values else None
+
+
+def summarise(sockets, sent_at, elapsed, messages):
+    healthy = [s for s in sockets if not s.stalled]
+    latencies = [at - sent_at[m] for s in healthy for m, at in s.received]
+    delivered = sum(len(s.received) for s in healthy)
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "delivered": delivered,
+        "expected": len(healthy) * messages,
+        "latency_p50_ms": percentile(latencies, 0.50),
+        "latency_p99_ms": percentile(latencies, 0.99),
+        "latency_max_ms": percentile(latencies, 1.0),
+        "stalled_client_closed": any(s.closed for s in sockets if s.stalled),
+    }
+
+
+async def before(args):
+    sockets = [FakeSocket(args.send_ms, stalled=(i == 0)) for i in range(args.clients)]
+    sent_at = {}
+
+    async def broadcast(message):
+        # Old manager: one socket after the other on the caller's task
+        for ws in sockets:
+            try:
+                await asyncio.wait_for(ws.send_text(message), args.stall_timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    started = time.perf_counter()
+    for i in range(args.messages):
+        message = f"msg-{i}"
+        sent_at[message] = time.perf_counter()
+        await broadcast(message)
+        await asyncio.sleep(args.interval_ms / 1000)
+    return summarise(sockets, sent_at, time.perf_counter() - started, args.messages)
+
+
+async def after(args):
+    from backend import chat, pubsub
+
+    manager = chat.ConnectionManager(pubsub.LocalBroker())  # fan-out within one worker
+    sockets = [FakeSocket(args.send_ms, stalled=(i == 0)) for i in range(args.clients)]
+    for i, ws in enumerate(sockets):
+        await manager.connect(f"user-{i:05d}", ws, is_admin=True)
+    sent_at = {}
+
+    started = time.perf_counter()
+    enqueue = []
+    for i in range(args.messages):
+        message = f"msg-{i}"
+        sent_at[message] = t0 = time.perf_counter()
+        manager.publish(chat.ADMIN_ROOM, message)
+        enqueue.append(time.perf_counter() - t0)
+        await asyncio.sleep(args.interval_ms / 1000)
+
+    # Let the writers drain what is still queued
+    expected = (args.clients - 1) * args.messages
+    deadline = time.perf_counter() + 30
+    while time.perf_counter() < deadline:
+        if sum(len(s.received) for s in sockets if not s.stalled) >= expected:
+            break
+        await asyncio.sleep(0.01)
+    # The stalled client goes once its queue fills or its first send times out
+    deadline = time.perf_counter() + args.stall_timeout + 1
+    while time.perf_counter() < deadline and not sockets[0].closed:
+        await asyncio.sleep(0.01)
+
+    result = summarise(sockets, sent_at, time.perf_counter() - started, args.messages)
+    result["broadcast_call_p99_ms"] = percentile(enqueue, 0.99)
+    result["connections_left"] = len(manager.active_connections)
+    for sockets_of_user in list(manager.active_connections.values()):
+        for conn in list(sockets_of_user):
+            conn.close()
+    await manager.flush()
+    return result
+
+
+async def rooms(args):
+    from backend import chat, pubsub
+
+    manager = chat.ConnectionManager(pubsub.LocalBroker())  # fan-out within one worker
+    users = [FakeSocket(0) for _ in range(args.clients)]
+    admins = [FakeSocket(0) for _ in range(args.admins)]
+    for i, ws in enumerate(users):
+        await manager.connect(f"user-{i:05d}", ws)
+    for i, ws in enumerate(admins):
+        await manager.connect(f"admin-{i:03d}", ws, is_admin=True)
+
+    calls = []
+    for i in range(args.messages):
+        t0 = time.perf_counter()
+        manager.publish(chat.user_room(f"user-{i % args.clients:05d}"), f"msg-{i}")
+        calls.append(time.perf_counter() - t0)
+        await asyncio.sleep(args.interval_ms / 1000)
+    await asyncio.sleep(0.05)
+
+    result = {
+        "publish_call_p50_ms": percentile(calls, 0.50),
+        "publish_call_p99_ms": percentile(calls, 0.99),
+        "deliveries_per_message": sum(len(s.received) for s in users + admins) / args.messages,
+    }
+    for sockets_of_user in list(manager.active_connections.values()):
+        for conn in list(sockets_of_user):
+            conn.close()
+    await manager.flush()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--send-ms", type=float, default=0.0, help="per-send latency of healthy clients")
+    parser.add_argument("--interval-ms", type=float, default=10.0, help="pause between broadcasts")
+    parser.add_argument("--admins", type=int, default=5, help="online admins in the 'rooms' case")
+    parser.add_argument("--stall-timeout", type=float, default=1.0,
+                        help="per-send timeout in 'before' (the old code had none)")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    # Small queue and timeout so the stalled client is detected within the run
+    os.environ.setdefault("CHAT_SEND_QUEUE", "8")
+    os.environ.setdefault("CHAT_SEND_TIMEOUT", str(args.stall_timeout))
+    os.environ.setdefault("CHAT_HISTORY_SIZE", "4")  # replay on connect must fit the queue
+
+    workdir = Path(tempfile.mkdtemp(prefix="instadock_chat_bench_"))
+    os.environ["INSTADOCK_DB_PATH"] = str(workdir / "bench.db")  # chat history goes here
+    os.environ.pop("INSTADOCK_DB_URL", None)
+    try:
+        results = {
+            "before": asyncio.run(before(args)),
+            "after": asyncio.run(after(args)),
+            "rooms": asyncio.run(rooms(args)),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for case in ("before", "after"):
+        r = results[case]
+        print(f"{case:>7}: {r['delivered']}/{r['expected']} delivered in {r['elapsed_s']} s   "
+              f"latency p50 {r['latency_p50_ms']} ms  p99 {r['latency_p99_ms']} ms  max {r['latency_max_ms']} ms   "
+              f"stalled client closed: {r['stalled_client_closed']}")
+    print(f"  after: publish() call p99 {results['after']['broadcast_call_p99_ms']} ms, "
+          f"{results['after']['connections_left']} connections left")
+    r = results["rooms"]
+    print(f"  rooms: publish() to one user's room p50 {r['publish_call_p50_ms']} ms  p99 {r['publish_call_p99_ms']} ms, "
+          f"{r['deliveries_per_message']} deliveries per message")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({"args": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
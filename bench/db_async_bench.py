@@ -0,0 +1,103 @@
+"""
+Event-loop stall and write throughput: sync DB calls on the loop vs. backend.db_async.
+
+    python -m bench.db_async_bench --writes 2000 --concurrency 100
+
+"before" awaits nothing: each coroutine calls db.update_instance_status on the
+event loop (one commit per call). "after" awaits db_async.write, which runs
+the writes on the writer thread and commits them in batches. A ticker task
+measures how late the loop wakes up while the writes run.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+
+def seed(db, instances):
+    cids = [f"bench{i:06d}" for i in range(instances)]
+    with db.transaction() as conn:
+        conn.executemany("""
+            INSERT INTO instances (cid, user_id, submission_id, image, subdomain, port, expires_at, status)
+            VALUES (?, 'bench-user', NULL, 'bench:latest', 'localhost:0', NULL, '2099-01-01T00:00:00', 'running')
+        """, ((cid,) for cid in cids))
+    return cids
+
+
+async def ticker(lags, stop):
+    interval = 0.005
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+async def drive(write, cids, writes, concurrency):
+    lags, stop = [], asyncio.Event()
+    tick = asyncio.create_task(ticker(lags, stop))
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(cid):
+        async with sem:
+            await write(cid, random.choice(("running", "stopped")))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(random.choice(cids)) for _ in range(writes)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await tick
+
+    lags.sort()
+    return {
+        "writes_per_s": round(writes / elapsed),
+        "loop_lag_p99_ms": round(lags[int(len(lags) * 0.99) - 1] * 1000, 2) if lags else None,
+        "loop_lag_max_ms": round(lags[-1] * 1000, 2) if lags else None,
+        "ticks": len(lags),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--instances", type=int, default=1000)
+    parser.add_argument("--writes", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="instadock_db_async_bench_"))
+    os.environ["INSTADOCK_DB_PATH"] = str(workdir / "bench.db")
+    os.environ.pop("INSTADOCK_DB_URL", None)  # SQLite-specific bench
+    from backend import db, db_async  # imported late so they pick up the bench DB path
+
+    try:
+        cids = seed(db, args.instances)
+
+        async def before(cid, status):
+            db.update_instance_status(cid, status)
+
+        async def after(cid, status):
+            await db_async.write(db.update_instance_status, cid, status)
+
+        results = {
+            "before": asyncio.run(drive(before, cids, args.writes, args.concurrency)),
+            "after": asyncio.run(drive(after, cids, args.writes, args.concurrency)),
+        }
+    finally:
+        db.close_conn()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for case, r in results.items():
+        print(f"{case:>7}: {r['writes_per_s']:>8} writes/s   loop lag p99 {r['loop_lag_p99_ms']} ms"
+              f"   max {r['loop_lag_max_ms']} ms   ({r['ticks']} ticks)")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({"args": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
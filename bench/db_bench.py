@@ -0,0 +1,120 @@
+"""
+Throughput of the hot instance lookups: connect-per-call vs. pooled WAL connections.
+
+    python -m bench.db_bench --instances 10000 --users 500 --seconds 3 --threads 4
+
+"before" reproduces the old helpers (fresh sqlite3.connect per call, rollback
+journal); "after" calls backend.db.get_instance / list_instances_for_user.
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+
+def legacy_get_instance(db_path, cid):
+    with sqlite3.connect(db_path) as conn:
+        conn.row_factory = sqlite3.Row
+        row = conn.execute("SELECT * FROM instances WHERE cid=?", (cid,)).fetchone()
+        return dict(row) if row else None
+
+
+def legacy_list_instances_for_user(db_path, user_id):
+    with sqlite3.connect(db_path) as conn:
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute("""
+            SELECT * FROM instances WHERE user_id=? ORDER BY created_at DESC
+        """, (user_id,)).fetchall()
+        return [dict(r) for r in rows]
+
+
+def seed(db, instances, users):
+    user_ids = [str(uuid.uuid4()) for _ in range(users)]
+    cids = []
+    expires = (datetime.datetime.utcnow() + datetime.timedelta(hours=1)).isoformat()
+    with db.transaction() as conn:
+        for i in range(instances):
+            cid = uuid.uuid4().hex[:12]
+            cids.append(cid)
+            conn.execute("""
+                INSERT INTO instances (cid, user_id, submission_id, image, subdomain, port, expires_at, status)
+                VALUES (?, ?, NULL, 'bench:latest', ?, ?, ?, ?)
+            """, (cid, random.choice(user_ids), f"localhost:{20000 + i % 20000}", 20000 + i % 20000,
+                  expires, random.choice(("running", "stopped"))))
+    return cids, user_ids
+
+
+def measure(fn, keys, seconds, threads):
+    counts = [0] * threads
+    deadline = time.perf_counter() + seconds
+
+    def worker(slot):
+        rnd = random.Random(slot)
+        n = 0
+        while time.perf_counter() < deadline:
+            fn(rnd.choice(keys))
+            n += 1
+        counts[slot] = n
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return round(sum(counts) / seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--instances", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="instadock_db_bench_"))
+    os.environ["INSTADOCK_DB_PATH"] = str(workdir / "bench.db")
+    os.environ.pop("INSTADOCK_DB_URL", None)  # SQLite-specific bench
+    from backend import db  # imported late so it picks up the bench DB path
+
+    cids, user_ids = seed(db, args.instances, args.users)
+
+    # The old code ran in rollback-journal mode; measure "before" in that mode.
+    legacy_path = workdir / "legacy.db"
+    with sqlite3.connect(db.DB_PATH) as src, sqlite3.connect(legacy_path) as dst:
+        src.backup(dst)
+        dst.execute("PRAGMA journal_mode=DELETE")
+
+    results = {}
+    for name, before, after, keys in (
+        ("get_instance",
+         lambda k: legacy_get_instance(legacy_path, k), db.get_instance, cids),
+        ("list_instances_for_user",
+         lambda k: legacy_list_instances_for_user(legacy_path, k), db.list_instances_for_user, user_ids),
+    ):
+        results[name] = {
+            "before_ops_per_s": measure(before, keys, args.seconds, args.threads),
+            "after_ops_per_s": measure(after, keys, args.seconds, args.threads),
+        }
+        r = results[name]
+        r["speedup"] = round(r["after_ops_per_s"] / max(r["before_ops_per_s"], 1), 2)
+        print(f"{name:>24}: before {r['before_ops_per_s']:>8} ops/s   after {r['after_ops_per_s']:>8} ops/s   x{r['speedup']}")
+
+    db.close_conn()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({"args": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
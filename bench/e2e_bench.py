@@ -0,0 +1,535 @@
+"""
+End-to-end load test of the real API against local stand-ins for Docker and GitHub.
+
+    python -m bench.e2e_bench --json results.json
+    python -m bench.e2e_bench --scenarios spawn,dashboard --spawns 200 --users 500
+
+Serves backend.main.app with uvicorn on a loopback port, in its own process,
+and drives it over HTTP/WebSocket like the frontend does. Docker is replaced by an in-memory SDK
+client (containers.run takes --run-ms) and a `docker` CLI shim on PATH
+(`docker pull` takes --pull-ms); MAIN_REPO_URL points at a throwaway bare git
+repository, so submissions really clone, commit and push. The DB is a fresh
+SQLite file.
+
+Scenarios (each reports throughput and p50/p95/p99 latency):
+  spawn      --spawns simultaneous POST /spawn (5 per user, the quota)
+  zip        --zips simultaneous POST /submit/zip of distinct small projects
+  dashboard  --users users polling GET /instance/me with If-None-Match
+  chat       --chat-users sockets each sending --chat-messages lines; latency
+             until every --chat-admins admin socket has received them
+  cleanup    resync of --cleanup-rows scheduled instances, then reclamation
+             of the --cleanup-due ones that are past their TTL
+
+With --json the results are written together with the current git commit,
+so runs on different commits can be compared.
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import io
+import json
+import multiprocessing as mp
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from pathlib import Path
+from urllib.parse import quote
+
+SCENARIOS = ("spawn", "zip", "dashboard", "chat", "cleanup")
+
+
+# ---------------------------------------------------------
+# STAND-INS
+# ---------------------------------------------------------
+
+class FakeImage:
+    tags = ["bench:latest"]
+
+
+class FakeContainer:
+    def __init__(self, client, cid, name=None):
+        self.client = client
+        self.id = cid
+        self.short_id = cid[:12]
+        self.name = name or f"instadock-{cid[:8]}"
+        self.status = "running"
+        self.image = FakeImage()
+
+    def stop(self, **kwargs):
+        self.status = "exited"
+
+    def start(self):
+        self.status = "running"
+
+    def restart(self, **kwargs):
+        self.status = "running"
+
+    def remove(self, **kwargs):
+        self.client.forget(self.id)
+
+    def logs(self, **kwargs):
+        return b"bench container log line\n"
+
+    def stats(self, stream=False):
+        return {}
+
+
+class FakeContainers:
+    def __init__(self, client, run_ms):
+        self.client = client
+        self.run_ms = run_ms
+
+    def run(self, image, name=None, **kwargs):
+        time.sleep(self.run_ms / 1000)
+        container = FakeContainer(self.client, uuid.uuid4().hex + uuid.uuid4().hex, name)
+        self.client.add(container)
+        return container
+
+    def get(self, cid):
+        # Rows seeded straight into the DB have no container yet: the daemon "has" them
+        return self.client.lookup(cid)
+
+    def list(self, all=False, filters=None):
+        status = (filters or {}).get("status")
+        return [c for c in self.client.snapshot() if status is None or c.status == status]
+
+
+class FakeDockerClient:
+    """The parts of docker.DockerClient that backend.docker_manager uses, in memory."""
+
+    def __init__(self, run_ms):
+        self._lock = threading.Lock()
+        self._containers = {}
+        self.containers = FakeContainers(self, run_ms)
+
+    def add(self, container):
+        with self._lock:
+            self._containers[container.short_id] = container
+
+    def lookup(self, cid):
+        with self._lock:
+            container = self._containers.get(cid[:12])
+            if container is None:
+                container = self._containers[cid[:12]] = FakeContainer(self, cid)
+            return container
+
+    def forget(self, cid):
+        with self._lock:
+            self._containers.pop(cid[:12], None)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self._containers.values())
+
+
+def install_docker_cli(bin_dir: Path, pull_ms: float):
+    """`docker` on PATH for docker_manager.docker_pull: pull sleeps, everything else succeeds."""
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    script = bin_dir / "docker"
+    script.write_text(f'#!/bin/sh\n[ "$1" = "pull" ] && sleep {pull_ms / 1000:.3f}\nexit 0\n')
+    script.chmod(0o755)
+    os.environ["PATH"] = f"{bin_dir}{os.pathsep}{os.environ['PATH']}"
+
+
+def create_main_repo(workdir: Path) -> str:
+    """Bare repository standing in for the GitHub monorepo; returns its URL."""
+    seed, bare = workdir / "seed", workdir / "main.git"
+    identity = ["-c", "user.name=bench", "-c", "user.email=bench@example.com"]
+    subprocess.run(["git", "init", "-q", str(seed)], check=True)
+    (seed / "README.md").write_text("InstaDock submissions (bench)\n")
+    (seed / "submissions").mkdir()
+    (seed / "submissions" / ".keep").write_text("")
+    subprocess.run(["git", *identity, "-C", str(seed), "add", "."], check=True)
+    subprocess.run(["git", *identity, "-C", str(seed), "commit", "-q", "-m", "init"], check=True)
+    subprocess.run(["git", "clone", "-q", "--bare", str(seed), str(bare)], check=True)
+    return f"file://{bare}"  # file:// so --depth clones work as against a remote
+
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+# ---------------------------------------------------------
+# MEASUREMENT
+# ---------------------------------------------------------
+
+def percentile(values, q):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * q))] * 1000, 2) if values else None
+
+
+def summarise(latencies, elapsed, errors=0, **extra):
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        **extra,
+    }
+
+
+async def timed_request(client, latencies, errors, method, url, **kwargs):
+    started = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+    except Exception:
+        errors.append(None)
+        return None
+    if response.status_code >= 400:
+        errors.append(response.status_code)
+        return response
+    latencies.append(time.perf_counter() - started)
+    return response
+
+
+# ---------------------------------------------------------
+# SCENARIOS
+# ---------------------------------------------------------
+
+async def spawn_burst(ctx, args):
+    users = [f"spawn-user-{i:05d}" for i in range((args.spawns + 4) // 5)]
+    latencies, errors = [], []
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        timed_request(ctx.http, latencies, errors, "POST", "/spawn",
+                      json={"image": "ghcr.io/bench/app:latest", "ttl_seconds": 3600},
+                      headers=ctx.auth(users[i // 5]))
+        for i in range(args.spawns)
+    ))
+    return summarise(latencies, time.perf_counter() - started, len(errors), error_codes=sorted(set(map(str, errors))))
+
+
+def build_zip(index: int) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as z:
+        z.writestr("Dockerfile", "FROM python:3.12-slim\nCOPY . /app\nCMD [\"python\", \"/app/app.py\"]\n")
+        z.writestr("app.py", f"print('bench submission {index} {uuid.uuid4().hex}')\n")
+        z.writestr("static/data.txt", os.urandom(16 * 1024).hex())
+    return buffer.getvalue()
+
+
+async def zip_burst(ctx, args):
+    payloads = [build_zip(i) for i in range(args.zips)]
+    latencies, errors = [], []
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        timed_request(ctx.http, latencies, errors, "POST", "/submit/zip",
+                      files={"file": (f"bench-{i}.zip", payload, "application/zip")},
+                      headers=ctx.auth(f"zip-user-{i:05d}"))
+        for i, payload in enumerate(payloads)
+    ))
+    return summarise(latencies, time.perf_counter() - started, len(errors), error_codes=sorted(set(map(str, errors))))
+
+
+async def dashboard_polling(ctx, args):
+    users = [f"dash-user-{i:05d}" for i in range(args.users)]
+    seed_instances(ctx.db, users, per_user=3)
+    latencies, errors = [], []
+    not_modified = 0
+
+    async def poll(user, http):
+        nonlocal not_modified
+        etag = None
+        await asyncio.sleep(random.random() * args.poll_interval)  # spread the users out
+        while time.perf_counter() < deadline:
+            headers = ctx.auth(user)
+            if etag:
+                headers["If-None-Match"] = etag
+            response = await timed_request(http, latencies, errors, "GET", "/instance/me", headers=headers)
+            if response is not None and response.status_code == 304:
+                not_modified += 1
+            elif response is not None and response.status_code == 200:
+                etag = response.headers.get("etag")
+            await asyncio.sleep(args.poll_interval)
+
+    # One client (one connection) per user, like a browser tab. A single
+    # shared pool scans all its connections on every request, and with
+    # hundreds of them the load generator, not the API, becomes the
+    # bottleneck. Clients are built before the clock starts.
+    async with contextlib.AsyncExitStack() as stack:
+        clients = [await stack.enter_async_context(ctx.client()) for _ in users]
+        started = time.perf_counter()
+        deadline = started + args.seconds
+        await asyncio.gather(*(poll(u, http) for u, http in zip(users, clients)))
+        elapsed = time.perf_counter() - started
+    return summarise(latencies, elapsed, len(errors), not_modified_ratio=round(not_modified / max(1, len(latencies)), 3))
+
+
+def seed_instances(db, users, per_user):
+    expires = (datetime.datetime.utcnow() + datetime.timedelta(hours=1)).isoformat()
+    rows = []
+    for user in users:
+        for _ in range(per_user):
+            cid = uuid.uuid4().hex[:12]
+            rows.append((cid, user, None, "bench:latest", f"localhost:{random.randint(20000, 40000)}", 0, expires, "running"))
+    with db.transaction() as conn:
+        conn.executemany("""
+            INSERT INTO instances (cid, user_id, submission_id, image, subdomain, port, expires_at, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+
+
+async def chat_fanout(ctx, args):
+    import websockets
+
+    expected = args.chat_users * args.chat_messages
+    latencies = []
+    received = [0] * args.chat_admins
+    closed = [False] * args.chat_admins
+    done = asyncio.Event()
+
+    def url(user_id, role="user"):
+        token = quote(f"Bearer {ctx.token(user_id, role)}")
+        return f"ws://127.0.0.1:{ctx.port}/ws/admin/chat?authorization={token}"
+
+    async def admin_reader(index, ws):
+        try:
+            async for message in ws:
+                if not message.startswith("[USER "):
+                    continue
+                latencies.append(time.time() - float(message.split(": ", 1)[1]))
+                received[index] += 1
+                if all(n >= expected for n in received):
+                    done.set()
+        except websockets.ConnectionClosed:
+            pass
+        closed[index] = True  # the server gave up on this admin (slow-consumer policy)
+        if all(closed[i] or received[i] >= expected for i in range(len(received))):
+            done.set()
+
+    async def drain(ws):
+        with contextlib.suppress(Exception):
+            async for _ in ws:
+                pass
+
+    admins = [await websockets.connect(url(f"chat-admin-{i:03d}", "admin"), max_queue=None)
+              for i in range(args.chat_admins)]
+    users = [await websockets.connect(url(f"chat-user-{i:05d}"), max_queue=None) for i in range(args.chat_users)]
+    readers = [asyncio.create_task(admin_reader(i, ws)) for i, ws in enumerate(admins)]
+    readers += [asyncio.create_task(drain(ws)) for ws in users]
+
+    # Each round every user sends one line, spread evenly over --chat-interval-ms
+    gap = args.chat_interval_ms / 1000 / max(1, len(users))
+    started = time.perf_counter()
+    for _ in range(args.chat_messages):
+        for ws in users:
+            await ws.send(f"{time.time():.6f}")
+            await asyncio.sleep(gap)
+    with contextlib.suppress(asyncio.TimeoutError):
+        await asyncio.wait_for(done.wait(), 30)
+    elapsed = time.perf_counter() - started
+
+    for ws in admins + users:
+        await ws.close()
+    for task in readers:
+        task.cancel()
+    result = summarise(latencies, elapsed)
+    result.update(
+        requests=expected,
+        deliveries=len(latencies),
+        deliveries_expected=expected * args.chat_admins,
+        throughput_per_s=round(len(latencies) / elapsed, 1),  # deliveries, not sends
+        admins_disconnected=sum(1 for i in range(len(admins)) if closed[i] and received[i] < expected),
+    )
+    return result
+
+
+def cleanup_at_scale(ctx, args):
+    from backend import cleanup_worker, docker_manager
+
+    now = datetime.datetime.utcnow()
+    rows = []
+    for i in range(args.cleanup_rows):
+        due = i < args.cleanup_due
+        expires = now + (datetime.timedelta(seconds=-60) if due else datetime.timedelta(hours=1 + i % 24))
+        cid = f"cl{i:010d}"
+        rows.append((cid, f"cleanup-user-{i % 1000:04d}", None, "bench:latest", f"localhost:{i}", 0, expires.isoformat(), "running"))
+    with ctx.db.transaction() as conn:
+        conn.executemany("""
+            INSERT INTO instances (cid, user_id, submission_id, image, subdomain, port, expires_at, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+    due = [r[0] for r in rows[:args.cleanup_due]]
+
+    started = time.perf_counter()
+    cleanup_worker.resync_deadlines()
+    resync_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    cleanup_worker.cleanup_expired_instances(due)
+    reclaim_s = time.perf_counter() - started
+
+    with ctx.db.connection() as conn:
+        stopped = conn.execute(
+            "SELECT COUNT(*) FROM instances WHERE cid LIKE 'cl%' AND status='stopped'"
+        ).fetchone()[0]
+    return {
+        "rows": args.cleanup_rows,
+        "due": len(due),
+        "resync_s": round(resync_s, 3),
+        "resync_rows_per_s": round(args.cleanup_rows / resync_s, 1),
+        "reclaim_s": round(reclaim_s, 3),
+        "reclaims_per_s": round(len(due) / reclaim_s, 1) if reclaim_s else None,
+        "reclaimed": stopped,
+        "scheduled_after": len(docker_manager.ttl_scheduler),
+    }
+
+
+# ---------------------------------------------------------
+# HARNESS
+# ---------------------------------------------------------
+
+class Context:
+    def __init__(self, db, auth_module, port):
+        self.db = db
+        self.port = port
+        self._auth = auth_module
+        self._tokens = {}
+        self.http = None
+
+    def token(self, user_id, role="user"):
+        key = (user_id, role)
+        if key not in self._tokens:
+            self._tokens[key] = self._auth.create_token(user_id, role)
+        return self._tokens[key]
+
+    def auth(self, user_id, role="user"):
+        return {"Authorization": f"Bearer {self.token(user_id, role)}"}
+
+    def client(self, **kwargs):
+        import httpx
+        # verify=False: plain HTTP on loopback, and it spares each client loading the CA bundle
+        return httpx.AsyncClient(base_url=f"http://127.0.0.1:{self.port}", timeout=300, verify=False, **kwargs)
+
+
+def install_stand_ins(workdir: Path, args, repo_url: str):
+    """Environment and fake Docker client; must run before backend is imported."""
+    os.environ["INSTADOCK_DB_PATH"] = str(workdir / "bench.db")
+    os.environ.pop("INSTADOCK_DB_URL", None)
+    os.environ["PUBSUB_BACKEND"] = "local"        # one API process
+    os.environ["SPAWN_IMAGE_WAIT_SECONDS"] = "0"
+    os.environ.pop("GHCR_PULL_TOKEN", None)
+    os.environ["MAIN_REPO_URL"] = repo_url
+    install_docker_cli(workdir / "bin", args.pull_ms)
+    import docker
+    docker.from_env = lambda *a, **kw: FakeDockerClient(args.run_ms)
+
+
+def serve(workdir, args, repo_url, ports):
+    """API server process, so the load generator does not share its GIL."""
+    install_stand_ins(Path(workdir), args, repo_url)
+    if not args.verbose:
+        sys.stdout = open(os.devnull, "w")
+    import uvicorn
+    from backend import main as api
+
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=0, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True, name="uvicorn")
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    ports.put(server.servers[0].sockets[0].getsockname()[1])
+    thread.join()
+
+
+async def run_http_scenarios(ctx, args, results, log):
+    import httpx
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with ctx.client(limits=limits) as http:
+        ctx.http = http
+        for name, scenario in (("spawn", spawn_burst), ("zip", zip_burst),
+                               ("dashboard", dashboard_polling), ("chat", chat_fanout)):
+            if name in args.scenarios:
+                log(f"[e2e] {name} ...")
+                results[name] = await scenario(ctx, args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--spawns", type=int, default=100)
+    parser.add_argument("--pull-ms", type=float, default=200, help="duration of the fake `docker pull`")
+    parser.add_argument("--run-ms", type=float, default=100, help="duration of the fake containers.run")
+    parser.add_argument("--zips", type=int, default=10)
+    parser.add_argument("--users", type=int, default=200, help="dashboard users polling")
+    parser.add_argument("--seconds", type=float, default=10, help="dashboard polling duration")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="seconds between one user's polls")
+    parser.add_argument("--chat-users", type=int, default=200)
+    parser.add_argument("--chat-admins", type=int, default=5)
+    parser.add_argument("--chat-messages", type=int, default=5, help="lines sent per chat user")
+    parser.add_argument("--chat-interval-ms", type=float, default=1000, help="duration of one round of chat lines")
+    parser.add_argument("--cleanup-rows", type=int, default=100_000)
+    parser.add_argument("--cleanup-due", type=int, default=2_000)
+    parser.add_argument("--verbose", action="store_true", help="show the backend's own log output")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    workdir = Path(tempfile.mkdtemp(prefix="instadock_e2e_bench_"))
+    log = lambda message: print(message, flush=True)
+    results = {}
+    server = None
+    try:
+        repo_url = create_main_repo(workdir)
+        install_stand_ins(workdir, args, repo_url)  # this process seeds the DB and runs cleanup
+
+        ctx_mp = mp.get_context("spawn")
+        ports = ctx_mp.Queue()
+        server = ctx_mp.Process(target=serve, args=(str(workdir), args, repo_url, ports), daemon=True)
+        server.start()
+        port = ports.get(timeout=120)
+
+        with contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO()):
+            from backend import db, auth
+        ctx = Context(db, auth, port)
+        asyncio.run(run_http_scenarios(ctx, args, results, log))
+        server.terminate()
+        server.join(10)
+
+        if "cleanup" in args.scenarios:
+            log("[e2e] cleanup ...")
+            with contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO()):
+                results["cleanup"] = cleanup_at_scale(ctx, args)
+    finally:
+        if server is not None and server.is_alive():
+            server.terminate()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for name in SCENARIOS:
+        r = results.get(name)
+        if r is None:
+            continue
+        if name == "cleanup":
+            print(f"{name:>9}: resync of {r['rows']} rows {r['resync_s']} s ({r['resync_rows_per_s']} rows/s)   "
+                  f"{r['reclaimed']}/{r['due']} due reclaimed in {r['reclaim_s']} s ({r['reclaims_per_s']}/s)")
+        else:
+            print(f"{name:>9}: {r['requests']} requests, {r['errors']} errors in {r['elapsed_s']} s   "
+                  f"{r['throughput_per_s']}/s   p50 {r['p50_ms']} ms  p95 {r['p95_ms']} ms  p99 {r['p99_ms']} ms"
+                  + (f"   304s {r['not_modified_ratio']:.0%}" if "not_modified_ratio" in r else "")
+                  + (f"   delivered {r['deliveries']}/{r['deliveries_expected']}, "
+                     f"{r['admins_disconnected']} admins disconnected" if "deliveries" in r else ""))
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({"commit": current_commit(), "args": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Login storm: argon2 on the shared threadpool vs. the bounded password process pool.
+
+    python -m bench.login_bench --logins 60 --bystanders 20
+
+Serves backend.main.app with uvicorn in its own process, then --logins users
+all POST /user/login at once (the class logging in at 9:00); a 503 is
+retried after its Retry-After. Meanwhile --bystanders already signed-in users
+poll GET /user/me, a sync endpoint that needs a threadpool thread like spawn
+and the list endpoints do.
+
+"inline" reproduces the old handlers (argon2 verify inside the request on
+starlette's threadpool, no bound); "pool" is backend.passwords. Reported per
+mode: time until each user holds a token, the number of 503s, and the
+bystanders' latency. A /metrics scrape afterwards checks that the logins are
+labelled with their full route, /user/login (the users router's prefix kept).
+ARGON2_* / PASSWORD_* environment variables are passed through to the
+server, so parameters can be compared too.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing as mp
+import os
+import random
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+MODES = ("inline", "pool")
+PASSWORD = "correct horse battery"
+
+
+def serve(db_path, mode, ports):
+    """API server process; mode "inline" swaps the pool for the old in-request hashing."""
+    os.environ["INSTADOCK_DB_PATH"] = db_path
+    os.environ["PUBSUB_BACKEND"] = "local"
+    os.environ["DOCKER_CONNECT_ATTEMPTS"] = "1"   # no daemon needed for logins
+    sys.stdout = open(os.devnull, "w")
+    import uvicorn
+    from backend import main as api, passwords
+
+    if mode == "inline":
+        from starlette.concurrency import run_in_threadpool
+
+        async def inline(op, fn, *args):
+            return await run_in_threadpool(fn, *args)
+        passwords._run = inline
+
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=0, log_level="warning"))
+    # uvicorn off the main thread installs no signal handlers: stop it on
+    # terminate() so the lifespan shuts the password pool's processes down
+    signal.signal(signal.SIGTERM, lambda *_: setattr(server, "should_exit", True))
+    thread = threading.Thread(target=server.run, daemon=True, name="uvicorn")
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    ports.put(server.servers[0].sockets[0].getsockname()[1])
+    thread.join()
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * q))] * 1000, 2) if values else None
+
+
+async def storm(port, args, auth):
+    import httpx
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=300, verify=False) as http:
+        to_token, attempts, rejected, failed, errors = [], [], 0, 0, 0
+        bystander_latencies = []
+        done = asyncio.Event()
+
+        async def login(i):
+            nonlocal rejected, failed, errors
+            started = time.perf_counter()
+            while True:
+                sent = time.perf_counter()
+                try:
+                    r = await http.post("/user/login", json={"username": f"storm-{i:05d}", "password": PASSWORD})
+                except httpx.TransportError:
+                    errors += 1   # e.g. a keep-alive connection closed under us; retry
+                    continue
+                attempts.append(time.perf_counter() - sent)
+                if r.status_code == 503:
+                    rejected += 1
+                    await asyncio.sleep(float(r.headers.get("retry-after", "1")) * (0.5 + random.random()))
+                    continue
+                if r.status_code != 200:
+                    failed += 1
+                    return
+                to_token.append(time.perf_counter() - started)
+                return
+
+        async def bystander(i):
+            nonlocal errors
+            headers = auth(f"bystander-{i:05d}")
+            while not done.is_set():
+                sent = time.perf_counter()
+                try:
+                    r = await http.get("/user/me", headers=headers)
+                except httpx.TransportError:
+                    errors += 1
+                    continue
+                if r.status_code == 200:
+                    bystander_latencies.append(time.perf_counter() - sent)
+                await asyncio.sleep(args.bystander_interval_ms / 1000)
+
+        bystanders = [asyncio.create_task(bystander(i)) for i in range(args.bystanders)]
+        await asyncio.sleep(0.5)  # bystanders settled
+        started = time.perf_counter()
+        await asyncio.gather(*(login(i) for i in range(args.logins)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await asyncio.gather(*bystanders)
+
+        # /user/login is declared on the users router; its metrics label must keep the prefix
+        scrape = await http.get("/metrics", headers=auth("bench-admin", "admin"))
+        login_labelled = 'route="/user/login"' in scrape.text
+
+    return {
+        "logins": len(to_token),
+        "failed": failed,
+        "rejected_503": rejected,
+        "transport_errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "logins_per_s": round(len(to_token) / elapsed, 1),
+        "to_token_p50_ms": percentile(to_token, 0.50),
+        "to_token_p95_ms": percentile(to_token, 0.95),
+        "to_token_p99_ms": percentile(to_token, 0.99),
+        "attempt_p50_ms": percentile(attempts, 0.50),
+        "bystander_requests": len(bystander_latencies),
+        "bystander_p50_ms": percentile(bystander_latencies, 0.50),
+        "bystander_p99_ms": percentile(bystander_latencies, 0.99),
+        "bystander_max_ms": percentile(bystander_latencies, 1.0),
+        "login_route_labelled": login_labelled,
+    }
+
+
+def run_mode(mode, db_path, args, auth):
+    ctx = mp.get_context("spawn")
+    ports = ctx.Queue()
+    # Not daemonic: daemonic processes cannot start the password pool's processes
+    server = ctx.Process(target=serve, args=(db_path, mode, ports))
+    server.start()
+    try:
+        port = ports.get(timeout=120)
+        return asyncio.run(storm(port, args, auth))
+    finally:
+        server.terminate()
+        server.join(10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=60, help="users logging in at once")
+    parser.add_argument("--bystanders", type=int, default=20, help="signed-in users polling GET /user/me")
+    parser.add_argument("--bystander-interval-ms", type=float, default=50)
+    parser.add_argument("--modes", default=",".join(MODES), help="comma-separated subset of: " + ", ".join(MODES))
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+
+    workdir = Path(tempfile.mkdtemp(prefix="instadock_login_bench_"))
+    db_path = str(workdir / "bench.db")
+    os.environ["INSTADOCK_DB_PATH"] = db_path
+    os.environ.pop("INSTADOCK_DB_URL", None)
+    results = {}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            from backend import auth, db, passwords
+            hashed = passwords.hash_password(PASSWORD)  # same cost for every account
+            for i in range(args.logins):
+                db.create_user(f"storm-{i:05d}", hashed)
+        auth_headers = lambda user_id, role="user": {"Authorization": f"Bearer {auth.create_token(user_id, role)}"}
+
+        for mode in modes:
+            print(f"[login] {mode} ...", flush=True)
+            results[mode] = run_mode(mode, db_path, args, auth_headers)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for mode, r in results.items():
+        print(f"{mode:>6}: {r['logins']} logins ({r['failed']} failed, {r['rejected_503']} 503s, {r['transport_errors']} transport errors) in {r['elapsed_s']} s   "
+              f"{r['logins_per_s']}/s   token after p50 {r['to_token_p50_ms']} ms  p95 {r['to_token_p95_ms']} ms   "
+              f"bystanders p50 {r['bystander_p50_ms']} ms  p99 {r['bystander_p99_ms']} ms  max {r['bystander_max_ms']} ms")
+        if not r["login_route_labelled"]:
+            print(f"{mode:>6}: /metrics has no series labelled route=\"/user/login\"")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({"args": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Cross-worker chat delivery: process-local broker vs. the shared-database relay.
+
+    python -m bench.pubsub_bench --workers 4 --messages 500
+
+Starts --workers processes sharing one SQLite file, each with its own
+backend.chat.ConnectionManager and --admins in-memory admin sockets (the
+way uvicorn --workers N splits connections). Worker 0 publishes --messages
+chat lines into a user's room; every worker reports how many reached its
+sockets and how long after publish(). With PUBSUB_BACKEND=local only worker
+0's sockets see anything; with "db" every worker's should.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+
+class FakeSocket:
+    def __init__(self, latencies):
+        self.latencies = latencies
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        if message.startswith("{"):
+            self.latencies.append(time.time() - json.loads(message)["t"])
+
+    async def close(self):
+        pass
+
+
+def worker(index, args, backend, db_path, ready, results):
+    os.environ["INSTADOCK_DB_PATH"] = db_path
+    os.environ.pop("INSTADOCK_DB_URL", None)
+    os.environ["PUBSUB_BACKEND"] = backend
+    from backend import chat  # imported late so it picks up the bench DB and backend
+
+    async def run():
+        manager = chat.ConnectionManager()
+        latencies = []
+        for i in range(args.admins):
+            await manager.connect(f"admin-{index}-{i}", FakeSocket(latencies), is_admin=True)
+        await asyncio.sleep(0.5)  # relay thread has found its starting position
+        ready.wait()
+
+        if index == 0:
+            for _ in range(args.messages):
+                manager.publish(chat.user_room("bench-user"), json.dumps({"t": time.time()}), record=False)
+                await asyncio.sleep(args.interval_ms / 1000)
+
+        expected = args.messages * args.admins
+        deadline = time.monotonic() + args.messages * args.interval_ms / 1000 + 3
+        while len(latencies) < expected and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        results.put((index, len(latencies), latencies))
+
+    asyncio.run(run())
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * q))] * 1000, 2) if values else None
+
+
+def run_case(args, backend, db_path):
+    ctx = mp.get_context("spawn")
+    ready = ctx.Barrier(args.workers)
+    results = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(i, args, backend, db_path, ready, results)) for i in range(args.workers)]
+    for p in procs:
+        p.start()
+    per_worker = sorted(results.get(timeout=120) for _ in procs)
+    for p in procs:
+        p.join()
+
+    latencies = [x for _, _, lat in per_worker for x in lat]
+    remote = [x for i, _, lat in per_worker if i != 0 for x in lat]
+    return {
+        "delivered_per_worker": [n for _, n, _ in per_worker],
+        "expected_per_worker": args.messages * args.admins,
+        "latency_p50_ms": percentile(latencies, 0.50),
+        "latency_p95_ms": percentile(latencies, 0.95),
+        "latency_p99_ms": percentile(latencies, 0.99),
+        "remote_latency_p99_ms": percentile(remote, 0.99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--admins", type=int, default=10, help="admin sockets per worker")
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--interval-ms", type=float, default=2.0, help="pause between publishes")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="instadock_pubsub_bench_"))
+    try:
+        results = {}
+        for backend in ("local", "db"):
+            db_path = str(workdir / f"{backend}.db")
+            os.environ["INSTADOCK_DB_PATH"] = db_path
+            os.environ.pop("INSTADOCK_DB_URL", None)
+            results[backend] = run_case(args, backend, db_path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for backend, r in results.items():
+        print(f"{backend:>6}: delivered per worker {r['delivered_per_worker']} (expected {r['expected_per_worker']} each)   "
+              f"latency p50 {r['latency_p50_ms']} ms  p95 {r['latency_p95_ms']} ms  p99 {r['latency_p99_ms']} ms   "
+              f"other workers p99 {r['remote_latency_p99_ms']} ms")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({"args": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Check that the hot list/cleanup queries are index seeks, not table scans.
+
+    python -m bench.query_plans --instances 100000
+
+Seeds a throwaway DB, calls the real backend.db helpers while tracing the SQL
+they run, and prints EXPLAIN QUERY PLAN for each statement. Exits non-zero if
+any plan contains a full table SCAN (an index walk bounded by LIMIT is allowed).
+"""
+import argparse
+import datetime
+import os
+import random
+import shutil
+import sys
+import tempfile
+import uuid
+from pathlib import Path
+
+
+def seed(db, instances, users, submissions):
+    user_ids = [str(uuid.uuid4()) for _ in range(users)]
+    now = datetime.datetime.utcnow()
+    with db.transaction() as conn:
+        conn.executemany("""
+            INSERT INTO instances (cid, user_id, submission_id, image, subdomain, port, expires_at, status)
+            VALUES (?, ?, NULL, 'bench:latest', 'localhost:20000', 20000, ?, ?)
+        """, (
+            (uuid.uuid4().hex[:12], random.choice(user_ids),
+             (now + datetime.timedelta(seconds=random.randint(-86400, 86400))).isoformat(),
+             random.choice(("running", "stopped", "removed")))
+            for _ in range(instances)
+        ))
+        conn.executemany("""
+            INSERT INTO submissions (id, user_id, branch, status, source, image_tag)
+            VALUES (?, ?, 'submission/x/y', ?, 'zip_upload', ?)
+        """, (
+            (str(uuid.uuid4()), random.choice(user_ids), status,
+             "ghcr.io/x/instadock_y:latest" if status == "approved" else None)
+            for status in (random.choice(("pending", "approved", "rejected")) for _ in range(submissions))
+        ))
+        conn.execute("ANALYZE")
+    return user_ids
+
+
+def _two_pages(list_page, **kwargs):
+    """First page plus the keyset seek for the second one."""
+    _, cursor = list_page(limit=50, **kwargs)
+    list_page(limit=50, cursor=cursor, **kwargs)
+
+
+def hot_queries(db, user_ids):
+    """The helpers behind the dashboards, admin lists and cleanup worker."""
+    user_id = user_ids[0]
+    return {
+        "list_instances_for_user": lambda: db.list_instances_for_user(user_id),
+        "list_pending_submissions": db.list_pending_submissions,
+        "list_approved_submissions": lambda: db.list_approved_submissions(user_id),
+        "list_all_approved_submissions": db.list_all_approved_submissions,
+        "list_scheduled_instances": db.list_scheduled_instances,
+        "is_port_leased": lambda: db.is_port_leased(20000),
+        "reserve_instance_slot": lambda: db.release_instance_slot(db.reserve_instance_slot(user_id, 5) or ""),
+        "list_instances_page(all)": lambda: _two_pages(db.list_instances_page),
+        "list_instances_page(status)": lambda: _two_pages(db.list_instances_page, status="stopped"),
+        "list_instances_page(user)": lambda: _two_pages(db.list_instances_page, user_id=user_id),
+        "list_submissions_page(pending)": lambda: _two_pages(db.list_submissions_page, status="pending"),
+        "list_submissions_page(approved)": lambda: _two_pages(
+            db.list_submissions_page, status="approved", built_only=True, fields="id,image_tag"),
+        "list_chat_messages": lambda: db.list_chat_messages(f"user:{user_id}", 50),
+        "list_events_after(all)": lambda: db.list_events_after(0, None, 500),
+        "list_events_after(user)": lambda: db.list_events_after(0, user_id, 500),
+        "event_seq_bounds": db.event_seq_bounds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--instances", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--submissions", type=int, default=20000)
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="instadock_query_plans_"))
+    os.environ["INSTADOCK_DB_PATH"] = str(workdir / "plans.db")
+    os.environ.pop("INSTADOCK_DB_URL", None)  # SQLite-specific bench
+    from backend import db  # imported late so it picks up the throwaway DB path
+
+    failures = []
+    try:
+        user_ids = seed(db, args.instances, args.users, args.submissions)
+        conn = db.get_conn()
+
+        for name, call in hot_queries(db, user_ids).items():
+            statements = []
+            conn.set_trace_callback(statements.append)
+            call()
+            conn.set_trace_callback(None)
+
+            for sql in statements:
+                plan = [row["detail"] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+                # An ordered index walk cut short by LIMIT (first page) is fine
+                scans = [step for step in plan if step.startswith("SCAN ") and step != "SCAN CONSTANT ROW"
+                         and not ("USING INDEX" in step and " LIMIT " in sql)]
+                print(f"{'FAIL' if scans else 'ok':>4}  {name}")
+                for step in plan:
+                    print(f"        {step}")
+                if scans:
+                    failures.append(name)
+    finally:
+        db.close_conn()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if failures:
+        print(f"Full table scans in: {', '.join(failures)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Concurrent spawn load against the per-user instance quota.
+
+    python -m bench.quota_bench --spawns 50 --limit 5 --processes 8
+
+Fires --spawns simultaneous spawns for one user from several processes (each
+with its own SQLite connection). "before" is the old Python-side check (list
+the user's instances, filter on status, then save after the slow pull);
+"after" uses db.reserve_instance_slot / save_instance(reservation_id=...).
+Exits non-zero if "after" ever admits more than --limit instances.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+USER_ID = "quota-bench-user"
+
+
+def _db(db_path):
+    os.environ["INSTADOCK_DB_PATH"] = db_path
+    os.environ.pop("INSTADOCK_DB_URL", None)  # SQLite-specific bench
+    from backend import db  # imported late so it picks up the bench DB path
+    return db
+
+
+def _save(db, reservation_id=None):
+    cid = uuid.uuid4().hex[:12]
+    db.save_instance(cid, USER_ID, None, "bench:latest", "localhost:0", None,
+                     "2099-01-01T00:00:00", reservation_id=reservation_id)
+
+
+def spawn_before(db_path, limit, pull_seconds, start_at):
+    db = _db(db_path)
+    time.sleep(max(0.0, start_at - time.time()))
+    running = [i for i in db.list_instances_for_user(USER_ID) if i.get("status") == "running"]
+    if len(running) >= limit:
+        return False
+    time.sleep(pull_seconds)  # docker pull / run
+    _save(db)
+    return True
+
+
+def spawn_after(db_path, limit, pull_seconds, start_at):
+    db = _db(db_path)
+    time.sleep(max(0.0, start_at - time.time()))
+    reservation_id = db.reserve_instance_slot(USER_ID, limit)
+    if reservation_id is None:
+        return False
+    try:
+        time.sleep(pull_seconds)  # docker pull / run
+        _save(db, reservation_id)
+    finally:
+        db.release_instance_slot(reservation_id)
+    return True
+
+
+def run(case, fn, workdir, args):
+    db_path = str(workdir / f"{case}.db")
+    _db(db_path).close_conn()  # create the schema once up front
+
+    start_at = time.time() + 1.0
+    started = time.perf_counter()
+    with multiprocessing.get_context("spawn").Pool(args.processes) as pool:
+        admitted = pool.starmap(fn, [(db_path, args.limit, args.pull_seconds, start_at)] * args.spawns)
+    elapsed = time.perf_counter() - started - 1.0
+
+    with sqlite3.connect(db_path) as conn:
+        running = conn.execute(
+            "SELECT COUNT(*) FROM instances WHERE user_id=? AND status='running'", (USER_ID,)
+        ).fetchone()[0]
+    return {
+        "case": case,
+        "admitted": sum(admitted),
+        "running_instances": running,
+        "over_quota": max(0, running - args.limit),
+        "seconds": round(elapsed, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--spawns", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--pull-seconds", type=float, default=0.2, help="simulated pull/start time")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="instadock_quota_bench_"))
+    try:
+        results = [run("before", spawn_before, workdir, args), run("after", spawn_after, workdir, args)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for r in results:
+        print(f"{r['case']:>7}: admitted {r['admitted']:>4}  running {r['running_instances']:>4}  "
+              f"over quota {r['over_quota']:>4}  {r['seconds']:.3f}s")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({"args": vars(args), "results": results}, indent=2))
+
+    if results[-1]["over_quota"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Staging throughput: shutil.copytree vs. backend.staging strategies.
+
+    python -m bench.staging_bench --size-mb 1024 --dir /tmp
+
+Builds an asset-heavy fake submission (a few large files plus many small
+ones) of the requested size, stages it once per strategy and reports MB/s.
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from backend import staging
+
+
+def build_submission(root: Path, size_mb: int):
+    """~90% of the bytes in 64 MB assets, the rest in 64 KB source files."""
+    total = size_mb * 1024 * 1024
+    large, small = 64 * 1024 * 1024, 64 * 1024
+    block = os.urandom(1024 * 1024)
+
+    assets = root / "assets"
+    src = root / "src"
+    assets.mkdir(parents=True)
+    src.mkdir()
+
+    written, i = 0, 0
+    while written < int(total * 0.9):
+        size = min(large, int(total * 0.9) - written)
+        with open(assets / f"asset_{i}.bin", "wb") as f:
+            for _ in range(size // len(block)):
+                f.write(block)
+            f.write(block[: size % len(block)])
+        written += size
+        i += 1
+
+    i = 0
+    while written < total:
+        (src / f"module_{i}.py").write_bytes(block[:small])
+        written += small
+        i += 1
+    return written
+
+
+def run(label, fn, source: Path, out_root: Path, size_bytes: int):
+    dest = out_root / label
+    started = time.perf_counter()
+    result = fn(source, dest)
+    elapsed = time.perf_counter() - started
+    shutil.rmtree(dest, ignore_errors=True)
+    return {
+        "case": label,
+        "seconds": round(elapsed, 3),
+        "mb_per_s": round(size_bytes / (1024 * 1024) / elapsed, 1),
+        "strategies": dict(result) if result else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size-mb", type=int, default=1024)
+    parser.add_argument("--dir", default=tempfile.gettempdir(), help="filesystem to benchmark on")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    work = Path(tempfile.mkdtemp(prefix="instadock_staging_bench_", dir=args.dir))
+    try:
+        source = work / "source"
+        size_bytes = build_submission(source, args.size_mb)
+
+        cases = [
+            ("copytree", lambda s, d: shutil.copytree(s, d) and None),
+            ("auto", lambda s, d: staging.stage_tree(s, d)),
+            ("reflink", lambda s, d: staging.stage_tree(s, d, ("reflink", "chunked"))),
+            ("hardlink", lambda s, d: staging.stage_tree(s, d, ("hardlink", "chunked"))),
+            ("copy_range", lambda s, d: staging.stage_tree(s, d, ("copy_range", "chunked"))),
+            ("chunked", lambda s, d: staging.stage_tree(s, d, ("chunked",))),
+        ]
+        results = [run(label, fn, source, work, size_bytes) for label, fn in cases]
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    for r in results:
+        print(f"{r['case']:>10}  {r['seconds']:>8.3f}s  {r['mb_per_s']:>9.1f} MB/s  {r['strategies'] or ''}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({"size_mb": args.size_mb, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
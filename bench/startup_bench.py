@@ -0,0 +1,129 @@
+"""
+Cold start of an API worker: time to import backend.main and to run its startup.
+
+    python -m bench.startup_bench --runs 5 --importtime 15
+
+Every run is a fresh interpreter that imports backend.main, then enters and
+leaves the app's lifespan (what uvicorn does before accepting connections).
+Two cases: a "fresh" database (migrations, default admin hashed) and a "warm"
+one (already migrated, admin present), i.e. a restart or a new replica.
+DOCKER_HOST points at a socket nobody listens on, so the runs also show that
+an unreachable Docker daemon no longer fails or delays startup.
+
+With --importtime the slowest modules of `python -X importtime` are listed.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Runs in the child interpreter; prints one RESULT line
+CHILD = """
+import asyncio, json, time
+started = time.perf_counter()
+from backend.main import app
+imported = time.perf_counter()
+
+async def lifespan():
+    async with app.router.lifespan_context(app):
+        ready = time.perf_counter()
+    return ready, time.perf_counter()
+
+ready, stopped = asyncio.run(lifespan())
+print("RESULT " + json.dumps({
+    "import_s": imported - started,
+    "startup_s": ready - imported,
+    "shutdown_s": stopped - ready,
+}), flush=True)
+"""
+
+
+def child_env(db_path: str) -> dict:
+    env = dict(os.environ)
+    env["INSTADOCK_DB_PATH"] = db_path
+    env.pop("INSTADOCK_DB_URL", None)
+    env["PUBSUB_BACKEND"] = "local"
+    env["DOCKER_HOST"] = "unix:///nonexistent/docker.sock"
+    env["PYTHONPATH"] = str(ROOT) + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def run_once(db_path: str) -> dict:
+    done = subprocess.run([sys.executable, "-c", CHILD], env=child_env(db_path), cwd=ROOT,
+                          capture_output=True, text=True, timeout=120)
+    for line in done.stdout.splitlines():
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    raise RuntimeError(f"startup failed (exit {done.returncode}):\n{done.stderr[-2000:]}")
+
+
+def import_profile(db_path: str, top: int):
+    """Slowest modules (self time) of one `import backend.main`."""
+    done = subprocess.run([sys.executable, "-X", "importtime", "-c", "import backend.main"],
+                          env=child_env(db_path), cwd=ROOT, capture_output=True, text=True, timeout=120)
+    modules = []
+    for line in done.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((int(self_us), int(cumulative_us), name.strip()))
+    modules.sort(reverse=True)
+    return [{"module": n, "self_ms": round(s / 1000, 1), "cumulative_ms": round(c / 1000, 1)}
+            for s, c, n in modules[:top]]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * q))] * 1000, 1) if values else None
+
+
+def summarise(runs):
+    out = {}
+    for key in ("import_s", "startup_s", "shutdown_s"):
+        values = [r[key] for r in runs]
+        name = key[:-2]
+        out[f"{name}_p50_ms"] = percentile(values, 0.50)
+        out[f"{name}_max_ms"] = round(max(values) * 1000, 1)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per case")
+    parser.add_argument("--importtime", type=int, default=0, metavar="N", help="list the N slowest modules")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="instadock_startup_bench_"))
+    results = {}
+    try:
+        fresh = [run_once(str(workdir / f"fresh-{i}.db")) for i in range(args.runs)]
+        warm_db = str(workdir / "warm.db")
+        run_once(warm_db)  # migrate it and create the admin
+        warm = [run_once(warm_db) for _ in range(args.runs)]
+        results["fresh"], results["warm"] = summarise(fresh), summarise(warm)
+        if args.importtime:
+            results["slowest_imports"] = import_profile(warm_db, args.importtime)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for case in ("fresh", "warm"):
+        r = results[case]
+        print(f"{case:>6}: import p50 {r['import_p50_ms']} ms (max {r['import_max_ms']})   "
+              f"startup p50 {r['startup_p50_ms']} ms (max {r['startup_max_ms']})   "
+              f"shutdown p50 {r['shutdown_p50_ms']} ms")
+    for m in results.get("slowest_imports", []):
+        print(f"  {m['self_ms']:>8} ms self  {m['cumulative_ms']:>8} ms cumulative  {m['module']}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({"args": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,8 @@ import { getToken } from '@/lib/auth';
 import { X, MessageSquare, Send } from 'lucide-react';
 import Link from 'next/link';
 
-// NOTE: This setup uses a simple broadcast mechanism. In a real chat, the backend 
-// would handle user lookup to allow direct admin-to-user messaging.
+// NOTE: Admins see every user's support room. Reply to a user with
+// "@<first 8 chars of their id> message"; plain text goes to the admins-only room.
 
 const getChatWebSocketUrl = () => {
     const token = getToken();
@@ -131,7 +131,7 @@ export default function AdminChatPage() {
                         type="text"
                         value={inputValue}
                         onChange={(e) => setInputValue(e.target.value)}
-                        placeholder="Type your message or 'ping'..."
+                        placeholder="@<user id> reply, staff-only message, or 'ping'..."
                         className="flex-1 p-3 bg-gray-100 dark:bg-[#2d2d3a] border border-gray-300 dark:border-gray-600 rounded-lg focus:outline-none focus:ring-2 focus:ring-[#b480ff] text-gray-800 dark:text-gray-100"
                         disabled={wsRef.current && wsRef.current.readyState !== WebSocket.OPEN}
                     />
@@ -3,7 +3,7 @@ import { useEffect, useState, useCallback } from "react";
 import { useRouter } from "next/navigation";
 import { getToken } from "@/lib/auth";
 import AdminPanel from "@/components/AdminPanel"; 
-import { getAllApprovedSubmissionsAdmin, getAllInstancesAdmin, getAdminStats, deleteInstance, stopInstance, startInstance, restartInstance } from "@/lib/api";
+import { getAllApprovedSubmissionsAdmin, getAllInstancesAdmin, getAdminStats, deleteInstance, stopInstance, startInstance, restartInstance, subscribeEvents } from "@/lib/api";
 import { formatDistanceToNow, isFuture, parseISO } from 'date-fns';
 // FIX: Added LayoutGrid and Terminal for the log button
 import { RefreshCw, Activity, StopCircle, PlayCircle, Trash2, Gauge, HardDrive, Cpu, LayoutGrid, Terminal } from 'lucide-react'; 
@@ -174,6 +174,9 @@ export default function AdminPage() {
         fetchAllAdminData();
     }, [fetchAllAdminData]);
 
+    // Refetch when any instance or submission changes
+    useEffect(() => subscribeEvents(() => fetchAllAdminData()), [fetchAllAdminData]);
+
     if (loading) return <p className="text-center text-gray-600 dark:text-gray-400 mt-10">Loading Admin Data...</p>;
     if (error && !error.includes("403")) return <p className="text-center text-red-600 dark:text-red-400 mt-10">Error: {error}</p>;
 
@@ -2,7 +2,7 @@
 import { useEffect, useState, useCallback } from "react";
 import { useRouter } from "next/navigation";
 import { getToken } from "@/lib/auth";
-import { getUserInstances, getApprovedSubmissions, spawnNewInstance } from "@/lib/api"; 
+import { getUserInstances, getApprovedSubmissions, spawnNewInstance, subscribeEvents } from "@/lib/api"; 
 import ContainerCard from "@/components/ContainerCard";
 import StatCard from "@/components/StatCard";
 import { Zap, LayoutGrid, AlertTriangle, StopCircle } from 'lucide-react';
@@ -19,7 +19,7 @@ function SubmissionSection({ submissions, refreshDashboard }) {
     try {
       const res = await spawnNewInstance(submission_id);
       setMsg(`Instance spawned! URL: ${res.url}. Check Your Active Instances below.`);
-      setTimeout(refreshDashboard, 1500); 
+      refreshDashboard(); // the instance row exists once /spawn returns
     } catch (e) {
       setMsg(`Error spawning: ${e.message}`);
     } finally {
@@ -111,6 +111,9 @@ export default function Dashboard() {
     fetchData();
   }, [fetchData]);
 
+  // Refetch when one of this user's instances or submissions changes
+  useEffect(() => subscribeEvents(() => fetchData()), [fetchData]);
+
 
   if (loading) return (
     <div className="min-h-screen flex items-center justify-center bg-gray-50 dark:bg-[#0a0a0f] text-gray-800 dark:text-gray-400">
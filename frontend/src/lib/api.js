@@ -40,6 +40,18 @@ export async function getApprovedSubmissions() {
   return apiFetch("/user/approved_submissions");
 }
 
+// Push feed of instance/submission changes (Server-Sent Events). EventSource
+// reconnects on its own and resumes after the last event it received.
+// Returns a function that closes the feed.
+export function subscribeEvents(onEvent) {
+  const token = getToken();
+  const source = new EventSource(`${API_BASE}/events?authorization=Bearer%20${token}`);
+  ["instance", "submission", "resync"].forEach((type) =>
+    source.addEventListener(type, (e) => onEvent(JSON.parse(e.data)))
+  );
+  return () => source.close();
+}
+
 // FIX: New REST endpoint for fetching logs (Replaces WebSocket)
 export async function fetchInstanceLogs(cid) {
     return apiFetch(`/logs/${cid}`);